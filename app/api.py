@@ -0,0 +1,342 @@
+"""
+Headless REST API for partner channels: the same graph, session store and OCR admission as the UI.
+
+  POST /v1/sessions                          -> {"session_id", status}
+  POST /v1/sessions/{sid}/messages           {"text"} -> new assistant messages + status
+  POST /v1/sessions/{sid}/documents          multipart, file parts named bike / income / id
+  POST /v1/sessions/{sid}/feedback           {"kind": "happy" | "unhappy"}
+  GET  /v1/sessions/{sid}/decision           -> status (docs, decision, approval)
+
+Replies carry only the assistant messages the call produced, never the whole chat. With ?stream=1
+the reply is NDJSON, one event per line: {"type": "queued", "position"} while waiting for an OCR
+slot, {"type": "field", "doc", "key", "value"} per OCR field as the model decodes it (NIDs masked),
+then {"type": "result", ...}, the body a non-streaming call returns.
+
+Multipart bodies are parsed as they arrive and file parts are written straight to
+API_UPLOAD_DIR/<session id> (no spooling, no in-memory copy); API_MAX_UPLOAD_MB caps the whole
+request body. Oversized images are then downscaled like UI uploads. A session's directory is
+deleted when the session store purges or evicts the session (directories of sessions that no
+longer exist are swept at startup). All documents of one request are checked in one docops run.
+
+Run (from repo root):  python -m app.api --workers 4 --port 8000
+More than one worker implies SESSION_STORE=sqlite. A session's requests run one at a time, across
+workers too (session store lease); one that cannot get the session in time is answered with a
+"try again" message.
+"""
+import argparse, asyncio, json, os, shutil, tempfile, threading, uuid, weakref
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Literal
+
+import anyio
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from dotenv import load_dotenv
+load_dotenv(override=True)  # before ttb_ride: its modules read their settings on import
+
+from ttb_ride.config import CACHE_DIR
+from ttb_ride.state import TState, new_state
+from ttb_ride.session_store import SESSION_BUSY_MSG, SessionConflict, get_session_store
+from ttb_ride.ocr.admission import OCROverloaded, RETRY_LATER_MSG
+from ttb_ride.ocr.client import ocr_progress
+from ttb_ride.upload_resize import shrink_upload
+from ttb_ride.utils.text import CONGRATS_MARKER, mask_nid, thai_id_checksum_ok
+from app.graph import get_graph, warm_up
+
+API_UPLOAD_DIR = os.getenv("API_UPLOAD_DIR", str(CACHE_DIR / "uploads"))
+API_MAX_UPLOAD_BYTES = int(float(os.getenv("API_MAX_UPLOAD_MB", "40")) * (1 << 20))
+API_CONCURRENCY = int(os.getenv("API_CONCURRENCY", "32"))  # graph runs in flight per worker
+
+DOC_KINDS = ("bike", "income", "id")
+UPLOAD_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".heic", ".bmp", ".tif", ".tiff", ".pdf"}
+
+STORE = get_session_store()
+_LIMITER = anyio.CapacityLimiter(API_CONCURRENCY)
+_LOCKS: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+class MessageIn(BaseModel):
+    text: str = Field(min_length=1, max_length=4000)
+
+class FeedbackIn(BaseModel):
+    kind: Literal["happy", "unhappy"]
+
+
+# ===== replies =====
+def _status(st: TState) -> dict:
+    docs = st["docs"]
+    return {
+        "uploads_requested": st["ui"]["show_uploads"],
+        "docs": {k: bool(docs[k].get("ok")) for k in DOC_KINDS},
+        "decision": {k: v for k, v in st.get("decision", {}).items() if k != "duplicate_docs"},
+        "approved": bool(st["flags"].get("approved_once")),
+        "feedback_requested": st["ui"]["show_satisfaction"],
+    }
+
+def _result(sid: str, st: TState, n_before: int) -> dict:
+    new = [text.replace(CONGRATS_MARKER, "").strip() for role, text in st["messages"][n_before:] if role == "assistant"]
+    return {"type": "result", "session_id": sid, "messages": new, **_status(st)}
+
+def _field_event(doc_type: str, key: str, value) -> dict:
+    ev = {"type": "field", "doc": doc_type, "key": key, "value": value}
+    if key == "National Identification Number":
+        ev.update(value=mask_nid(str(value)), checksum_valid=thai_id_checksum_ok(str(value)))
+    return ev
+
+async def _reply(events: AsyncIterator[dict], stream: bool):
+    if stream:
+        async def ndjson():
+            async for ev in events:
+                yield json.dumps(ev, ensure_ascii=False) + "\n"
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+    result = None
+    async for ev in events:
+        result = ev  # the last event is the result
+    return result
+
+
+# ===== one graph run per request =====
+def _session_lock(sid: str) -> asyncio.Lock:
+    lock = _LOCKS.get(sid)
+    if lock is None:
+        lock = _LOCKS[sid] = asyncio.Lock()
+    return lock
+
+def _require(sid: str) -> None:
+    if not STORE.exists(sid):
+        raise HTTPException(404, "unknown session")
+
+def _invoke(sid: str, state: TState) -> TState:
+    try:
+        return get_graph().invoke(state, config={"configurable": {"thread_id": sid}})
+    except OCROverloaded:
+        state["messages"].append(("assistant", RETRY_LATER_MSG))
+        return state
+
+async def _turn(sid: str, update: Callable[[TState], None]) -> AsyncIterator[dict]:
+    """Load the session, apply `update`, run the graph in a worker thread; yield progress events, then the result."""
+    async with _session_lock(sid):
+        loop, events, n_before = asyncio.get_running_loop(), asyncio.Queue(), [0]
+
+        def report(doc_type: str, key: str, value) -> None:
+            loop.call_soon_threadsafe(events.put_nowait, _field_event(doc_type, key, value))
+
+        def step(st: TState) -> TState:
+            n_before[0] = len(st["messages"])
+            update(st)
+            return _invoke(sid, st)
+
+        def work() -> TState:
+            with ocr_progress(report, queued=lambda position: loop.call_soon_threadsafe(
+                    events.put_nowait, {"type": "queued", "position": position})):
+                # saved here, so a client that disconnects mid-stream still gets its turn; a request of
+                # the same session on another worker waits for the session's lease
+                try:
+                    return STORE.update(sid, step)
+                except SessionConflict:
+                    st = STORE.load(sid)
+                    n_before[0] = len(st["messages"])
+                    st["messages"].append(("assistant", SESSION_BUSY_MSG))  # reply only, not saved
+                    return st
+
+        run = asyncio.ensure_future(anyio.to_thread.run_sync(work, limiter=_LIMITER))
+        while not run.done() or not events.empty():
+            get = asyncio.ensure_future(events.get())
+            done, _ = await asyncio.wait({get, run}, return_when=asyncio.FIRST_COMPLETED)
+            if get in done:
+                yield get.result()
+            else:
+                get.cancel()
+        yield _result(sid, run.result(), n_before[0])
+
+
+# ===== streamed multipart uploads =====
+class _TooLarge(Exception):
+    pass
+
+class _UploadSink:
+    """python-multipart callbacks: file parts named bike / income / id go straight into `directory`."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.paths: Dict[str, str] = {}
+        self._headers: Dict[bytes, bytes] = {}
+        self._field = self._value = b""
+        self._file = None
+
+    def callbacks(self) -> dict:
+        return {"on_part_begin": self._part_begin, "on_header_field": self._header_field,
+                "on_header_value": self._header_value, "on_header_end": self._header_end,
+                "on_headers_finished": self._headers_finished, "on_part_data": self._part_data,
+                "on_part_end": self._part_end}
+
+    def _part_begin(self) -> None:
+        self._headers = {}
+
+    def _header_field(self, data: bytes, start: int, end: int) -> None:
+        self._field += data[start:end]
+
+    def _header_value(self, data: bytes, start: int, end: int) -> None:
+        self._value += data[start:end]
+
+    def _header_end(self) -> None:
+        self._headers[self._field.lower()] = self._value
+        self._field = self._value = b""
+
+    def _headers_finished(self) -> None:
+        _, opts = parse_options_header(self._headers.get(b"content-disposition", b""))
+        kind = opts.get(b"name", b"").decode("latin-1")
+        if kind not in DOC_KINDS or b"filename" not in opts:
+            return  # other fields are ignored
+        suffix = os.path.splitext(opts[b"filename"].decode("utf-8", "replace"))[1].lower()
+        fd, path = tempfile.mkstemp(prefix=f"{kind}-", suffix=suffix if suffix in UPLOAD_SUFFIXES else "",
+                                    dir=self.directory)
+        if kind in self.paths:  # the same slot twice: the later part wins
+            os.remove(self.paths[kind])
+        self.paths[kind] = path
+        self._file = os.fdopen(fd, "wb")
+
+    def _part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._file is None:
+            return
+        # one network chunk into the page cache; cheaper than a thread hop per chunk
+        self._file.write(data[start:end])
+
+    def _part_end(self) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self) -> None:
+        self.close()
+        for path in self.paths.values():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.paths.clear()
+
+def _session_upload_dir(sid: str) -> str:
+    return os.path.join(API_UPLOAD_DIR, sid)
+
+def _delete_uploads(sids) -> None:
+    # session store purge/eviction: the session's documents go with it
+    for sid in sids:
+        shutil.rmtree(_session_upload_dir(sid), ignore_errors=True)
+
+STORE.on_purge(_delete_uploads)
+
+def _sweep_orphan_uploads() -> None:
+    try:
+        names = os.listdir(API_UPLOAD_DIR)
+    except FileNotFoundError:
+        return
+    _delete_uploads([n for n in names if os.path.isdir(_session_upload_dir(n)) and not STORE.exists(n)])
+
+async def _receive_documents(request: Request, sid: str) -> Dict[str, str]:
+    ctype, opts = parse_options_header(request.headers.get("content-type", ""))
+    if ctype != b"multipart/form-data" or b"boundary" not in opts:
+        raise HTTPException(415, "expected multipart/form-data")
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > API_MAX_UPLOAD_BYTES:
+        raise HTTPException(413, f"upload exceeds {API_MAX_UPLOAD_BYTES >> 20} MB")
+    directory = _session_upload_dir(sid)
+    os.makedirs(directory, exist_ok=True)
+    sink, received = _UploadSink(directory), 0
+    parser = MultipartParser(opts[b"boundary"], sink.callbacks())
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)  # every byte counts: part headers, form fields and boundaries too
+            if received > API_MAX_UPLOAD_BYTES:
+                raise _TooLarge()
+            parser.write(chunk)
+        parser.finalize()
+    except _TooLarge:
+        sink.discard()
+        raise HTTPException(413, f"upload exceeds {API_MAX_UPLOAD_BYTES >> 20} MB")
+    except BaseException:
+        sink.discard()
+        raise
+    sink.close()
+    if not sink.paths:
+        raise HTTPException(422, "no file part named bike, income or id")
+    return sink.paths
+
+
+# ===== app =====
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    threading.Thread(target=_sweep_orphan_uploads, name="upload-sweep", daemon=True).start()
+    yield
+
+app = FastAPI(title="TTB Ride API", version="1", lifespan=lifespan)
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"ok": True}
+
+@app.post("/v1/sessions", status_code=201)
+async def start_session():
+    sid, st = uuid.uuid4().hex, new_state()
+    await anyio.to_thread.run_sync(STORE.save, sid, st)
+    return {"session_id": sid, **_status(st)}
+
+@app.post("/v1/sessions/{sid}/messages")
+async def send_message(sid: str, body: MessageIn, stream: bool = False):
+    _require(sid)
+
+    def update(st: TState) -> None:
+        st["messages"].append(("user", body.text))
+        st["event"] = {"type": "user_message"}
+    return await _reply(_turn(sid, update), stream)
+
+@app.post("/v1/sessions/{sid}/documents")
+async def upload_documents(sid: str, request: Request, stream: bool = False):
+    _require(sid)
+    paths = await _receive_documents(request, sid)
+    for kind in list(paths):
+        paths[kind] = await anyio.to_thread.run_sync(shrink_upload, paths[kind], kind)
+
+    def update(st: TState) -> None:
+        for kind, path in paths.items():
+            st["docs"][kind]["path"] = path
+        st["event"] = {"type": "upload", "kinds": list(paths)}
+    return await _reply(_turn(sid, update), stream)
+
+@app.post("/v1/sessions/{sid}/feedback")
+async def send_feedback(sid: str, body: FeedbackIn, stream: bool = False):
+    _require(sid)
+
+    def update(st: TState) -> None:
+        st["event"] = {"type": "feedback", "kind": body.kind}
+    return await _reply(_turn(sid, update), stream)
+
+@app.get("/v1/sessions/{sid}/decision")
+async def get_decision(sid: str):
+    _require(sid)
+    st = await anyio.to_thread.run_sync(STORE.load, sid)
+    return {"session_id": sid, **_status(st)}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8000")))
+    ap.add_argument("--workers", type=int, default=int(os.getenv("API_WORKERS", "1")))
+    args = ap.parse_args()
+    if args.workers > 1:
+        os.environ["SESSION_STORE"] = "sqlite"  # workers share sessions through SQLite
+    uvicorn.run("app.api:app", host=args.host, port=args.port, workers=args.workers)
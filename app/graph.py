@@ -0,0 +1,63 @@
+"""
+The loan-flow graph and its engine, shared by the Gradio UI (app.main) and the REST API (app.api).
+
+LLM clients, the compiled graph and the graph image are created on first use; warm_up() does that
+in the background once the server is accepting connections.
+"""
+import threading
+
+from ttb_ride.state import TState, delta_node
+from ttb_ride.session_store import make_checkpointer
+from ttb_ride.agents import (
+    set_engine,
+    router_intent, general_chat, agent2_docops, agent3_appraisal, agent_feedback,
+    route_event, route_after_router, route_after_docops
+)
+from ttb_ride.llm.engine import TtbRideEngine
+
+
+def build_graph():
+    from langgraph.graph import StateGraph, END  # deferred: not needed until the first event
+    g = StateGraph(TState)
+    # nodes emit only new messages/debug lines (append-only channels, delta checkpoints)
+    g.add_node("router", delta_node(router_intent))
+    g.add_node("chat", delta_node(general_chat))
+    g.add_node("docops", delta_node(agent2_docops))
+    g.add_node("appraise", delta_node(agent3_appraisal))
+    g.add_node("feedback", delta_node(agent_feedback))
+    # one entry per event type: uploads skip the intent router, feedback skips everything else
+    g.set_conditional_entry_point(route_event, {"router": "router", "docops": "docops", "feedback": "feedback"})
+    g.add_conditional_edges("router", route_after_router, {"docops": "docops", "chat": "chat", "END": END})
+    g.add_conditional_edges("docops", route_after_docops, {"appraise": "appraise", "END": END})
+    g.add_edge("appraise", END)
+    g.add_edge("chat", END)
+    g.add_edge("feedback", END)
+
+    return g.compile(checkpointer=make_checkpointer())
+
+
+# ===== bootstrap (runs once per worker process) =====
+ENGINE = TtbRideEngine()     # setup() runs lazily on first LLM call
+set_engine(ENGINE)           # inject into agents module
+_GRAPH = None
+_GRAPH_LOCK = threading.Lock()
+
+def get_graph():
+    global _GRAPH
+    if _GRAPH is None:
+        with _GRAPH_LOCK:
+            if _GRAPH is None:
+                _GRAPH = build_graph()
+    return _GRAPH
+
+def warm_up():
+    try:
+        from ttb_ride.visualize import graph_image_path
+        from ttb_ride.semantic_cache import get_semantic_cache
+        ENGINE.ready()
+        cache = get_semantic_cache()
+        if cache is not None:
+            cache.ready()  # load the embedding model before the first chat message
+        graph_image_path(get_graph())  # render the orchestration graph once, offline
+    except Exception as e:
+        print(f"[warm_up] {type(e).__name__}: {e}", flush=True)
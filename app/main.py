@@ -1,51 +1,66 @@
+import os, queue, threading
 import gradio as gr
-from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
+
+from dotenv import load_dotenv
+load_dotenv(override=True)  # before ttb_ride: its modules read their settings on import
 
 from ttb_ride.config import COVER_IMAGE_PATH, CONGRATS_IMAGE_PATH, DEFAULT_BG_R, DEFAULT_BG_G, DEFAULT_BG_B
-from ttb_ride.state import TState, new_state
+from ttb_ride.state import TState
+from ttb_ride.session_store import SESSION_BUSY_MSG, SessionConflict, get_session_store
+from ttb_ride.ocr.admission import OCROverloaded, RETRY_LATER_MSG
+from ttb_ride.ocr.client import ocr_progress
+from ttb_ride.coalesce import COALESCER
+from ttb_ride.upload_resize import ELEM_IDS, client_resize_head, shrink_upload
 from ttb_ride.ui_theme import hero_css_base, bg_style_tag, layout_style_tag
 from ttb_ride.utils.images import path_from_gradio_file
 from ttb_ride.utils.debug import get_debug_text
-from ttb_ride.agents import (
-    set_engine,
-    router_intent, general_chat, agent2_docops, agent3_appraisal,
-    route_after_router, route_after_docops
-)
-from ttb_ride.llm.engine import TtbRideEngine
+from ttb_ride.llm.http_pool import pool_summary
+from app.graph import get_graph, warm_up
 from ttb_ride.utils.images import image_path_to_data_url
+from ttb_ride.utils.text import CONGRATS_MARKER, mask_nid, thai_id_checksum_ok
 
-from dotenv import load_dotenv
-load_dotenv(override=True)
 
+# ===== Gradio wiring helpers =====
+_CONGRATS_DATA_URL = None
 
-def build_graph():
-    g = StateGraph(TState)
-    g.add_node("router", router_intent)
-    g.add_node("chat", general_chat)
-    g.add_node("docops", agent2_docops)
-    g.add_node("appraise", agent3_appraisal)
-    g.set_entry_point("router")
-    g.add_conditional_edges("router", route_after_router, {"docops": "docops", "chat": "chat", "END": END})
-    g.add_conditional_edges("docops", route_after_docops, {"appraise": "appraise", "END": END})
-    g.add_edge("appraise", END)
-    g.add_edge("chat", END)
-
-    return g.compile(checkpointer=MemorySaver())
+def _expand_markers(text: str) -> str:
+    # the congrats image is stored in state as a short marker, inlined only when rendering
+    global _CONGRATS_DATA_URL
+    if not text or CONGRATS_MARKER not in text:
+        return text
+    if _CONGRATS_DATA_URL is None:
+        try:
+            _CONGRATS_DATA_URL = image_path_to_data_url(CONGRATS_IMAGE_PATH)
+        except Exception:
+            _CONGRATS_DATA_URL = ""
+    return text.replace(CONGRATS_MARKER, f"![congrats]({_CONGRATS_DATA_URL})" if _CONGRATS_DATA_URL else "")
 
 
-# ===== Gradio wiring helpers =====
 def render_chat(messages):
     convo, user_buf = [], None
     for role, text in messages:
         if role == "user":
             user_buf = text
         elif role == "assistant":
-            convo.append([user_buf, text])
+            convo.append([user_buf, _expand_markers(text)])
             user_buf = None
     return convo
 
 
+def _field_note(doc_type: str, key: str, value) -> str:
+    # one progress line per OCR field the model has finished decoding
+    if key == "National Identification Number":
+        ok = thai_id_checksum_ok(str(value))
+        return f"🪪 เลขบัตร {mask_nid(str(value))} " + ("✓" if ok else "✗ เลขไม่ถูกต้อง")
+    if key == "First and Last Name" and value:
+        return f"🪪 ชื่อ: {value}"
+    if key == "holder_name" and value:
+        return f"💰 ชื่อผู้รับเงิน: {value}"
+    if key == "monthly_income_thb" and isinstance(value, (int, float)):
+        return f"💰 รายได้ต่อเดือน: {int(value):,} บาท"
+    return ""
+
+
 def gr_update_visibility(state: TState):
     show_up = state["ui"]["show_uploads"]
     need = state["ui"]["need"]
@@ -67,12 +82,11 @@ def _clear_text():
     return ""
 
 
-def make_ui(compiled_graph):
-    from ttb_ride.agents import feedback_extra_system  # local import to avoid cycle
-    from ttb_ride.llm.engine import ENGINE  # already set by set_engine()
+def make_ui(get_graph):
+    from ttb_ride.visualize import GRAPH_IMAGE_FORMAT  # graph image itself is rendered on first use
 
     with gr.Blocks(title="TTB Ride — Agentic AI Motorcycle loans Demo",
-                   css=hero_css_base()) as demo:
+                   css=hero_css_base(), head=client_resize_head()) as demo:
 
         # background + layout CSS
         gr.HTML(bg_style_tag(DEFAULT_BG_R, DEFAULT_BG_G, DEFAULT_BG_B))
@@ -97,9 +111,9 @@ def make_ui(compiled_graph):
             with gr.Column(scale=1, min_width=320, elem_classes=["upload-pane", "card"]):
                 gr.Markdown("**Upload documents** (auto-appears when loan intent is detected)")
                 docs_status = gr.Markdown("Docs: Bike [⬜] | Income [⬜] | ID [⬜]")
-                up_bike   = gr.File(label="① รูปมอเตอร์ไซค์", file_types=["image"], type="filepath", visible=False)
-                up_income = gr.File(label="② เอกสารรายได้ (สลิปเงินเดือน)", file_types=["image"], type="filepath", visible=False)
-                up_id     = gr.File(label="③ บัตรประชาชน", file_types=["image"], type="filepath", visible=False)
+                up_bike   = gr.File(label="① รูปมอเตอร์ไซค์", file_types=["image"], type="filepath", visible=False, elem_id=ELEM_IDS["bike"])
+                up_income = gr.File(label="② เอกสารรายได้ (สลิปเงินเดือน)", file_types=["image", ".pdf"], type="filepath", visible=False, elem_id=ELEM_IDS["income"])
+                up_id     = gr.File(label="③ บัตรประชาชน", file_types=["image"], type="filepath", visible=False, elem_id=ELEM_IDS["id"])
                 with gr.Row():
                     btn_sat   = gr.Button("Happy", visible=False)
                     btn_unsat = gr.Button("Unhappy", visible=False)
@@ -109,107 +123,184 @@ def make_ui(compiled_graph):
                 debug_md = gr.Markdown("_(no debug logs yet)_")
 
                 with gr.Accordion("Orchestration Graph", open=False):
-                    graph_img = gr.Image(label="LangGraph graph", interactive=False)
+                    if GRAPH_IMAGE_FORMAT == "svg":
+                        graph_img = gr.HTML()
+                    else:
+                        graph_img = gr.Image(label="LangGraph graph", interactive=False, type="filepath")
                     btn_graph = gr.Button("Refresh graph")
 
         # ===== State =====
-        st = gr.State(new_state())
+        # Session state lives in the session store (not gr.State), keyed by Gradio's client-side
+        # session hash, so consecutive events of one session may be served by different workers.
+        store = get_session_store()
+
+        def _sid(request: gr.Request) -> str:
+            return request.session_hash
+
+        def _view(st: TState):
+            return render_chat(st["messages"]), *gr_update_visibility(st), get_debug_text(st, footer=pool_summary())
+
+        def _notice(st: TState, text: str):
+            # transient assistant note (queue position, OCR progress); not stored in the session
+            return render_chat(st["messages"] + [("assistant", text)]), *gr_update_visibility(st), get_debug_text(st, footer=pool_summary())
+
+        def _queued(st: TState, position: int):
+            return _notice(st, f"⏳ กำลังรอคิวตรวจเอกสาร (ลำดับที่ {position}) โปรดรอสักครู่...")
 
         # ===== Handlers =====
-        def _invoke(state: TState) -> TState:
-            return compiled_graph.invoke(state, config={"configurable": {"thread_id": "ttb-ride-session"}})
-
-        def on_user_submit(user_text, st: TState):
-            st["messages"].append(("user", user_text))
-            st = _invoke(st)
-            return render_chat(st["messages"]), *gr_update_visibility(st), get_debug_text(st), st
-
-        def on_upload_bike(file_payload, st: TState):
-            path = path_from_gradio_file(file_payload)
-            if path:
-                st["docs"]["bike"]["path"] = path
-            st = _invoke(st)
-            return render_chat(st["messages"]), *gr_update_visibility(st), get_debug_text(st), st
-
-        def on_upload_income(file_payload, st: TState):
-            path = path_from_gradio_file(file_payload)
-            if path:
-                st["docs"]["income"]["path"] = path
-            st = _invoke(st)
-            return render_chat(st["messages"]), *gr_update_visibility(st), get_debug_text(st), st
-
-        def on_upload_id(file_payload, st: TState):
-            path = path_from_gradio_file(file_payload)
-            if path:
-                st["docs"]["id"]["path"] = path
-            st = _invoke(st)
-            return render_chat(st["messages"]), *gr_update_visibility(st), get_debug_text(st), st
-
-        def on_satisfied(st: TState):
-            extra = feedback_extra_system(st, kind="happy")
-            text = ENGINE.contextual_chat(st, extra_system=extra)
+        def _invoke(sid: str, state: TState) -> TState:
             try:
-                data_url = image_path_to_data_url(CONGRATS_IMAGE_PATH)
-                text += "\n\n" + f"![congrats]({data_url})"
-            except Exception:
-                pass
-            st["messages"].append(("assistant", text))
-            st["ui"]["show_satisfaction"] = False
-            st["flags"]["last_feedback"] = "happy"
-            st["flags"]["reapply_ready"] = False
-            return render_chat(st["messages"]), *gr_update_visibility(st), get_debug_text(st), st
-
-        def on_unsatisfied(st: TState):
-            extra = feedback_extra_system(st, kind="unhappy")
-            text = ENGINE.contextual_chat(st, extra_system=extra)
-            st["messages"].append(("assistant", text))
-            st["ui"]["show_satisfaction"] = False
-            st["flags"]["last_feedback"] = "unhappy"
-            st["flags"]["reapply_ready"] = True
-            return render_chat(st["messages"]), *gr_update_visibility(st), get_debug_text(st), st
+                return get_graph().invoke(state, config={"configurable": {"thread_id": sid}})
+            except OCROverloaded:
+                state["messages"].append(("assistant", RETRY_LATER_MSG))
+                return state
+
+        def _invoke_with_progress(st: TState, run):
+            """Run `run()` (a graph invocation) in a worker thread; yield a view per OCR field read, return its state."""
+            notes, box, done = queue.Queue(), {}, object()
+
+            def work():
+                try:
+                    with ocr_progress(lambda doc, key, value: notes.put(_field_note(doc, key, value)),
+                                      queued=notes.put):  # queue position (int)
+                        box["st"] = run()
+                except BaseException as e:
+                    box["err"] = e
+                finally:
+                    notes.put(done)
+
+            threading.Thread(target=work, name="graph-run", daemon=True).start()
+            lines = []
+            for note in iter(notes.get, done):
+                if isinstance(note, int):
+                    yield _queued(st, note)
+                elif note:
+                    lines.append(note)
+                    yield _notice(st, "🔎 กำลังอ่านเอกสาร...\n" + "\n".join(lines))
+            if "err" in box:
+                raise box["err"]
+            return box["st"]
+
+        def on_user_submit(user_text, request: gr.Request):
+            sid = _sid(request)
+
+            def step(st: TState) -> TState:
+                st["messages"].append(("user", user_text))
+                st["event"] = {"type": "user_message"}
+                return _invoke(sid, st)
+            # waits for the session's other events (e.g. an upload still being checked)
+            try:
+                return _view(store.update(sid, step))
+            except SessionConflict:
+                return _notice(store.load(sid), SESSION_BUSY_MSG)
+
+        def _on_upload(kind: str, file_payload, request: gr.Request):
+            sid = _sid(request)
+            # normally already downscaled in the browser; oversized files are shrunk here
+            path = shrink_upload(path_from_gradio_file(file_payload), kind)
+            if not path:  # cleared file box: nothing to check
+                yield _view(store.load(sid))
+                return
+            # uploads of one session within a short window share a single docops run
+            batch, leader = COALESCER.add(sid, kind, path)
+            if not leader:
+                batch.wait()
+                yield _view(store.load(sid))
+                return
+            with COALESCER.running(batch) as paths:
+                def step(st: TState) -> TState:
+                    for k, p in paths.items():
+                        st["docs"][k]["path"] = p
+                    st["event"] = {"type": "upload", "kinds": list(paths)}
+                    return _invoke(sid, st)
+
+                def run():
+                    with COALESCER.checking(batch):
+                        return store.update(sid, step)  # saved before the session's next batch loads it
+                # fields stream in while the GPU OCR decodes (checksum shown before the call ends);
+                # an OCR call waiting for a GPU slot shows its queue position instead
+                try:
+                    st = yield from _invoke_with_progress(store.load(sid), run)
+                except SessionConflict:
+                    yield _notice(store.load(sid), SESSION_BUSY_MSG)
+                    return
+            yield _view(st)
+
+        def on_upload_bike(file_payload, request: gr.Request):
+            yield from _on_upload("bike", file_payload, request)
+
+        def on_upload_income(file_payload, request: gr.Request):
+            yield from _on_upload("income", file_payload, request)
+
+        def on_upload_id(file_payload, request: gr.Request):
+            yield from _on_upload("id", file_payload, request)
+
+        def _on_feedback(kind: str, request: gr.Request):
+            sid = _sid(request)
+
+            def step(st: TState) -> TState:
+                st["event"] = {"type": "feedback", "kind": kind}
+                return _invoke(sid, st)
+            try:
+                return _view(store.update(sid, step))
+            except SessionConflict:
+                return _notice(store.load(sid), SESSION_BUSY_MSG)
+
+        def on_satisfied(request: gr.Request):
+            return _on_feedback("happy", request)
+
+        def on_unsatisfied(request: gr.Request):
+            return _on_feedback("unhappy", request)
 
         def on_graph_refresh():
-            # render to PIL and return; show a friendly fallback image if rendering not available
+            # pre-rendered offline at startup and cached on disk by graph-structure hash
+            from ttb_ride.visualize import graph_image_path
             try:
-                from ttb_ride.visualize import graph_png
-                return graph_png(compiled_graph)
+                path = graph_image_path(get_graph())
             except Exception as e:
+                if GRAPH_IMAGE_FORMAT == "svg":
+                    return f"<p>Graph rendering not available: {e}</p>"
                 from PIL import Image, ImageDraw
                 img = Image.new("RGB", (980, 260), (255, 255, 255))
                 d = ImageDraw.Draw(img)
                 d.text(
                     (16, 16),
                     "Graph rendering not available.\n"
-                    "Try: pip install 'langgraph[all]'  (or install Graphviz)\n"
+                    "Install Graphviz (dot) or mermaid-cli (mmdc), or check TTB_CACHE_DIR is writable.\n"
                     f"Error: {e}",
                     fill=(0, 0, 0),
                 )
                 return img
+            if GRAPH_IMAGE_FORMAT == "svg":
+                with open(path, "r", encoding="utf-8") as f:
+                    return f.read()
+            return path
 
 
         # Wire events
         user_in.submit(on_user_submit,
-                       inputs=[user_in, st],
-                       outputs=[chat, up_bike, up_income, up_id, btn_sat, btn_unsat, docs_status, debug_md, st]
+                       inputs=[user_in],
+                       outputs=[chat, up_bike, up_income, up_id, btn_sat, btn_unsat, docs_status, debug_md]
                        ).then(_clear_text, None, [user_in])
 
-        up_bike.change(on_upload_bike,     inputs=[up_bike,   st], outputs=[chat, up_bike, up_income, up_id, btn_sat, btn_unsat, docs_status, debug_md, st])
-        up_income.change(on_upload_income, inputs=[up_income, st], outputs=[chat, up_bike, up_income, up_id, btn_sat, btn_unsat, docs_status, debug_md, st])
-        up_id.change(on_upload_id,         inputs=[up_id,     st], outputs=[chat, up_bike, up_income, up_id, btn_sat, btn_unsat, docs_status, debug_md, st])
+        up_bike.change(on_upload_bike,     inputs=[up_bike],   outputs=[chat, up_bike, up_income, up_id, btn_sat, btn_unsat, docs_status, debug_md])
+        up_income.change(on_upload_income, inputs=[up_income], outputs=[chat, up_bike, up_income, up_id, btn_sat, btn_unsat, docs_status, debug_md])
+        up_id.change(on_upload_id,         inputs=[up_id],     outputs=[chat, up_bike, up_income, up_id, btn_sat, btn_unsat, docs_status, debug_md])
 
-        btn_sat.click(   on_satisfied,  inputs=[st], outputs=[chat, up_bike, up_income, up_id, btn_sat, btn_unsat, docs_status, debug_md, st])
-        btn_unsat.click( on_unsatisfied, inputs=[st], outputs=[chat, up_bike, up_income, up_id, btn_sat, btn_unsat, docs_status, debug_md, st])
+        btn_sat.click(   on_satisfied,   inputs=None, outputs=[chat, up_bike, up_income, up_id, btn_sat, btn_unsat, docs_status, debug_md])
+        btn_unsat.click( on_unsatisfied, inputs=None, outputs=[chat, up_bike, up_income, up_id, btn_sat, btn_unsat, docs_status, debug_md])
         btn_graph.click(on_graph_refresh, inputs=None, outputs=[graph_img])
 
 
     return demo
 
 
-# ===== bootstrap =====
-ENGINE = TtbRideEngine().setup()
-set_engine(ENGINE)           # inject into agents module
-GRAPH = build_graph()
-demo = make_ui(GRAPH)
+# ===== bootstrap (runs once per worker process) =====
+# Only the UI is built at import; the engine, graph and warm-up live in app.graph (shared with app.api).
+demo = make_ui(get_graph)
 
 if __name__ == "__main__":
-    demo.launch(server_port=7862, show_error=True)
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    # Gradio runs 1 event per listener at a time by default; OCR is bounded by ttb_ride.ocr.admission instead
+    demo.queue(default_concurrency_limit=int(os.getenv("APP_CONCURRENCY", "32")))
+    demo.launch(server_name=os.getenv("HOST", "127.0.0.1"), server_port=int(os.getenv("PORT", "7862")), show_error=True)
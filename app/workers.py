@@ -0,0 +1,45 @@
+"""
+Run N app workers (one process each) sharing session state through SQLite.
+
+Usage (from repo root):
+  python -m app.workers --workers 4 --base-port 7870
+
+Put any HTTP load balancer in front of ports base..base+N-1. Each Gradio event (its POST and
+the SSE stream that follows) must stay on one worker, so use sticky/ip-hash routing; between
+events a session can move freely because its state is in SESSION_DB_PATH. Workers share the
+host's GRADIO_TEMP_DIR, so uploaded files are visible to all of them.
+"""
+import argparse, os, signal, subprocess, sys, time
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", type=int, default=int(os.getenv("APP_WORKERS", "2")))
+    ap.add_argument("--base-port", type=int, default=int(os.getenv("APP_BASE_PORT", "7870")))
+    ap.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    args = ap.parse_args()
+
+    env = dict(os.environ, SESSION_STORE="sqlite", HOST=args.host)
+    procs = []
+    for i in range(args.workers):
+        port = args.base_port + i
+        procs.append(subprocess.Popen([sys.executable, "-m", "app.main"], env=dict(env, PORT=str(port))))
+        print(f"[workers] worker {i} pid={procs[-1].pid} http://{args.host}:{port}", flush=True)
+
+    def _stop(*_):
+        for p in procs:
+            if p.poll() is None:
+                p.terminate()
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    try:
+        while any(p.poll() is None for p in procs):
+            time.sleep(1.0)
+    finally:
+        _stop()
+    return max((p.returncode or 0) for p in procs)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
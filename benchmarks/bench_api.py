@@ -0,0 +1,206 @@
+"""
+Load test for the REST API (app.api) against stub backends: no OpenAI, no Modal.
+
+The stubs stand in for the LLM engine (intent, chat, bike check, appraisal: fixed answers after
+BENCH_LLM_MS) and for OCR (a valid ID card / payslip after BENCH_OCR_MS, still going through the
+real OCR admission control). Everything between HTTP and those calls is the real service: multipart
+streaming to disk, server-side downscaling, session store, graph, checkpointer, dedupe index.
+
+Each virtual applicant runs the whole flow: start session -> loan message -> all three documents
+in one streamed multipart upload (NDJSON events) -> decision. Documents differ per flow, so the
+dedupe cache does not short-circuit OCR. Reports flows/s, approvals, errors, p50/p95 per step.
+
+Usage (from repo root):
+  python -m benchmarks.bench_api --users 32 --flows 256                   # in-process server (shares the GIL)
+  python -m benchmarks.bench_api --serve --workers 4 --port 8010          # stubbed multi-worker server
+  python -m benchmarks.bench_api --url http://127.0.0.1:8010 --users 64 --flows 1024
+"""
+import os, tempfile
+
+# before ttb_ride is imported: throwaway caches, no embedding model
+os.environ.setdefault("TTB_CACHE_DIR", tempfile.mkdtemp(prefix="bench-api-"))
+os.environ.setdefault("SEMCACHE", "off")
+os.environ.setdefault("DEDUPE_OWNER_SECRET", os.urandom(16).hex())
+
+import argparse, asyncio, io, json, random, socket, threading, time
+
+import numpy as np
+from PIL import Image
+
+OCR_S = float(os.getenv("BENCH_OCR_MS", "800")) / 1000.0
+LLM_S = float(os.getenv("BENCH_LLM_MS", "300")) / 1000.0
+NAME = "สมชาย ใจดี"
+
+
+def _nid(i: int) -> str:
+    head = f"1{i % 10 ** 11:011d}"
+    check = (11 - sum(int(head[k]) * (13 - k) for k in range(12)) % 11) % 10
+    return head + str(check)
+
+
+class StubEngine:
+    """TtbRideEngine's interface with canned answers after a fixed delay."""
+
+    def ready(self):
+        return self
+
+    def intent_gate(self, user_text: str):
+        from ttb_ride.schemas import IntentOut
+        time.sleep(LLM_S)
+        return IntentOut(motorcycle_loan_intent="กู้" in user_text, confidence=0.95, rationale="stub")
+
+    def vlm_is_motorcycle_from_path(self, path: str, log=None):
+        from ttb_ride.schemas import IsMotorcycleOut
+        time.sleep(LLM_S)
+        return IsMotorcycleOut(is_motorcycle=True, confidence=0.9, rationale="stub")
+
+    def vlm_appraise_from_path(self, path: str, log=None):
+        from ttb_ride.schemas import AppraisalOut
+        time.sleep(LLM_S)
+        return AppraisalOut(appraised_value_thb=45_000, confidence=0.8, notes="stub")
+
+    def contextual_chat(self, state: dict, extra_system: str = "") -> str:
+        time.sleep(LLM_S)
+        return "stub reply"
+
+
+def _stub_ocr_id(path: str) -> dict:
+    from ttb_ride.ocr.admission import ADMISSION
+    with ADMISSION.slot():
+        time.sleep(OCR_S)
+    parsed = {"National Identification Number": _nid(random.randrange(10 ** 11)), "First and Last Name": NAME}
+    return {"parsed": parsed, "engine": "stub"}
+
+
+def _stub_ocr_income(path: str) -> dict:
+    from ttb_ride.ocr.admission import ADMISSION
+    with ADMISSION.slot():
+        time.sleep(OCR_S)
+    parsed = {"holder_name": NAME, "monthly_income_thb": 30_000, "employer": "", "period": ""}
+    return {"parsed": parsed, "normalized": dict(parsed), "raw": "", "engine": "stub"}
+
+
+def stub_app():
+    """app.api.app with the stub engine and OCR installed (uvicorn factory)."""
+    from ttb_ride import agents
+    from app import graph
+    from app.api import app as api
+
+    graph.ENGINE = StubEngine()
+    agents.set_engine(graph.ENGINE)
+    agents.ocr_id_extract_path = _stub_ocr_id
+    agents.ocr_income_extract_path = _stub_ocr_income
+    return api
+
+
+# ===== client =====
+def _doc(seed: int, size=(1200, 900)) -> bytes:
+    # coarse random structure upscaled: a distinct perceptual hash per document, photo-like size
+    rng = np.random.default_rng(seed)
+    img = Image.fromarray(rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)).resize(size, Image.BILINEAR)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def _pct(xs, q):
+    xs = sorted(xs)
+    return xs[int(q * (len(xs) - 1))] if xs else 0.0
+
+
+async def _flow(client, i: int, lat: dict) -> bool:
+    files = await asyncio.to_thread(lambda: {k: (f"{k}.jpg", _doc(3 * i + n), "image/jpeg")
+                                             for n, k in enumerate(("bike", "income", "id"))})
+    t = time.perf_counter()
+    r = await client.post("/v1/sessions")
+    r.raise_for_status()
+    sid = r.json()["session_id"]
+    lat["start"].append(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    r = await client.post(f"/v1/sessions/{sid}/messages", json={"text": "อยากกู้ซื้อมอเตอร์ไซค์"})
+    r.raise_for_status()
+    lat["message"].append(time.perf_counter() - t)
+
+    t, first, result = time.perf_counter(), None, None
+    async with client.stream("POST", f"/v1/sessions/{sid}/documents", params={"stream": 1}, files=files) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if not line:
+                continue
+            if first is None:
+                first = time.perf_counter() - t
+            result = json.loads(line)
+    lat["upload_first_event"].append(first or 0.0)
+    lat["upload"].append(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    r = await client.get(f"/v1/sessions/{sid}/decision")
+    r.raise_for_status()
+    lat["decision"].append(time.perf_counter() - t)
+    return bool(result and result.get("type") == "result" and r.json()["approved"])
+
+
+async def run_load(url: str, users: int, flows: int) -> None:
+    import httpx
+
+    lat = {k: [] for k in ("start", "message", "upload_first_event", "upload", "decision")}
+    counter, approved, errors = iter(range(flows)), [0], []
+
+    async def user(client):
+        for i in counter:
+            try:
+                approved[0] += await _flow(client, i, lat)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=url, timeout=300, limits=limits) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(user(client) for _ in range(users)))
+        dt = time.perf_counter() - t0
+    print(f"{flows} flows, {users} users: {flows / dt:6.1f} flows/s  approved {approved[0]}  errors {len(errors)}")
+    for step, xs in lat.items():
+        print(f"  {step:>18}: p50 {_pct(xs, 0.5) * 1000:7.0f} ms   p95 {_pct(xs, 0.95) * 1000:7.0f} ms")
+    for e in errors[:5]:
+        print(f"  error: {e}")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", help="load an already running API instead of an in-process one")
+    ap.add_argument("--serve", action="store_true", help="only run the stubbed API server")
+    ap.add_argument("--port", type=int, default=8010)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--users", type=int, default=32)
+    ap.add_argument("--flows", type=int, default=256)
+    args = ap.parse_args()
+    print(f"stubs: LLM {LLM_S * 1000:.0f} ms, OCR {OCR_S * 1000:.0f} ms (BENCH_LLM_MS / BENCH_OCR_MS)")
+
+    import uvicorn
+
+    if args.serve:
+        if args.workers > 1:
+            os.environ["SESSION_STORE"] = "sqlite"
+        uvicorn.run("benchmarks.bench_api:stub_app", factory=True, host="127.0.0.1", port=args.port,
+                    workers=args.workers, log_level="warning")
+    elif args.url:
+        asyncio.run(run_load(args.url, args.users, args.flows))
+    else:
+        port = _free_port()
+        server = uvicorn.Server(uvicorn.Config(stub_app(), host="127.0.0.1", port=port, log_level="warning"))
+        th = threading.Thread(target=server.run, daemon=True)
+        th.start()
+        while not server.started:
+            time.sleep(0.05)
+        try:
+            asyncio.run(run_load(f"http://127.0.0.1:{port}", args.users, args.flows))
+        finally:
+            server.should_exit = True
+            th.join()
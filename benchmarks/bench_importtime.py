@@ -0,0 +1,77 @@
+"""
+Start-up import profile (python -X importtime) for the app's modules.
+
+Each module is imported in a fresh interpreter; the report lists its total import time and the
+heaviest imports under it (cumulative), so eager imports that creep back in show up here.
+
+Usage (from repo root):
+  python -m benchmarks.bench_importtime                      # default module set
+  python -m benchmarks.bench_importtime app.main --top 25    # full app (needs gradio etc.)
+  python -m benchmarks.bench_importtime --out importtime.txt
+"""
+import argparse, os, subprocess, sys
+from typing import List, Tuple
+
+DEFAULT_MODULES = [
+    "ttb_ride.agents",          # graph nodes (pulls OCR client, dedupe, text utils)
+    "ttb_ride.llm.engine",      # LLM engine (langchain_openai deferred to first use)
+    "ttb_ride.ocr.client",      # OCR wrappers (modal deferred to first OCR call)
+    "ttb_ride.session_store",
+    "ttb_ride.visualize",
+]
+# must NOT be imported by the modules above; listed in the report if they are
+DEFERRED = ("modal", "langchain_openai", "langgraph", "openai", "torch")
+
+
+def profile(module: str) -> Tuple[float, List[Tuple[float, int, str]], str]:
+    """(total ms, [(cumulative ms, depth, name)], error)"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")])))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, env=env)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2  # one space, then two per nesting level
+        rows.append((int(cum_us) / 1000.0, depth, name.strip()))
+    err = "" if proc.returncode == 0 else proc.stderr.strip().splitlines()[-1]
+    # children are printed before their parent: keep only the subtree ending at `module`
+    # (drops interpreter start-up such as `site`)
+    subtree, current = [], []
+    for row in rows:
+        current.append(row)
+        if row[1] == 0:
+            if row[2] == module:
+                subtree = current
+            current = []
+    subtree = subtree or rows
+    total = subtree[-1][0] if subtree and subtree[-1][2] == module else sum(ms for ms, d, _ in subtree if d == 0)
+    return total, subtree, err
+
+
+def report(modules: List[str], top: int) -> str:
+    out = []
+    for mod in modules:
+        total, rows, err = profile(mod)
+        out.append(f"== {mod}: {total:.1f} ms" + (f"  [FAILED: {err}]" if err else ""))
+        loaded = {n.split(".")[0] for _, _, n in rows}
+        leaked = [m for m in DEFERRED if m in loaded]
+        if leaked:
+            out.append(f"   eager heavy imports: {', '.join(leaked)}")
+        for ms, depth, name in sorted(rows, reverse=True)[:top]:
+            out.append(f"   {ms:9.1f} ms  {'  ' * min(depth, 6)}{name}")
+    return "\n".join(out)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    ap.add_argument("--top", type=int, default=12)
+    ap.add_argument("--out", help="also write the report to this file")
+    args = ap.parse_args()
+    text = report(args.modules, args.top)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
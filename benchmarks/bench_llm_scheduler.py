@@ -0,0 +1,112 @@
+"""
+LLM scheduler vs. unscheduled calls against a simulated rate-limited endpoint.
+
+The fake endpoint enforces an RPM/TPM quota with token buckets (like OpenAI's) and answers
+429 when either runs dry; a call takes --latency seconds. "unscheduled" mimics the SDK default:
+every worker fires immediately, 429s retried twice with exponential backoff, then fail.
+"scheduled" routes the same workers through ttb_ride.llm.scheduler. Reports completed calls/s,
+failures, 429s seen and p95 latency of interactive vs. background calls (the priority lane). Both sides start
+with empty buckets, i.e. the run measures steady state at the quota ceiling, not the initial burst.
+
+Usage (from repo root):
+  python -m benchmarks.bench_llm_scheduler --rpm 1200 --tpm 400000 --workers 48 --seconds 8
+"""
+import argparse, random, threading, time
+
+from ttb_ride.llm import scheduler as S
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__("429")
+        self.response = type("Resp", (), {"headers": {"retry-after-ms": str(int(retry_after * 1000))}})()
+
+
+class FakeEndpoint:
+    def __init__(self, rpm: int, tpm: int, latency: float):
+        self.req, self.tok = S._Bucket(rpm), S._Bucket(tpm)
+        self.req.level = self.tok.level = 0.0
+        self.latency, self.lock = latency, threading.Lock()
+        self.ok = self.throttled = self.served_tokens = 0
+
+    def call(self, tokens: int) -> int:
+        with self.lock:
+            now = time.monotonic()
+            self.req.refill(now)
+            self.tok.refill(now)
+            if self.req.level < 1 or self.tok.level < tokens:
+                self.throttled += 1
+                raise RateLimitError(max(self.req.wait_for(1), self.tok.wait_for(tokens)))
+            self.req.level -= 1
+            self.tok.level -= tokens
+        time.sleep(self.latency)
+        with self.lock:
+            self.ok += 1
+            self.served_tokens += tokens
+        return tokens
+
+
+def _worker(run_one, stop_at, rng, lat, fails):
+    while time.monotonic() < stop_at:
+        tokens = rng.randint(300, 1500)  # prompt + image + output
+        interactive = rng.random() < 0.3
+        t0 = time.monotonic()
+        try:
+            run_one(tokens, interactive)
+        except RateLimitError:
+            fails.append(1)
+        lat[interactive].append(time.monotonic() - t0)
+
+
+def _p95(xs):
+    xs = sorted(xs)
+    return xs[int(0.95 * (len(xs) - 1))] if xs else 0.0
+
+
+def bench(mode: str, args) -> None:
+    ep = FakeEndpoint(args.rpm, args.tpm, args.latency)
+    if mode == "scheduled":
+        sch = S.LLMScheduler({"m": (args.rpm, args.tpm)})
+        lim = sch.limiter("m")
+        lim.requests.level = lim.tokens.level = 0.0
+
+        def run_one(tokens, interactive):
+            sch.run("m", tokens, lambda: (None, ep.call(tokens)), S.INTERACTIVE if interactive else S.BACKGROUND)
+    else:
+        def run_one(tokens, interactive):
+            for attempt in range(3):
+                try:
+                    return ep.call(tokens)
+                except RateLimitError:
+                    if attempt == 2:
+                        raise
+                    time.sleep(min(8.0, 0.5 * 2 ** attempt) * (0.75 + random.random() / 2))
+
+    lat, fails = {True: [], False: []}, []
+    stop_at = time.monotonic() + args.seconds
+    threads = [threading.Thread(target=_worker, args=(run_one, stop_at, random.Random(i), lat, fails))
+               for i in range(args.workers)]
+    t0 = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    dt = time.monotonic() - t0
+    print(f"{mode:>11}: {ep.ok / dt:6.1f} calls/s  {ep.served_tokens / dt * 60 / args.tpm:4.0%} of TPM  "
+          f"failed {len(fails):5d}  429s {ep.throttled:6d}  "
+          f"p95 interactive {_p95(lat[True]):5.2f} s / background {_p95(lat[False]):5.2f} s")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rpm", type=int, default=1200)
+    ap.add_argument("--tpm", type=int, default=400_000)
+    ap.add_argument("--workers", type=int, default=48)
+    ap.add_argument("--seconds", type=float, default=8.0)
+    ap.add_argument("--latency", type=float, default=0.2)
+    args = ap.parse_args()
+    print(f"quota: {args.rpm} RPM, {args.tpm} TPM (~{args.tpm / 60 / 900:.1f} calls/s at the 900-token average)")
+    for mode in ("unscheduled", "scheduled"):
+        bench(mode, args)
@@ -0,0 +1,137 @@
+"""
+OCR output parsing: ttb_ride.ocr.parsing vs. the previous service helpers.
+
+Counts how often each recovers the JSON object from noisy model output and picks the salary out
+of payslip text with distractors, then times both. The properties themselves are checked by
+tests/test_parsing.py.
+
+Usage (from repo root):
+  python -m benchmarks.bench_parsing --n 2000
+"""
+import argparse, json, random, re, time
+
+from ttb_ride.ocr.parsing import extract_json, best_amount
+
+# ---- previous implementation (olmocr_service_ttb_ride.py before the move) ----
+_LEGACY_FENCE = re.compile(r"\{[\s\S]*\}")
+_legacy_amount = re.compile(r"([0-9๐-๙][0-9,๐-๙\.]*)\s*(?:THB|บาท|฿)?", re.IGNORECASE)
+_TH = str.maketrans("๐๑๒๓๔๕๖๗๘๙", "0123456789")
+
+def legacy_extract_json(text):
+    text = (text or "").strip()
+    try:
+        return json.loads(text)
+    except Exception:
+        pass
+    m = _LEGACY_FENCE.search(text)
+    if not m:
+        return None
+    try:
+        return json.loads(m.group(0))
+    except Exception:
+        return None
+
+def legacy_first_amount(text):
+    for m in _legacy_amount.finditer(text or ""):
+        try:
+            v = int(float(m.group(1).translate(_TH).replace(",", "")))
+        except ValueError:
+            continue
+        if v > 0:
+            return v
+    return None
+
+
+# ---- generators ----
+WORDS = ["ข้อมูล", "ผลลัพธ์", "result", "note", "ok", "ตามเอกสาร", "{", "}", "\"", "json", "```"]
+
+def _rand_str(rng):
+    return "".join(rng.choice(['a', 'ก', ' ', '{', '}', '"', '\\', ':', ',', '1']) for _ in range(rng.randint(0, 12)))
+
+def _rand_obj(rng, depth=0):
+    obj = {}
+    for i in range(rng.randint(1, 4)):
+        r = rng.random()
+        if r < 0.4:
+            obj[f"k{i}"] = _rand_str(rng)
+        elif r < 0.7:
+            obj[f"k{i}"] = rng.randint(-10**6, 10**6)
+        elif depth < 3:
+            obj[f"k{i}"] = _rand_obj(rng, depth + 1)
+        else:
+            obj[f"k{i}"] = [1, "x}", None]
+    return obj
+
+def _noise(rng, n):
+    # prose without braces/quotes, so the embedded object is the first balanced one
+    return " ".join(rng.choice(WORDS[:6]) for _ in range(n))
+
+def _thai(s):
+    return s.translate(str.maketrans("0123456789", "๐๑๒๓๔๕๖๗๘๙"))
+
+def _payslip(rng):
+    amount = rng.randrange(8_000, 300_000, 50)
+    fmt = f"{amount:,}.00" if rng.random() < 0.7 else str(amount)
+    if rng.random() < 0.3:
+        fmt = _thai(fmt)
+    kw = rng.choice(["เงินเดือน", "รายได้สุทธิ", "Net pay", "Salary"])
+    lines = [
+        "บริษัท ตัวอย่าง จำกัด",
+        f"โทร 02{rng.randint(1000000, 9999999)}",
+        f"งวดเดือน {rng.randint(1, 12)}/{rng.choice([2566, 2567, 2024])}",
+        f"รหัสพนักงาน {rng.randint(1000, 99999)}",
+        f"{kw} {fmt} บาท" if rng.random() < 0.8 else f"{kw}\n{fmt}",
+        f"หักภาษี {rng.randint(100, 5000):,}.00",
+        f"ประกันสังคม {rng.choice([750, 875])}.00",
+    ]
+    head, tail = lines[:4], lines[5:]
+    rng.shuffle(head)
+    return "\n".join(head + [lines[4]] + tail), amount
+
+
+def _timed(fn, items, reps):
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        for x in items:
+            fn(x)
+    return (time.perf_counter() - t0) / (reps * len(items)) * 1e6
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=2000)
+    ap.add_argument("--seed", type=int, default=11)
+    args = ap.parse_args()
+    rng = random.Random(args.seed)
+
+    # an object embedded in noisy output, recovered exactly?
+    docs = []
+    for _ in range(args.n):
+        obj = _rand_obj(rng)
+        s = json.dumps(obj, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 2]))
+        wrap = rng.choice(["{}", "```json\n{}\n```", "{} ", "ผลลัพธ์: {} ตามเอกสาร"])
+        doc = _noise(rng, rng.randint(0, 30)) + wrap.format(s) + _noise(rng, rng.randint(0, 30))
+        if rng.random() < 0.3:
+            doc += " trailing {note} " + _noise(rng, 5)  # breaks the greedy first-{ to last-} match
+        docs.append((doc, obj))
+    ok_new = sum(extract_json(d) == o for d, o in docs)
+    ok_old = sum(legacy_extract_json(d) == o for d, o in docs)
+    print(f"extract_json  recovered: new {ok_new}/{len(docs)}  legacy {ok_old}/{len(docs)}")
+
+    # the keyword-anchored salary, picked over phone/date/employee-id/deduction numbers?
+    slips = [_payslip(rng) for _ in range(args.n)]
+    ok_new = sum(best_amount(t) == a for t, a in slips)
+    ok_old = sum(legacy_first_amount(t) == a for t, a in slips)
+    print(f"income amount correct:   new {ok_new}/{len(slips)}  legacy {ok_old}/{len(slips)}")
+
+    # timings: typical outputs, long outputs, and a pathological unclosed-brace output
+    typical = [d for d, _ in docs[:500]]
+    long_out = [_noise(rng, 4000) + json.dumps(_rand_obj(rng)) + _noise(rng, 4000) + " {" for _ in range(20)]
+    patho = ["{" * 20000 + "x" for _ in range(3)]
+    for label, items, reps in [("typical", typical, 5), ("long (~50 KB)", long_out, 3), ("unclosed braces", patho, 1)]:
+        old_us = _timed(legacy_extract_json, items, reps)
+        new_us = _timed(extract_json, items, reps)
+        print(f"extract_json {label:>16}: legacy {old_us:10.1f} us  new {new_us:10.1f} us  ({old_us / max(new_us, 1e-9):.1f}x)")
+    texts = [t for t, _ in slips[:500]]
+    print(f"amount pick   {'payslip':>16}: legacy {_timed(legacy_first_amount, texts, 5):10.1f} us  "
+          f"new {_timed(best_amount, texts, 5):10.1f} us (ranks every candidate)")
@@ -0,0 +1,59 @@
+"""
+Session state size and checkpoint (de)serialization time.
+
+Compares the previous layout (congrats image inlined as a data URL, income `raw` holding a
+copy of parsed/normalized, JSON) with the current one (marker, raw text once, serde.dumps_state).
+
+Usage (from repo root):
+  python -m benchmarks.bench_state_serde --turns 40
+"""
+import argparse, copy, json, time
+
+from ttb_ride.config import CONGRATS_IMAGE_PATH
+from ttb_ride.serde import dumps_state, loads_state, msgpack
+from ttb_ride.state import new_state
+from ttb_ride.utils.images import image_path_to_data_url
+from ttb_ride.utils.text import CONGRATS_MARKER
+
+
+def _session(turns: int, legacy: bool) -> dict:
+    st = new_state()
+    for i in range(turns):
+        st["messages"].append(("user", f"คำถามที่ {i}: ดอกเบี้ยเท่าไหร่ครับ"))
+        st["messages"].append(("assistant", "ดอกเบี้ยขึ้นอยู่กับวงเงินและระยะเวลาผ่อนครับ " * 4))
+        st["debug_logs"].append(f"[general_chat_reply] tokens={120 + i}")
+    parsed = {"holder_name": "นายสมชาย ใจดี", "monthly_income_thb": 32000, "employer": "ACME", "period": "2025-08"}
+    raw_text = json.dumps(parsed, ensure_ascii=False)
+    st["docs"]["income"].update(parsed=parsed, normalized=dict(parsed), monthly_income_thb=32000, ok=True)
+    st["docs"]["income"]["raw"] = {"parsed": parsed, "normalized": dict(parsed)} if legacy else raw_text
+    congrats = f"![congrats]({image_path_to_data_url(CONGRATS_IMAGE_PATH)})" if legacy else CONGRATS_MARKER
+    st["messages"].append(("assistant", "ยินดีด้วยครับ\n\n" + congrats))
+    return st
+
+def _bench(label: str, state: dict, dumps, loads, n: int) -> None:
+    blob = dumps(state)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        blob = dumps(state)
+    t_dump = (time.perf_counter() - t0) / n
+    t0 = time.perf_counter()
+    for _ in range(n):
+        loads(blob)
+    t_load = (time.perf_counter() - t0) / n
+    t0 = time.perf_counter()
+    for _ in range(n):
+        copy.deepcopy(state)
+    t_copy = (time.perf_counter() - t0) / n
+    print(f"{label:<28} size {len(blob) / 1024:9.1f} KiB  dump {t_dump * 1e3:7.3f} ms  "
+          f"load {t_load * 1e3:7.3f} ms  deepcopy {t_copy * 1e3:7.3f} ms")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--turns", type=int, default=40)
+    ap.add_argument("--n", type=int, default=50)
+    args = ap.parse_args()
+
+    to_json = lambda s: json.dumps(s, ensure_ascii=False).encode("utf-8")
+    _bench("legacy state / json", _session(args.turns, True), to_json, json.loads, args.n)
+    _bench(f"compact state / {'msgpack' if msgpack else 'json'}", _session(args.turns, False), dumps_state, loads_state, args.n)
@@ -0,0 +1,65 @@
+"""
+Scalar vs. batch validators (utils.text vs utils.bulk).
+
+Usage (from repo root):
+  python -m benchmarks.bench_text_bulk --n 200000
+"""
+import argparse, random, time
+
+import numpy as np
+
+from ttb_ride.utils.text import thai_id_checksum_ok, relaxed_name_match
+from ttb_ride.utils.bulk import thai_id_checksum_ok_many, relaxed_name_match_many
+
+FIRST = ["สมชาย", "สมหญิง", "วิชัย", "John", "Jane", "Somchai", "Malee", "ประยุทธ", "อนันต์", "Kittipong"]
+LAST = ["ใจดี", "รักไทย", "Smith", "Srisuk", "บุญมี", "Wongsa", "ทองดี", "Chaiyaporn"]
+TITLES = ["", "นาย ", "นาง ", "น.ส. ", "Mr. ", "Ms. "]
+
+
+def _rand_nid(rng: random.Random) -> str:
+    d = [rng.randint(1, 8)] + [rng.randint(0, 9) for _ in range(11)]
+    s = sum(d[i] * (13 - i) for i in range(12))
+    d.append((11 - s % 11) % 10 if rng.random() < 0.8 else rng.randint(0, 9))
+    x = "".join(map(str, d))
+    return f"{x[0]} {x[1:5]} {x[5:10]} {x[10:12]} {x[12]}" if rng.random() < 0.5 else x
+
+def _rand_name(rng: random.Random) -> str:
+    return f"{rng.choice(TITLES)}{rng.choice(FIRST)} {rng.choice(LAST)}"
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=100_000)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+    rng = random.Random(args.seed)
+
+    nids = [_rand_nid(rng) for _ in range(args.n)]
+    a = [_rand_name(rng) for _ in range(args.n)]
+    b = [_rand_name(rng) if rng.random() < 0.5 else x for x in a]
+
+    ref_ok, t_s = _timed(lambda: [thai_id_checksum_ok(x) for x in nids])
+    got_ok, t_b = _timed(lambda: thai_id_checksum_ok_many(nids))
+    assert got_ok.tolist() == ref_ok
+    print(f"checksum     n={args.n:>8}  scalar {t_s:7.3f}s  batch {t_b:7.3f}s  x{t_s / max(t_b, 1e-9):.1f}")
+
+    ints = np.array([int(x.replace(" ", "")) for x in nids], dtype=np.int64)
+    got_int, t_i = _timed(lambda: thai_id_checksum_ok_many(ints))
+    assert got_int.tolist() == ref_ok
+    print(f"checksum/int n={args.n:>8}  scalar {t_s:7.3f}s  batch {t_i:7.3f}s  x{t_s / max(t_i, 1e-9):.1f}")
+
+    ref_nm, t_s = _timed(lambda: [relaxed_name_match(x, y) for x, y in zip(a, b)])
+    (same, score, br), t_b = _timed(lambda: relaxed_name_match_many(a, b))
+    for k, (r_same, r_score, r_br) in enumerate(ref_nm):
+        assert (bool(same[k]), float(score[k])) == (r_same, r_score), k
+        assert {key: float(v[k]) for key, v in br.items()} == r_br, k
+    print(f"name match   n={args.n:>8}  scalar {t_s:7.3f}s  batch {t_b:7.3f}s  x{t_s / max(t_b, 1e-9):.1f}")
+
+    (same_i, _, _), t_i = _timed(lambda: relaxed_name_match_many(a, b, indel_ratio=True))
+    flips = int(np.count_nonzero(same_i != same))
+    print(f"name/indel   n={args.n:>8}  scalar {t_s:7.3f}s  batch {t_i:7.3f}s  x{t_s / max(t_i, 1e-9):.1f}  ({flips} verdicts differ)")
@@ -0,0 +1,6 @@
+import os, tempfile
+
+# before ttb_ride is imported: throwaway caches, no embedding model, a dedupe owner-key secret
+os.environ.setdefault("TTB_CACHE_DIR", tempfile.mkdtemp(prefix="ttb-ride-tests-"))
+os.environ.setdefault("SEMCACHE", "off")
+os.environ.setdefault("DEDUPE_OWNER_SECRET", "test-secret-0123456789")
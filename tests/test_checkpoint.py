@@ -0,0 +1,34 @@
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, StateGraph
+
+from ttb_ride import state as state_mod
+from ttb_ride.checkpoint import DeltaCheckpointSaver
+from ttb_ride.state import TState, delta_node
+
+
+def _turn(st):
+    n = len(st["messages"])
+    st["messages"].append(("assistant", f"reply {n}"))
+    st["debug_logs"] += [f"[turn] {n} a", f"[turn] {n} b"]
+    return st
+
+
+def test_capped_debug_logs_stay_deltas(monkeypatch):
+    monkeypatch.setattr(state_mod, "DEBUG_LOG_CAP", 5)
+    g = StateGraph(TState)
+    g.add_node("turn", delta_node(_turn))
+    g.set_entry_point("turn")
+    g.add_edge("turn", END)
+    saver = DeltaCheckpointSaver(MemorySaver(), full_every=100)
+    graph = g.compile(checkpointer=saver)
+    cfg = {"configurable": {"thread_id": "t1"}}
+
+    graph.invoke({"messages": [], "debug_logs": []}, cfg)
+    for _ in range(5):
+        graph.invoke({"event": {"type": "user_message"}}, cfg)
+
+    raw = saver.inner.get_tuple(cfg).checkpoint["channel_values"]["debug_logs"]
+    assert raw["drop"] == 2 and len(raw["items"]) == 2  # capped, still a delta
+    values = saver.get_tuple(cfg).checkpoint["channel_values"]
+    assert values["debug_logs"] == ["[turn] 3 b", "[turn] 4 a", "[turn] 4 b", "[turn] 5 a", "[turn] 5 b"]
+    assert values["messages"] == [("assistant", f"reply {n}") for n in range(6)]
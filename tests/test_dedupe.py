@@ -0,0 +1,21 @@
+from ttb_ride import agents, dedupe
+from ttb_ride.state import new_state
+
+
+def test_no_owner_secret_disables_the_index(monkeypatch):
+    monkeypatch.delenv("DEDUPE_OWNER_SECRET", raising=False)
+    monkeypatch.setattr(dedupe, "get_doc_index", lambda: (_ for _ in ()).throw(AssertionError("index used")))
+    monkeypatch.setattr(agents, "get_doc_index", dedupe.get_doc_index)
+    assert not dedupe.dedupe_enabled() and dedupe.owner_key("1234567890123") == ""
+    st = new_state()
+    st["docs"]["bike"]["path"] = "bike.jpg"
+    assert agents._cached_or_run(st, "bike", lambda: {"is_motorcycle": True}) == {"is_motorcycle": True}
+    agents._flag_repeat_uploads(st)
+    assert st["decision"]["duplicate_docs"] == []
+
+
+def test_owner_secret_is_read_on_use(monkeypatch):
+    monkeypatch.setenv("DEDUPE_OWNER_SECRET", "a" * 16)
+    key = dedupe.owner_key("1-2345-67890-12-3")
+    monkeypatch.setenv("DEDUPE_OWNER_SECRET", "b" * 16)
+    assert len(key) == dedupe.OWNER_KEY_LEN and dedupe.owner_key("1234567890123") != key
@@ -0,0 +1,25 @@
+import threading, time
+
+import pytest
+
+from ttb_ride.llm import scheduler as S
+
+
+@pytest.mark.parametrize("aging_s, first", [(0.05, "background"), (0, "interactive")])
+def test_queued_background_call_ages_past_new_chat(monkeypatch, aging_s, first):
+    monkeypatch.setattr(S, "LLM_PRIORITY_AGING_S", aging_s)
+    lim = S.ModelLimiter("m", rpm=120, tpm=10 ** 6)
+    lim.requests.level = 0.0  # at the ceiling: the next call waits ~0.5 s for a request slot
+    order = []
+
+    def call(name, priority):
+        lim.acquire(10, priority)
+        order.append(name)
+    bg = threading.Thread(target=call, args=("background", S.BACKGROUND))
+    bg.start()
+    time.sleep(0.15)
+    chat = threading.Thread(target=call, args=("interactive", S.INTERACTIVE))
+    chat.start()
+    bg.join(5)
+    chat.join(5)
+    assert order[0] == first and len(order) == 2
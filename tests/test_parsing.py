@@ -0,0 +1,95 @@
+"""Randomized property checks for ttb_ride.ocr.parsing (timings: benchmarks.bench_parsing)."""
+import json, random
+
+import pytest
+
+from ttb_ride.ocr.parsing import JSONFieldStream, best_amount, extract_json, normalize_income
+
+N = 500
+NOISE = ["ข้อมูล", "ผลลัพธ์", "result", "note", "ok", "ตามเอกสาร"]  # no braces/quotes
+
+
+def _rand_str(rng):
+    return "".join(rng.choice(['a', 'ก', ' ', '{', '}', '"', '\\', ':', ',', '1']) for _ in range(rng.randint(0, 12)))
+
+def _rand_obj(rng, depth=0):
+    obj = {}
+    for i in range(rng.randint(1, 4)):
+        r = rng.random()
+        if r < 0.4:
+            obj[f"k{i}"] = _rand_str(rng)
+        elif r < 0.7:
+            obj[f"k{i}"] = rng.randint(-10**6, 10**6)
+        elif depth < 3:
+            obj[f"k{i}"] = _rand_obj(rng, depth + 1)
+        else:
+            obj[f"k{i}"] = [1, "x}", None]
+    return obj
+
+def _noise(rng, n):
+    return " ".join(rng.choice(NOISE) for _ in range(n))
+
+def _thai(s):
+    return s.translate(str.maketrans("0123456789", "๐๑๒๓๔๕๖๗๘๙"))
+
+def _payslip(rng):
+    amount = rng.randrange(8_000, 300_000, 50)
+    fmt = f"{amount:,}.00" if rng.random() < 0.7 else str(amount)
+    if rng.random() < 0.3:
+        fmt = _thai(fmt)
+    kw = rng.choice(["เงินเดือน", "รายได้สุทธิ", "Net pay", "Salary"])
+    head = [
+        "บริษัท ตัวอย่าง จำกัด",
+        f"โทร 02{rng.randint(1000000, 9999999)}",
+        f"งวดเดือน {rng.randint(1, 12)}/{rng.choice([2566, 2567, 2024])}",
+        f"รหัสพนักงาน {rng.randint(1000, 99999)}",
+    ]
+    rng.shuffle(head)
+    salary = f"{kw} {fmt} บาท" if rng.random() < 0.8 else f"{kw}\n{fmt}"
+    tail = [f"หักภาษี {rng.randint(100, 5000):,}.00", f"ประกันสังคม {rng.choice([750, 875])}.00"]
+    return "\n".join(head + [salary] + tail), amount
+
+
+@pytest.fixture(scope="module")
+def noisy_docs():
+    rng, docs = random.Random(11), []
+    for _ in range(N):
+        obj = _rand_obj(rng)
+        s = json.dumps(obj, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 2]))
+        wrap = rng.choice(["{}", "```json\n{}\n```", "{} ", "ผลลัพธ์: {} ตามเอกสาร"])
+        doc = _noise(rng, rng.randint(0, 30)) + wrap.format(s) + _noise(rng, rng.randint(0, 30))
+        if rng.random() < 0.3:
+            doc += " trailing {note} " + _noise(rng, 5)  # breaks a greedy first-{ to last-} match
+        docs.append((doc, obj))
+    return docs
+
+
+def test_extract_json_recovers_embedded_object(noisy_docs):
+    for doc, obj in noisy_docs:
+        assert extract_json(doc) == obj, doc
+
+
+def test_field_stream_yields_each_field_once_in_order(noisy_docs):
+    rng = random.Random(12)
+    for doc, obj in noisy_docs:
+        stream, seen, i = JSONFieldStream(), [], 0
+        while i < len(doc):
+            step = rng.randint(1, 8)  # roughly a token or two per chunk
+            seen += stream.feed(doc[i:i + step])
+            i += step
+        assert seen == list(obj.items()), doc
+
+
+def test_best_amount_prefers_salary_keyword():
+    rng = random.Random(13)
+    for _ in range(N):
+        text, amount = _payslip(rng)
+        assert best_amount(text) == amount, text
+
+
+def test_normalize_income_thai_digits():
+    assert normalize_income({"monthly_income_thb": "๒๕,๐๐๐"}, "")["monthly_income_thb"] == 25000
+
+
+def test_unclosed_braces_give_none():
+    assert extract_json("{" * 20000 + "x") is None
@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+
+from ttb_ride import agents
+from ttb_ride.schemas import IntentOut
+from ttb_ride.session_store import MemorySessionStore, SessionBusy, SessionConflict, SQLiteSessionStore
+
+
+class StubEngine:
+    def intent_gate(self, user_text: str):
+        return IntentOut(motorcycle_loan_intent="กู้" in user_text, confidence=0.9, rationale="stub")
+
+    def contextual_chat(self, state: dict, extra_system: str = "") -> str:
+        return "stub reply"
+
+
+@pytest.fixture
+def graph():
+    from app import graph as app_graph
+    prev = app_graph.ENGINE
+    agents.set_engine(StubEngine())
+    yield app_graph.build_graph()
+    agents.set_engine(prev)
+
+
+def _user_turn(store, graph, sid: str, text: str):
+    def step(st):
+        st["messages"].append(("user", text))
+        st["event"] = {"type": "user_message"}
+        return graph.invoke(st, config={"configurable": {"thread_id": sid}})
+    return store.update(sid, step)
+
+
+def test_two_turns_across_two_workers(tmp_path, graph):
+    db = str(tmp_path / "sessions.sqlite3")
+    worker_a, worker_b = SQLiteSessionStore(db), SQLiteSessionStore(db)
+
+    st = _user_turn(worker_a, graph, "s1", "อยากกู้ซื้อมอเตอร์ไซค์")
+    assert st["ui"]["show_uploads"]
+    st = _user_turn(worker_b, graph, "s1", "ต้องใช้เอกสารอะไรบ้าง")
+
+    seen = worker_a.load("s1")
+    assert [m[1] for m in seen["messages"] if m[0] == "user"] == ["อยากกู้ซื้อมอเตอร์ไซค์", "ต้องใช้เอกสารอะไรบ้าง"]
+    assert seen["messages"][-1][1] == "stub reply"
+    assert seen["ui"]["show_uploads"] and seen["cursors"]["last_user_pos_handled"] == len(seen["messages"]) - 2
+    assert worker_b.load_versioned("s1")[1] == 2
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite"])
+def test_stale_save_conflicts(tmp_path, kind):
+    store = MemorySessionStore() if kind == "memory" else SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"))
+    store.save("s1", store.load("s1"), 0)
+    a, va = store.load_versioned("s1")
+    b, vb = store.load_versioned("s1")
+    a["messages"].append(("user", "a"))
+    b["messages"].append(("user", "b"))
+    store.save("s1", a, va)
+    with pytest.raises(SessionConflict):
+        store.save("s1", b, vb)
+    with pytest.raises(SessionConflict):
+        store.save("s2", a, 3)
+
+    # update() runs its step once; a save that bypassed the lease meanwhile fails it instead
+    calls = []
+
+    def step(st):
+        calls.append(1)
+        other = store.load("s1")
+        other["messages"].append(("user", "other"))
+        store.save("s1", other)
+        return st
+    with pytest.raises(SessionConflict):
+        store.update("s1", step)
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite"])
+def test_update_waits_for_the_sessions_lease(tmp_path, kind):
+    if kind == "memory":
+        worker_a = worker_b = MemorySessionStore()
+    else:  # two workers sharing one database
+        worker_a, worker_b = (SQLiteSessionStore(str(tmp_path / "sessions.sqlite3")) for _ in range(2))
+    entered, release, calls = threading.Event(), threading.Event(), []
+
+    def slow(st):
+        calls.append("a")
+        entered.set()
+        release.wait(5)
+        st["messages"].append(("assistant", "a"))
+        return st
+
+    def fast(st):
+        calls.append("b")
+        st["messages"].append(("assistant", "b"))
+        return st
+    t = threading.Thread(target=worker_a.update, args=("s1", slow))
+    t.start()
+    entered.wait(5)
+    with pytest.raises(SessionBusy):
+        with worker_b.lease("s1", wait_s=0.1):
+            pass
+    threading.Timer(0.2, release.set).start()
+    assert [m[1] for m in worker_b.update("s1", fast)["messages"]] == ["a", "b"]
+    t.join()
+    assert calls == ["a", "b"]
+
+
+def test_memory_store_is_bounded_and_purged():
+    store, gone = MemorySessionStore(max_sessions=2), []
+    store.on_purge(gone.extend)
+    for sid in ("s1", "s2", "s3"):
+        store.save(sid, store.load(sid))
+    assert not store.exists("s1") and store.exists("s3") and gone == ["s1"]
+    assert store.purge_expired(ttl_s=-1) == 2 and not store.exists("s3")
+    assert sorted(gone) == ["s1", "s2", "s3"]
+
+
+def test_sqlite_purge_reports_sessions(tmp_path):
+    store, gone = SQLiteSessionStore(str(tmp_path / "sessions.sqlite3")), []
+    store.on_purge(gone.extend)
+    store.save("s1", store.load("s1"))
+    assert store.purge_expired(ttl_s=3600) == 0 and gone == []
+    assert store.purge_expired(ttl_s=-1) == 1 and gone == ["s1"]
@@ -0,0 +1,52 @@
+import random
+from difflib import SequenceMatcher
+
+import pytest
+
+from ttb_ride.utils.bulk import relaxed_name_match_many
+from ttb_ride.utils.text import name_tokens, normalize_name, relaxed_name_match
+
+FIRST = ["สมชาย", "สมหญิง", "วิชัย", "John", "Jane", "Somchai", "Malee", "ประยุทธ", "อนันต์", "Kittipong"]
+LAST = ["ใจดี", "รักไทย", "Smith", "Srisuk", "บุญมี", "Wongsa", "ทองดี", "Chaiyaporn"]
+TITLES = ["", "นาย ", "นาง ", "น.ส. ", "Mr. ", "Ms. ", "นาย", "นางสาว"]  # the last two glued
+
+
+def _names(rng: random.Random, n: int):
+    pick = lambda: f"{rng.choice(TITLES)}{rng.choice(FIRST)}{rng.choice(['', 'า', 'ย'])} {rng.choice(LAST)}"
+    return [pick() for _ in range(n)], [pick() for _ in range(n)]
+
+
+@pytest.mark.parametrize("name, tokens", [
+    ("นางนวล ทองดี", ("นางนวล", "ทองดี")),  # a name that starts like a title keeps it
+    ("นาย สมชาย ใจดี", ("สมชาย", "ใจดี")),
+    ("น.ส.สมหญิง รักไทย", ("สมหญิง", "รักไทย")),
+    ("นางสาว สมหญิง", ("สมหญิง",)),
+    ("Mr. John Smith", ("john", "smith")),
+])
+def test_name_tokens_strip_titles(name, tokens):
+    assert name_tokens(name) == tokens
+
+
+@pytest.mark.parametrize("a, b, ratio", [
+    ("นายสมชาย ใจดี", "สมชาย ใจดี", 1.0),    # glued title: the stripped variant matches
+    ("นายสมชาย ใจดี", "นาย สมชาย ใจดี", 1.0),
+    ("นางนวล ทองดี", "นางนวล ทองดี", 1.0),   # a name that starts like a title: the raw variant matches
+    ("นางนวล ทองดี", "นาง นวล ทองดี", 1.0),  # ... and so does a spaced title
+])
+def test_glued_titles_scored_both_ways(a, b, ratio):
+    same, _, br = relaxed_name_match(a, b)
+    assert same and br["ratio"] == ratio and br["token_overlap"] == 1.0
+
+
+def test_ratio_is_difflib():
+    a, b = "นาย สมชาย ใจดี", "สมชัย ใจดีมาก"
+    _, _, br = relaxed_name_match(a, b)
+    assert br["ratio"] == round(SequenceMatcher(None, normalize_name(a), normalize_name(b)).ratio(), 3)
+
+
+def test_batch_matches_scalar():
+    a, b = _names(random.Random(3), 2000)
+    same, score, br = relaxed_name_match_many(a, b)
+    for k, (r_same, r_score, r_br) in enumerate(relaxed_name_match(x, y) for x, y in zip(a, b)):
+        assert (bool(same[k]), float(score[k])) == (r_same, r_score)
+        assert {key: float(v[k]) for key, v in br.items()} == r_br
@@ -1,9 +1,13 @@
 from ttb_ride.state import TState
 from ttb_ride.utils.debug import dbg
-from ttb_ride.utils.text import thai_id_checksum_ok, mask_nid, relaxed_name_match
-from ttb_ride.ocr.client import ocr_id_extract_path, ocr_income_extract_path
-
-# will be set by app.main after engine.setup()
+from ttb_ride.utils.text import thai_id_checksum_ok, mask_nid, relaxed_name_match, CONGRATS_MARKER
+from ttb_ride.ocr.client import ocr_id_extract_path, ocr_income_extract_path, renormalize_income
+from ttb_ride.dedupe import dedupe_enabled, get_doc_index, image_fingerprint, owner_key
+from ttb_ride.coalesce import superseded
+from ttb_ride.ocr.admission import ADMISSION, OCROverloaded, RETRY_LATER_MSG, missing_after
+from ttb_ride.semantic_cache import get_semantic_cache, no_application_context, cacheable_message
+
+# will be set by app.graph (the engine sets itself up on first use)
 ENGINE = None
 
 SYSTEM_PROMPT_REPEAT_INTENT = (
@@ -50,6 +54,11 @@ def router_intent(state: TState) -> TState:
     if latest_user_idx == last_seen:
         dbg(state, "intent_skip", reason="no_new_user_message"); return state
 
+    if _answer_from_semcache(state, latest_user_text):  # before the intent gate: a hit costs no LLM call
+        state.setdefault("cursors", {})["last_user_pos_handled"] = latest_user_idx
+        state["cursors"]["last_user_pos_answered"] = latest_user_idx
+        return state
+
     out = ENGINE.intent_gate(latest_user_text).dict()
     state["intent"].update(out)
     dbg(state, "intent_gate", intent=out["motorcycle_loan_intent"], confidence=out["confidence"], rationale=out.get("rationale", "")[:160])
@@ -81,19 +90,91 @@ def router_intent(state: TState) -> TState:
     return state
 
 
+def _semcache_eligible(state: TState, question: str) -> bool:
+    # the session's first question, with no application context: its answer depends on nothing else
+    n_user = sum(1 for role, _ in state.get("messages", []) if role == "user")
+    return n_user == 1 and no_application_context(state) and cacheable_message(question)
+
+def _answer_from_semcache(state: TState, question: str) -> bool:
+    """Reply from the semantic cache. Only general-chat answers are stored, so a hit is not a loan request."""
+    cache = get_semantic_cache()
+    if cache is None or not _semcache_eligible(state, question):
+        return False
+    hit = cache.lookup(question)
+    if hit is None:
+        return False
+    reply, sim, age_s = hit
+    state["messages"].append(("assistant", reply))
+    dbg(state, "semcache_hit", similarity=round(sim, 3), age_s=int(age_s))
+    return True
+
 def general_chat(state: TState) -> TState:
-    if not any(role == "user" for role, _ in state.get("messages", [])):
+    user_msgs = [text for role, text in state.get("messages", []) if role == "user"]
+    if not user_msgs:
         dbg(state, "chat_skip", reason="no_user_text"); return state
     reply = ENGINE.contextual_chat(state)
     state["messages"].append(("assistant", reply))
     dbg(state, "general_chat_reply", tokens=len(reply or ""))
+    # FAQ-style first questions are stored for router_intent to answer from next time
+    cache = get_semantic_cache()
+    if cache is not None and _semcache_eligible(state, user_msgs[-1]):
+        cache.store(user_msgs[-1], reply)
     return state
 
 
-def agent2_docops(state: TState) -> TState:
+def _vlm_log(state: TState, task: str):
+    # one debug line per VLM image call: profile, size, detail, image tokens, confidence
+    return lambda **fields: dbg(state, "vlm_image", task=task, **fields)
+
+
+def _fingerprint_slot(state: TState, kind: str) -> dict | None:
+    slot = state["docs"][kind]
+    try:
+        slot["fingerprint"] = image_fingerprint(slot["path"])
+    except Exception as e:
+        dbg(state, "dedupe_error", kind=kind, error=str(e)[:160])
+        return None
+    return slot["fingerprint"]
+
+def _cached_or_run(state: TState, kind: str, run, keep=lambda r: True):
+    """Reuse the result of a (near-)identical earlier upload, else run the check and index it."""
+    if not dedupe_enabled():
+        return run()
+    fp = _fingerprint_slot(state, kind)
+    hit = get_doc_index().cached_result(kind, fp) if fp else None
+    if hit is not None:
+        dbg(state, "dedupe_hit", kind=kind, distance=hit["distance"], exact=hit["exact"])
+        return hit["result"]
+    result = run()
+    if fp:
+        # failed OCR reads are not cached, so a re-upload gets a fresh attempt
+        get_doc_index().add(kind, fp, result if keep(result) else None)
+    return result
+
+def _flag_repeat_uploads(state: TState) -> None:
+    """Once the applicant's NID is known: flag docs seen under other NIDs, then claim ours."""
+    if not dedupe_enabled():
+        state["decision"]["duplicate_docs"] = []
+        return
+    index, owner = get_doc_index(), owner_key(state["docs"]["id"].get("nid", ""))
+    flags = []
+    for kind in ("bike", "income", "id"):
+        fp = state["docs"][kind].get("fingerprint")
+        if not fp:
+            continue
+        for h in index.foreign_hits(kind, fp, owner)[:1]:
+            flags.append({"kind": kind, "distance": h["distance"], "exact": h["exact"],
+                          "other_applicants": sum(1 for o in h["owners"] if o != owner)})
+        index.add_owner(index.add(kind, fp), owner)
+    state["decision"]["duplicate_docs"] = flags
+    if flags:
+        dbg(state, "dedupe_flag", flags=flags)
+
+
+def _check_bike(state: TState) -> None:
     bike = state["docs"]["bike"]
     if bike.get("path") and not bike.get("ok"):
-        parsed = ENGINE.vlm_is_motorcycle_from_path(bike["path"]).dict()
+        parsed = _cached_or_run(state, "bike", lambda: ENGINE.vlm_is_motorcycle_from_path(bike["path"], log=_vlm_log(state, "bike_check")).dict())
         bike["is_motorcycle"] = parsed["is_motorcycle"]
         bike["vlm_check_conf"] = parsed["confidence"]
         bike["ok"] = bool(parsed["is_motorcycle"])
@@ -101,32 +182,76 @@ def agent2_docops(state: TState) -> TState:
         if not bike["ok"]:
             state["messages"].append(("assistant", f"รูปภาพไม่ใช่มอเตอร์ไซค์ (conf {parsed['confidence']:.2f}). โปรดอัปโหลดใหม่"))
 
+
+def _check_id(state: TState) -> None:
     idd = state["docs"]["id"]
     if idd.get("path") is not None and not idd.get("ok"):
-        data = ocr_id_extract_path(idd["path"])
+        data = _cached_or_run(state, "id", lambda: ocr_id_extract_path(idd["path"]),
+                              keep=lambda d: thai_id_checksum_ok((d.get("parsed") or {}).get("National Identification Number", "")))
         idd["parsed"] = data.get("parsed", {})
         idd["nid"] = idd["parsed"].get("National Identification Number", "")
         idd["person_name"] = idd["parsed"].get("First and Last Name", "")
         idd["checksum_valid"] = thai_id_checksum_ok(idd["nid"])
         idd["ok"] = bool(idd["person_name"]) and bool(idd["nid"]) and bool(idd["checksum_valid"])
-        dbg(state, "id_ocr", name=idd["person_name"], nid_masked=mask_nid(idd["nid"]), checksum=idd["checksum_valid"], ok=idd["ok"])
+        dbg(state, "id_ocr", engine=data.get("engine"), name=idd["person_name"], nid_masked=mask_nid(idd["nid"]), checksum=idd["checksum_valid"], ok=idd["ok"])
         if not idd["ok"]:
             nid_txt = mask_nid(idd.get("nid", ""))
             state["messages"].append(("assistant", f"ข้อมูลบัตรประชาชนไม่ครบหรือเลขไม่ถูกต้อง (เลข: {nid_txt}). โปรดอัปโหลดใหม่"))
 
+
+def _check_income(state: TState) -> None:
     inc = state["docs"]["income"]
     if inc.get("path") is not None and not inc.get("ok"):
-        data = ocr_income_extract_path(inc["path"])
-        inc["raw"] = data
+        # cached results are re-normalized with the current parsing rules
+        data = renormalize_income(_cached_or_run(state, "income", lambda: ocr_income_extract_path(inc["path"]),
+                                                 keep=lambda d: isinstance((d.get("normalized") or {}).get("monthly_income_thb"), int)))
+        inc["raw"] = data.get("raw") or ""   # model text once; parsed/normalized are not duplicated
         inc["parsed"] = data.get("parsed", {})
         inc["normalized"] = data.get("normalized", {})
         inc["monthly_income_thb"] = inc["normalized"].get("monthly_income_thb")
         holder_name = inc["normalized"].get("holder_name") or inc["parsed"].get("holder_name") or inc["parsed"].get("name")
-        dbg(state, "income_ocr", holder_name=holder_name, monthly_income_thb=inc["monthly_income_thb"])
+        dbg(state, "income_ocr", engine=data.get("engine"), holder_name=holder_name, monthly_income_thb=inc["monthly_income_thb"])
         inc["ok"] = isinstance(inc["monthly_income_thb"], int)
         if not inc["ok"]:
             state["messages"].append(("assistant", "ไม่พบรายได้ต่อเดือนจากเอกสาร โปรดอัปโหลดใหม่"))
 
+
+DOC_CHECKS = {"bike": _check_bike, "id": _check_id, "income": _check_income}
+
+def _run_check(state: TState, kind: str) -> None:
+    slot = state["docs"][kind]
+    path = slot.get("path")
+    if superseded(kind, path):
+        dbg(state, "upload_superseded", kind=kind, stage="skipped")
+        return
+    before, n_msgs = dict(slot), len(state["messages"])
+    try:
+        DOC_CHECKS[kind](state)
+    except OCROverloaded:  # no GPU slot: this doc is turned away, the others are still checked
+        state["docs"][kind] = {k: v for k, v in before.items() if k != "path"}
+        del state["messages"][n_msgs:]
+        if not state["messages"] or state["messages"][-1][1] != RETRY_LATER_MSG:  # once per run
+            state["messages"].append(("assistant", RETRY_LATER_MSG))
+        dbg(state, "ocr_shed", kind=kind)
+        return
+    if superseded(kind, path):  # re-uploaded while this check ran: the next batch checks the new file
+        state["docs"][kind] = before
+        del state["messages"][n_msgs:]
+        dbg(state, "upload_superseded", kind=kind, stage="discarded")
+
+def agent2_docops(state: TState) -> TState:
+    # an upload event checks only the uploaded slots; otherwise (chat path) every pending slot
+    event = state.get("event") or {}
+    kinds = [k for k in DOC_CHECKS if k in event.get("kinds", ())] if event.get("type") == "upload" else list(DOC_CHECKS)
+    # OCR for these checks queues by how close the session is to done (its last missing doc first)
+    with ADMISSION.prioritized(missing_after(state["docs"], *kinds)):
+        for kind in kinds:
+            _run_check(state, kind)
+
+    docs_ok = all([state["docs"]["bike"]["ok"], state["docs"]["income"]["ok"], state["docs"]["id"]["ok"]])
+    if docs_ok and "duplicate_docs" not in state["decision"]:
+        _flag_repeat_uploads(state)
+
     state["ui"]["need"]["bike"] = not state["docs"]["bike"]["ok"]
     state["ui"]["need"]["income"] = not state["docs"]["income"]["ok"]
     state["ui"]["need"]["id"] = not state["docs"]["id"]["ok"]
@@ -165,7 +290,7 @@ def agent3_appraisal(state: TState) -> TState:
         state["messages"].append(("assistant", "ชื่อในเอกสารรายได้และบัตรประชาชนดูเหมือนไม่ตรงกัน (สาธิต: ใช้เกณฑ์ง่าย) โปรดตรวจสอบหรืออัปโหลดใหม่"))
         return state
 
-    appr = ENGINE.vlm_appraise_from_path(bike["path"]).dict()
+    appr = ENGINE.vlm_appraise_from_path(bike["path"], log=_vlm_log(state, "appraisal")).dict()
     bike["appraised_value_thb"] = appr["appraised_value_thb"]
     bike["appraisal_conf"] = appr["confidence"]
     bike["appraisal_notes"] = appr["notes"]
@@ -189,6 +314,20 @@ def agent3_appraisal(state: TState) -> TState:
     return state
 
 
+def agent_feedback(state: TState) -> TState:
+    """Happy/Unhappy button after an approval (entered directly via a feedback event)."""
+    kind = (state.get("event") or {}).get("kind", "happy")
+    text = ENGINE.contextual_chat(state, extra_system=feedback_extra_system(state, kind=kind))
+    if kind == "happy":
+        text += "\n\n" + CONGRATS_MARKER
+    state["messages"].append(("assistant", text))
+    state["ui"]["show_satisfaction"] = False
+    state["flags"]["last_feedback"] = kind
+    state["flags"]["reapply_ready"] = kind != "happy"
+    dbg(state, "feedback", kind=kind)
+    return state
+
+
 def feedback_extra_system(state: TState, kind: str) -> str:
     inc = state["docs"]["income"]; bike = state["docs"]["bike"]
     income = int(inc.get("monthly_income_thb") or 0)
@@ -222,10 +361,19 @@ def feedback_extra_system(state: TState, kind: str) -> str:
     return "\n".join(base)
 
 
+def route_event(state: TState) -> str:
+    """Graph entry: user messages go through the intent router, uploads straight to docops."""
+    etype = (state.get("event") or {}).get("type", "user_message")
+    if etype == "upload":
+        return "docops"
+    if etype == "feedback":
+        return "feedback"
+    return "router"
+
 def route_after_router(state: TState) -> str:
     last_seen = state.get("cursors", {}).get("last_user_pos_handled", -1)
-    if last_seen < 0:
-        return "END"
+    if last_seen < 0 or state["cursors"].get("last_user_pos_answered") == last_seen:
+        return "END"  # nothing to handle, or already answered from the semantic cache
     if state.get("intent", {}).get("motorcycle_loan_intent") and not state.get("flags", {}).get("approved_once", False):
         return "docops"
     return "chat"
@@ -0,0 +1,152 @@
+"""
+Delta checkpoints for append-only channels.
+
+DeltaCheckpointSaver wraps any LangGraph checkpointer. For `messages` / `debug_logs`, a step that
+only appended is stored as {"__delta__": base_checkpoint_id, "from": n, "items": [...]} instead of
+the whole list, so per-step write cost tracks the step's output, not the conversation length.
+A capped channel (state.LogRing) also records how many lines fell off the front ("drop"), so it
+stays a delta once it is full. Resolved messages are (role, text) tuples, as in a full load.
+Every `full_every`-th checkpoint of a thread (and any step that was not a pure append) stores the
+full value, which folds the chain; reads resolve deltas by walking at most that many parents.
+"""
+import os
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Tuple
+
+from langgraph.checkpoint.base import BaseCheckpointSaver, CheckpointTuple
+
+from ttb_ride.state import APPEND_CHANNELS
+from ttb_ride.serde import ROLES
+
+FULL_EVERY = int(os.getenv("CHECKPOINT_FULL_EVERY", "16"))
+_DELTA = "__delta__"
+
+
+def _same(a: Any, b: Any) -> bool:
+    # identity within a run; value equality after a reload (msgpack turns tuples into lists)
+    if a is b:
+        return True
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return list(a) == list(b)
+    return a == b
+
+
+def _item(m: Any) -> Any:
+    # msgpack/JSON turn message tuples into lists
+    return (ROLES.get(m[0], m[0]), m[1]) if isinstance(m, list) and len(m) == 2 else m
+
+
+def _cfg(config: dict) -> Tuple[str, str, Optional[str]]:
+    c = config.get("configurable", {})
+    return c.get("thread_id", ""), c.get("checkpoint_ns", ""), c.get("checkpoint_id")
+
+
+class DeltaCheckpointSaver(BaseCheckpointSaver):
+    def __init__(self, inner: BaseCheckpointSaver, channels: Sequence[str] = APPEND_CHANNELS,
+                 full_every: int = FULL_EVERY, cache_size: int = 256):
+        super().__init__(serde=inner.serde)
+        self.inner = inner
+        self.channels = tuple(channels)
+        self.full_every = max(1, full_every)
+        # (thread, ns) -> last written checkpoint: id, chain depth, per-channel (len, first, last, offset)
+        self._last: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._resolved: "OrderedDict[Tuple[str, str, str, str], list]" = OrderedDict()
+        self._cache_size = cache_size
+
+    @property
+    def config_specs(self):
+        return self.inner.config_specs
+
+    def get_next_version(self, current, channel):
+        return self.inner.get_next_version(current, channel)
+
+    # ---- write path ----
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread, ns, parent_id = _cfg(config)
+        last = self._last.get((thread, ns))
+        chain_ok = bool(last and last["id"] == parent_id and last["depth"] + 1 < self.full_every)
+
+        values = dict(checkpoint.get("channel_values", {}))
+        marks, any_delta = {}, False
+        for ch in self.channels:
+            cur = values.get(ch)
+            if not isinstance(cur, list):
+                continue
+            offset = getattr(cur, "offset", 0)
+            marks[ch] = (len(cur), cur[0] if cur else None, cur[-1] if cur else None, offset)
+            prev = last["marks"].get(ch) if chain_ok else None
+            if prev is None:
+                continue
+            n, first, tail, prev_offset = prev
+            drop = offset - prev_offset
+            if not 0 <= drop <= n:
+                drop = 0  # offsets from different runs (e.g. a reloaded graph input): compare items
+            kept = n - drop
+            # append, after dropping `drop` lines from the front: the previous tail is still in place
+            if len(cur) >= kept and (kept == 0 or ((drop or _same(cur[0], first)) and _same(cur[kept - 1], tail))):
+                values[ch] = {_DELTA: parent_id, "from": n, "items": cur[kept:]}
+                if drop:
+                    values[ch]["drop"] = drop
+                any_delta = True
+
+        stored = dict(checkpoint, channel_values=values) if any_delta else checkpoint
+        new_config = self.inner.put(config, stored, metadata, new_versions)
+        _, _, new_id = _cfg(new_config)
+        self._last[(thread, ns)] = {"id": new_id, "depth": (last["depth"] + 1) if any_delta else 0, "marks": marks}
+        return new_config
+
+    def put_writes(self, config, writes, task_id):
+        return self.inner.put_writes(config, writes, task_id)
+
+    # ---- read path ----
+    def _resolve_value(self, thread: str, ns: str, ckpt_id: str, ch: str, val: Any) -> Any:
+        if not (isinstance(val, dict) and _DELTA in val):
+            return val
+        key = (thread, ns, ckpt_id, ch)
+        hit = self._resolved.get(key)
+        if hit is not None:
+            self._resolved.move_to_end(key)
+            return hit
+        base_id = val[_DELTA]
+        base = self.inner.get_tuple({"configurable": {"thread_id": thread, "checkpoint_ns": ns, "checkpoint_id": base_id}})
+        base_val = self._resolve_value(thread, ns, base_id, ch, base.checkpoint["channel_values"].get(ch)) if base else []
+        out = [_item(m) for m in list(base_val or [])[val.get("drop", 0): val["from"]]]
+        out += [_item(m) for m in val["items"]]
+        self._resolved[key] = out
+        while len(self._resolved) > self._cache_size:
+            self._resolved.popitem(last=False)
+        return out
+
+    def _resolve(self, tup: Optional[CheckpointTuple]) -> Optional[CheckpointTuple]:
+        if tup is None:
+            return None
+        values = tup.checkpoint.get("channel_values", {})
+        if not any(isinstance(values.get(ch), dict) and _DELTA in values[ch] for ch in self.channels):
+            return tup
+        thread, ns, ckpt_id = _cfg(tup.config)
+        full = dict(values)
+        for ch in self.channels:
+            if ch in full:
+                full[ch] = self._resolve_value(thread, ns, ckpt_id, ch, full[ch])
+        return tup._replace(checkpoint=dict(tup.checkpoint, channel_values=full))
+
+    def get_tuple(self, config) -> Optional[CheckpointTuple]:
+        return self._resolve(self.inner.get_tuple(config))
+
+    def list(self, config, *, filter=None, before=None, limit=None) -> Iterator[CheckpointTuple]:
+        for tup in self.inner.list(config, filter=filter, before=before, limit=limit):
+            yield self._resolve(tup)
+
+    # ---- async (delegates to the sync path, like MemorySaver) ----
+    async def aget_tuple(self, config) -> Optional[CheckpointTuple]:
+        return self.get_tuple(config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None) -> AsyncIterator[CheckpointTuple]:
+        for tup in self.list(config, filter=filter, before=before, limit=limit):
+            yield tup
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id):
+        return self.put_writes(config, writes, task_id)
@@ -0,0 +1,131 @@
+"""
+Upload coalescing: uploads a session makes in quick succession become one docops pass.
+
+The first upload of a session opens a batch and leads it; uploads arriving within
+UPLOAD_COALESCE_MS of the previous one join it (at most UPLOAD_COALESCE_MAX_MS after the first).
+The leader then runs a single graph invocation for every slot in the batch, while the handlers
+that joined wait for it and render its result. Batches of one session run one at a time, so each
+loads the state the previous one saved (instead of racing it).
+
+Re-uploading a slot supersedes an in-flight check of its older file: docops skips that check if
+it has not started and discards its result if it finishes after the re-upload (`superseded`);
+the next batch checks the new file. UPLOAD_COALESCE_MS=0 turns the wait off.
+"""
+import contextvars, os, threading, time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+UPLOAD_COALESCE_MS = int(os.getenv("UPLOAD_COALESCE_MS", "1200"))
+UPLOAD_COALESCE_MAX_MS = int(os.getenv("UPLOAD_COALESCE_MAX_MS", "4000"))
+
+
+class Batch:
+    __slots__ = ("sid", "paths", "opened", "last", "done")
+
+    def __init__(self, sid: str):
+        self.sid = sid
+        self.paths: Dict[str, str] = {}   # kind -> path (a later upload of the same kind wins)
+        self.opened = self.last = time.monotonic()
+        self.done = threading.Event()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Followers: block until the leader's graph run has finished."""
+        return self.done.wait(timeout)
+
+
+class _Session:
+    __slots__ = ("open", "lock", "latest", "batches")
+
+    def __init__(self):
+        self.open: Optional[Batch] = None
+        self.lock = threading.Lock()       # one running batch per session
+        self.latest: Dict[str, str] = {}   # kind -> newest uploaded path
+        self.batches = 0                   # batches not yet finished
+
+
+_CURRENT: contextvars.ContextVar[Optional[Batch]] = contextvars.ContextVar("upload_batch", default=None)
+
+
+class UploadCoalescer:
+    def __init__(self, window_ms: int = UPLOAD_COALESCE_MS, max_ms: int = UPLOAD_COALESCE_MAX_MS):
+        self.window_s = max(0, window_ms) / 1000.0
+        self.max_s = max(self.window_s, max_ms / 1000.0)
+        self._cv = threading.Condition()
+        self._sessions: Dict[str, _Session] = {}
+        self.stats = {"uploads": 0, "batches": 0, "superseded": 0}
+
+    def add(self, sid: str, kind: str, path: str) -> Tuple[Batch, bool]:
+        """Join the session's open batch -> (batch, False), or open a new one to lead -> (batch, True)."""
+        with self._cv:
+            s = self._sessions.get(sid)
+            if s is None:
+                s = self._sessions[sid] = _Session()
+            s.latest[kind] = path
+            self.stats["uploads"] += 1
+            b = s.open
+            if b is not None:
+                b.paths[kind] = path
+                b.last = time.monotonic()
+                self._cv.notify_all()
+                return b, False
+            b = s.open = Batch(sid)
+            b.paths[kind] = path
+            s.batches += 1
+            self.stats["batches"] += 1
+            return b, True
+
+    def _settle(self, b: Batch) -> None:
+        with self._cv:
+            while True:
+                left = min(b.last + self.window_s, b.opened + self.max_s) - time.monotonic()
+                if left <= 0:
+                    return
+                self._cv.wait(left)
+
+    @contextmanager
+    def running(self, b: Batch) -> Iterator[Dict[str, str]]:
+        """Leader: wait for uploads to go quiet and for the session's previous batch, then run the block."""
+        self._settle(b)
+        s = self._sessions[b.sid]
+        s.lock.acquire()  # uploads arriving meanwhile still join `b`
+        with self._cv:
+            if s.open is b:
+                s.open = None
+            paths = dict(b.paths)
+        try:
+            yield paths
+        finally:
+            s.lock.release()
+            with self._cv:
+                s.batches -= 1
+                if s.batches == 0 and self._sessions.get(b.sid) is s:
+                    del self._sessions[b.sid]
+            b.done.set()
+
+    @contextmanager
+    def checking(self, b: Batch) -> Iterator[None]:
+        """Scope of the leader's graph run (no yields inside): docops consults `superseded` for `b`."""
+        token = _CURRENT.set(b)
+        try:
+            yield
+        finally:
+            _CURRENT.reset(token)
+
+    def superseded(self, kind: str, path: Optional[str]) -> bool:
+        """True if the batch running in this context checks `kind` at `path` and a newer upload replaced it."""
+        b = _CURRENT.get()
+        if b is None or not path:
+            return False
+        with self._cv:
+            s = self._sessions.get(b.sid)
+            newer = s is not None and s.latest.get(kind, path) != path
+            if newer:
+                self.stats["superseded"] += 1
+            return newer
+
+
+COALESCER = UploadCoalescer()
+
+
+def superseded(kind: str, path: Optional[str]) -> bool:
+    return COALESCER.superseded(kind, path)
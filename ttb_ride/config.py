@@ -38,3 +38,9 @@ def _parse_bg_rgb_env():
     return r, g, b
 
 DEFAULT_BG_R, DEFAULT_BG_G, DEFAULT_BG_B = _parse_bg_rgb_env()
+
+# ===== Runtime cache (duplicate-upload index etc.) =====
+CACHE_DIR = Path(os.getenv("TTB_CACHE_DIR", ".cache"))
+if not CACHE_DIR.is_absolute():
+    CACHE_DIR = PROJECT_ROOT / CACHE_DIR
+DEDUPE_INDEX_PATH = str(CACHE_DIR / "doc_index.jsonl")
@@ -0,0 +1,301 @@
+"""
+Near-duplicate upload index (perceptual hashes + BK-tree over Hamming distance).
+
+Every checked upload is fingerprinted (64-bit pHash, confirmed with a 64-bit dHash) and
+recorded with its doc kind, the verdict of its check and owner keys. Lookups are sub-millisecond
+for typical index sizes; the index persists as an append-only JSONL log that is replayed and
+compacted on load and every DEDUPE_COMPACT_EVERY appends.
+
+Nothing identifying is written to disk: verdicts keep only the ok flags, the masked NID and the
+monthly income (no names, no OCR text), and owner keys are HMAC-SHA256 of the NID under
+DEDUPE_OWNER_SECRET; without that secret the index is off (dedupe_enabled()). Full check results stay in process memory for
+DEDUPE_RESULT_TTL_S, so a re-uploaded ID card or payslip is only reused within that window;
+bike verdicts are reused from disk. Entries expire DEDUPE_TTL_DAYS after their last write.
+"""
+import hashlib, hmac, json, os, threading, time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from ttb_ride.config import DEDUPE_INDEX_PATH
+from ttb_ride.utils.images import load_prepared
+from ttb_ride.utils.text import mask_nid, thai_id_checksum_ok
+
+# max Hamming distance (of 64 bits) to reuse a cached result / to flag a cross-applicant repeat.
+# Payslips/IDs share templates, so result reuse needs byte-identical content for them.
+REUSE_MAX_DIST = {"bike": int(os.getenv("DEDUPE_BIKE_REUSE_DIST", "4")), "income": -1, "id": -1}
+FLAG_MAX_DIST = {
+    "bike": int(os.getenv("DEDUPE_BIKE_FLAG_DIST", "8")),
+    "income": int(os.getenv("DEDUPE_INCOME_FLAG_DIST", "4")),
+    "id": int(os.getenv("DEDUPE_ID_FLAG_DIST", "4")),
+}
+DHASH_CONFIRM_DIST = int(os.getenv("DEDUPE_DHASH_CONFIRM_DIST", "12"))
+DEDUPE_TTL_S = float(os.getenv("DEDUPE_TTL_DAYS", "30")) * 86400
+DEDUPE_RESULT_TTL_S = float(os.getenv("DEDUPE_RESULT_TTL_S", "3600"))
+DEDUPE_COMPACT_EVERY = int(os.getenv("DEDUPE_COMPACT_EVERY", "1000"))
+OWNER_KEY_LEN = 32  # hex chars; keys of another length (older salted hashes) are dropped on load
+VERDICT_REUSE = {"bike"}  # kinds whose on-disk verdict is the whole result the check needs
+
+_DCT_N = 32
+_DCT = np.cos(np.pi / _DCT_N * (np.arange(_DCT_N)[:, None]) * (np.arange(_DCT_N)[None, :] + 0.5))
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int("".join("1" if b else "0" for b in bits.ravel().tolist()), 2)
+
+def phash(img: Image.Image) -> int:
+    """64-bit DCT perceptual hash (low 8x8 frequencies vs. their median)."""
+    px = np.asarray(img.convert("L").resize((_DCT_N, _DCT_N), Image.LANCZOS), dtype=np.float64)
+    low = (_DCT @ px @ _DCT.T)[:8, :8]
+    return _bits_to_int(low > np.median(low.ravel()[1:]))
+
+def dhash(img: Image.Image) -> int:
+    """64-bit difference hash (horizontal gradient signs on a 9x8 thumbnail)."""
+    px = np.asarray(img.convert("L").resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    return _bits_to_int(px[:, 1:] > px[:, :-1])
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+_SECRET_WARNED = False
+
+def owner_secret() -> Optional[bytes]:
+    """DEDUPE_OWNER_SECRET as HMAC key (read on use, after .env is loaded); None if unset or
+    shorter than 16 characters, since NIDs are only 13 digits."""
+    global _SECRET_WARNED
+    secret = os.getenv("DEDUPE_OWNER_SECRET", "")
+    if len(secret) >= 16:
+        return secret.encode()
+    if not _SECRET_WARNED:
+        _SECRET_WARNED = True
+        print("[dedupe] DEDUPE_OWNER_SECRET is not set (16+ characters): duplicate-upload index disabled", flush=True)
+    return None
+
+def dedupe_enabled() -> bool:
+    return owner_secret() is not None
+
+def owner_key(nid: str) -> str:
+    digits, secret = "".join(c for c in (nid or "") if c.isdigit()), owner_secret()
+    if not digits or secret is None:
+        return ""
+    return hmac.new(secret, digits.encode(), hashlib.sha256).hexdigest()[:OWNER_KEY_LEN]
+
+def verdict(kind: str, result: Any) -> Optional[Dict[str, Any]]:
+    """The part of a check result that is persisted: ok flags, masked NID, monthly income."""
+    if not isinstance(result, dict):
+        return None
+    if kind == "bike":
+        return {"is_motorcycle": bool(result.get("is_motorcycle")), "confidence": result.get("confidence")}
+    if kind == "id":
+        nid = (result.get("parsed") or {}).get("National Identification Number", "")
+        return {"ok": thai_id_checksum_ok(nid), "nid_masked": mask_nid(nid)}
+    if kind == "income":
+        amount = (result.get("normalized") or {}).get("monthly_income_thb")
+        return {"ok": isinstance(amount, int), "monthly_income_thb": amount}
+    return None
+
+def image_fingerprint(path: str) -> Dict[str, str]:
+    """{"phash", "dhash", "sha256"} (hex) for an upload, hashed on the prepared image."""
+    img = load_prepared(path)
+    with open(path, "rb") as f:
+        sha = hashlib.sha256(f.read()).hexdigest()
+    return {"phash": f"{phash(img):016x}", "dhash": f"{dhash(img):016x}", "sha256": sha}
+
+
+class BKTree:
+    """BK-tree keyed by 64-bit ints under Hamming distance; values are entry ids."""
+
+    def __init__(self):
+        self.root: Optional[list] = None  # node = [key, [ids], {dist: child}]
+
+    def add(self, key: int, entry_id: str) -> None:
+        if self.root is None:
+            self.root = [key, [entry_id], {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(key, node[0])
+            if d == 0:
+                node[1].append(entry_id)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [key, [entry_id], {}]
+                return
+            node = child
+
+    def search(self, key: int, radius: int) -> List[Tuple[int, str]]:
+        out, stack = [], [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = hamming(key, node[0])
+            if d <= radius:
+                out.extend((d, i) for i in node[1])
+            for cd, child in node[2].items():
+                if d - radius <= cd <= d + radius:
+                    stack.append(child)
+        return out
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Exclusive lock shared by all worker processes appending to / compacting the same log."""
+    try:
+        import fcntl
+    except ImportError:  # Windows: single-process demo
+        yield
+        return
+    with open(path + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class DocIndex:
+    def __init__(self, path: str = DEDUPE_INDEX_PATH, ttl_s: float = DEDUPE_TTL_S):
+        self.path, self.ttl_s = path, ttl_s
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.tree = BKTree()
+        self._results: Dict[str, Tuple[float, Any]] = {}  # entry id -> (ts, full result), memory only
+        self._appended = 0
+        self._lock = threading.RLock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.compact()
+
+    def _live(self, e: Dict[str, Any], now: float) -> bool:
+        return now - e["ts"] <= self.ttl_s
+
+    def _apply(self, rec: Dict[str, Any]) -> bool:
+        """Fold one log record into the entries; True if it started a new entry."""
+        eid, ts = rec["id"], rec.get("ts", 0.0)
+        e, new = self.entries.get(eid), False
+        if e is None or ("phash" in rec and ts - e["ts"] > self.ttl_s):  # new, or re-added after expiry
+            if "phash" not in rec:
+                return False  # update to an entry that has expired and been compacted away
+            e = self.entries[eid] = {"id": eid, "kind": rec["kind"], "ts": ts, "verdict": None, "owners": [],
+                                     "phash": rec["phash"], "dhash": rec["dhash"], "sha256": rec["sha256"]}
+            new = True
+        e["ts"] = max(e["ts"], ts)
+        v = rec.get("verdict")
+        if v is None and rec.get("result") is not None:  # log lines from before verdicts: reduce them
+            v = verdict(e["kind"], rec["result"])
+        if v is not None:
+            e["verdict"] = v
+        for owner in rec.get("owners") or [rec.get("owner")]:
+            if owner and len(owner) == OWNER_KEY_LEN and owner not in e["owners"]:
+                e["owners"].append(owner)
+        return new
+
+    def _append(self, rec: Dict[str, Any]) -> None:
+        with _file_lock(self.path), open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self._appended += 1
+        if self._appended >= DEDUPE_COMPACT_EVERY > 0:
+            self.compact()
+
+    def compact(self) -> None:
+        """Replay the log (other workers' appends included), drop expired entries and rewrite it
+        with one line per live entry."""
+        with self._lock, _file_lock(self.path):
+            self.entries, lines = {}, 0
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        lines += 1
+                        try:
+                            self._apply(json.loads(line))
+                        except (ValueError, KeyError, TypeError):
+                            continue
+            now = time.time()
+            self.entries = {eid: e for eid, e in self.entries.items() if self._live(e, now)}
+            self._results = {eid: r for eid, r in self._results.items()
+                             if eid in self.entries and now - r[0] <= DEDUPE_RESULT_TTL_S}
+            self.tree = BKTree()
+            for eid, e in self.entries.items():
+                self.tree.add(int(e["phash"], 16), eid)
+            self._appended = 0
+            if lines > len(self.entries):
+                tmp = self.path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    for e in self.entries.values():
+                        f.write(json.dumps(e, ensure_ascii=False) + "\n")
+                os.replace(tmp, self.path)
+
+    def add(self, kind: str, fp: Dict[str, str], result: Any = None) -> str:
+        eid, now = f"{kind}:{fp['sha256'][:16]}", time.time()
+        with self._lock:
+            e = self.entries.get(eid)
+            if result is not None:
+                self._results[eid] = (now, result)
+            elif e is not None and self._live(e, now):
+                return eid
+            if e is not None and self._live(e, now):
+                rec = {"id": eid, "ts": now, "verdict": verdict(kind, result)}
+            else:
+                rec = {"id": eid, "kind": kind, "ts": now, "verdict": verdict(kind, result), **fp}
+            if self._apply(rec):
+                self.tree.add(int(fp["phash"], 16), eid)
+            self._append(rec)
+        return eid
+
+    def add_owner(self, entry_id: str, owner: str) -> None:
+        with self._lock:
+            e = self.entries.get(entry_id)
+            if owner and e is not None and owner not in e["owners"]:
+                rec = {"id": entry_id, "ts": time.time(), "owner": owner}
+                self._apply(rec)
+                self._append(rec)
+
+    def lookup(self, kind: str, fp: Dict[str, str], radius: int) -> List[Dict[str, Any]]:
+        """Live entries of `kind` within `radius` (pHash, confirmed by dHash), nearest first."""
+        key, dkey, now = int(fp["phash"], 16), int(fp["dhash"], 16), time.time()
+        hits, seen = [], set()
+        with self._lock:
+            for d, eid in self.tree.search(key, max(0, radius)):
+                e = self.entries.get(eid)
+                if e is None or eid in seen or e["kind"] != kind or not self._live(e, now):
+                    continue
+                seen.add(eid)
+                exact = e.get("sha256") == fp["sha256"]
+                if not exact and hamming(dkey, int(e["dhash"], 16)) > DHASH_CONFIRM_DIST:
+                    continue
+                hits.append({**e, "distance": 0 if exact else d, "exact": exact})
+        return sorted(hits, key=lambda h: (not h["exact"], h["distance"]))
+
+    def _result(self, eid: str, kind: str, v: Optional[Dict[str, Any]]) -> Any:
+        with self._lock:
+            ts, result = self._results.get(eid, (0.0, None))
+            if result is not None and time.time() - ts > DEDUPE_RESULT_TTL_S:
+                del self._results[eid]
+                result = None
+        if result is None and kind in VERDICT_REUSE:
+            return v
+        return result
+
+    def cached_result(self, kind: str, fp: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """Best reusable hit (exact content, or within REUSE_MAX_DIST for kinds that allow it)."""
+        for h in self.lookup(kind, fp, max(0, REUSE_MAX_DIST.get(kind, -1))):
+            if not (h["exact"] or h["distance"] <= REUSE_MAX_DIST.get(kind, -1)):
+                continue
+            result = self._result(h["id"], kind, h.get("verdict"))
+            if result is not None:
+                return {**h, "result": result}
+        return None
+
+    def foreign_hits(self, kind: str, fp: Dict[str, str], owner: str) -> List[Dict[str, Any]]:
+        """Near-duplicates of this upload already submitted under a different NID."""
+        return [h for h in self.lookup(kind, fp, FLAG_MAX_DIST.get(kind, 0))
+                if any(o != owner for o in h["owners"])]
+
+
+_INDEX: Optional[DocIndex] = None
+
+def get_doc_index() -> DocIndex:
+    global _INDEX
+    if _INDEX is None:
+        _INDEX = DocIndex()
+    return _INDEX
@@ -1,11 +1,13 @@
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+import os, threading
+from typing import Callable, Optional
 
+# langchain_openai / langchain_core are imported on first use (see setup), not at app import
 from ttb_ride.config import MODEL_TEXT, MODEL_VLM
 from ttb_ride.schemas import IntentOut, IsMotorcycleOut, AppraisalOut
 from ttb_ride.utils.text import sanitize_for_llm
-from ttb_ride.utils.images import pil_to_jpeg_data_url
-from PIL import Image
+from ttb_ride.utils.images import vlm_image_part
+from ttb_ride.llm.scheduler import SCHEDULER, INTERACTIVE, estimate_text_tokens
+from PIL import Image, ImageOps
 
 SYSTEM_PROMPT_CORE = (
     "You are TTB Ride, a banking assistant for motorcycle loans in Thailand.\n"
@@ -15,6 +17,31 @@ SYSTEM_PROMPT_CORE = (
     "Be concise, friendly, and non-binding."
 )
 
+# Per-task image profiles for VLM calls (longest side in px + OpenAI `detail` hint).
+# Yes/no verification needs little detail; appraisal starts at medium and is re-asked at
+# "appraise_high" only when its confidence is below APPRAISE_ESCALATE_CONF.
+IMAGE_PROFILES = {
+    "verify":        {"max_side": int(os.getenv("VLM_VERIFY_MAX_SIDE", "512")),  "detail": "low"},
+    "appraise":      {"max_side": int(os.getenv("VLM_APPRAISE_MAX_SIDE", "512")), "detail": "high"},
+    "appraise_high": {"max_side": int(os.getenv("VLM_APPRAISE_HIGH_MAX_SIDE", "1536")), "detail": "high"},
+}
+APPRAISE_ESCALATE_CONF = float(os.getenv("VLM_APPRAISE_ESCALATE_CONF", "0.6"))
+
+# expected completion sizes, reserved against the TPM bucket until the real usage is known
+EST_OUT_STRUCT = 200
+EST_OUT_CHAT = 600
+
+def _prompt_tokens(messages) -> int:
+    total = 0
+    for m in messages:
+        content = m.content if isinstance(m.content, list) else [{"type": "text", "text": m.content}]
+        total += sum(estimate_text_tokens(p.get("text", "")) for p in content if p.get("type") == "text")
+    return total
+
+def _used_tokens(msg) -> Optional[int]:
+    usage = getattr(msg, "usage_metadata", None) or {}
+    return usage.get("total_tokens")
+
 class TtbRideEngine:
     def __init__(self):
         self.llm = None
@@ -22,62 +49,115 @@ class TtbRideEngine:
         self.vlm = None
         self.vlm_struct_is_moto = None
         self.vlm_struct_appraise = None
+        self.image_profiles = {k: dict(v) for k, v in IMAGE_PROFILES.items()}
+        self._lock = threading.Lock()
 
     def setup(self):
-        llm = ChatOpenAI(model=MODEL_TEXT, temperature=0)
-        self.llm = llm
-        self.llm_struct_intent = llm.with_structured_output(IntentOut)
+        from langchain_openai import ChatOpenAI
+        from ttb_ride.llm.http_pool import get_http_clients
+
+        # one keep-alive (HTTP/2) pool for every wrapper below instead of a client per ChatOpenAI
+        http_client, http_async_client = get_http_clients()
+        pool = {"http_client": http_client, "http_async_client": http_async_client}
+        # 429s and transient errors are retried by the scheduler (queued against the quota), not the SDK;
+        # include_raw keeps the raw message so structured calls can report their token usage
+        llm = ChatOpenAI(model=MODEL_TEXT, temperature=0, max_retries=0, **pool)
+        self.llm_struct_intent = llm.with_structured_output(IntentOut, include_raw=True)
 
-        vlm = ChatOpenAI(model=MODEL_VLM, temperature=0)
+        vlm = ChatOpenAI(model=MODEL_VLM, temperature=0, max_retries=0, **pool)
         self.vlm = vlm
-        self.vlm_struct_is_moto = vlm.with_structured_output(IsMotorcycleOut)
-        self.vlm_struct_appraise = vlm.with_structured_output(AppraisalOut)
+        self.vlm_struct_is_moto = vlm.with_structured_output(IsMotorcycleOut, include_raw=True)
+        self.vlm_struct_appraise = vlm.with_structured_output(AppraisalOut, include_raw=True)
+        self.llm = llm  # set last: ready() treats it as "setup finished"
         global ENGINE
         ENGINE = self
         return self
 
+    def ready(self) -> "TtbRideEngine":
+        """Run setup() once, on first use (keeps langchain_openai out of app start-up)."""
+        if self.llm is None:
+            with self._lock:
+                if self.llm is None:
+                    self.setup()
+        return self
+
+    @staticmethod
+    def _call(model: str, runnable, messages, priority: int, est_out: int, image_tokens: int = 0):
+        """Invoke through the shared rate-limit scheduler (queues at the RPM/TPM ceiling)."""
+        def call():
+            out = runnable.invoke(messages)
+            if isinstance(out, dict) and "parsed" in out:  # structured output with include_raw
+                if out.get("parsing_error") is not None:
+                    raise out["parsing_error"]
+                return out["parsed"], _used_tokens(out.get("raw"))
+            return out, _used_tokens(out)
+        est = _prompt_tokens(messages) + image_tokens + est_out
+        return SCHEDULER.run(model, est, call, priority)
+
     # ---- classifiers / VLM helpers ----
     def intent_gate(self, user_text: str) -> IntentOut:
+        from langchain_core.messages import HumanMessage, SystemMessage
+        self.ready()
         system = (
             "Classify if the user intends to APPLY for a motorcycle LOAN. "
             "Consider Thai/English phrasing; avoid keyword matching. Return JSON only."
         )
-        out: IntentOut = self.llm_struct_intent.invoke([
+        out: IntentOut = self._call(MODEL_TEXT, self.llm_struct_intent, [
             SystemMessage(content=system),
             HumanMessage(content=user_text),
-        ])
+        ], INTERACTIVE, EST_OUT_STRUCT)
         return out
 
-    def vlm_is_motorcycle_from_path(self, path: str) -> IsMotorcycleOut:
-        img = Image.open(path).convert("RGB")
+    def _ask_image(self, runnable, prompt: str, img: Image.Image, profile: str, log: Optional[Callable] = None,
+                   priority: int = INTERACTIVE, **extra):
+        from langchain_core.messages import HumanMessage
+        p = self.image_profiles[profile]
+        part, meta = vlm_image_part(img, max_side=p["max_side"], detail=p["detail"])
+        out = self._call(MODEL_VLM, runnable, [HumanMessage(content=[{"type": "text", "text": prompt}, part])],
+                         priority, EST_OUT_STRUCT, image_tokens=meta["image_tokens"])
+        if log:
+            log(profile=profile, **meta, confidence=round(float(out.confidence), 3), **extra)
+        return out, meta
+
+    @staticmethod
+    def _open(path: str) -> Image.Image:
+        return ImageOps.exif_transpose(Image.open(path)).convert("RGB")
+
+    def vlm_is_motorcycle_from_path(self, path: str, log: Optional[Callable] = None,
+                                    priority: int = INTERACTIVE) -> IsMotorcycleOut:
+        """`log(**fields)` receives the image profile, size and image-token count of the call.
+        The applicant waits on it, hence INTERACTIVE; BACKGROUND is for back-office re-checks."""
+        self.ready()
         prompt = (
             "Verify whether the image shows a motorcycle (scooters/mopeds count). "
             "If ambiguous, set is_motorcycle=false. Return JSON only."
         )
-        out: IsMotorcycleOut = self.vlm_struct_is_moto.invoke([
-            HumanMessage(content=[
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": pil_to_jpeg_data_url(img)}},
-            ])
-        ])
+        out, _ = self._ask_image(self.vlm_struct_is_moto, prompt, self._open(path), "verify", log, priority)
         return out
 
-    def vlm_appraise_from_path(self, path: str) -> AppraisalOut:
-        img = Image.open(path).convert("RGB")
+    def vlm_appraise_from_path(self, path: str, log: Optional[Callable] = None,
+                               priority: int = INTERACTIVE) -> AppraisalOut:
+        """Medium-detail first; re-asked at high detail only below APPRAISE_ESCALATE_CONF."""
+        self.ready()
+        img = self._open(path)
         prompt = (
             "You are a Thai motorcycle appraiser. From the image ONLY (no extra info), "
             "estimate a fair market value in THB for a used bike in normal condition. "
             "If uncertain, give a conservative estimate and lower confidence. Return JSON only."
         )
-        out: AppraisalOut = self.vlm_struct_appraise.invoke([
-            HumanMessage(content=[
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": pil_to_jpeg_data_url(img)}},
-            ])
-        ])
-        return out
+        out, meta = self._ask_image(self.vlm_struct_appraise, prompt, img, "appraise", log, priority)
+        if out.confidence >= APPRAISE_ESCALATE_CONF:
+            return out
+        hi = self.image_profiles["appraise_high"]
+        if max(img.size) <= self.image_profiles["appraise"]["max_side"] and hi["detail"] == meta["detail"]:
+            return out  # the high profile would send the same pixels
+        out_hi, _ = self._ask_image(self.vlm_struct_appraise, prompt, img, "appraise_high", log, priority,
+                                    escalated_from=round(float(out.confidence), 3))
+        return out_hi if out_hi.confidence >= out.confidence else out
 
     def contextual_chat(self, state: "dict", extra_system: str = "") -> str:
+        from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+        self.ready()
         sys = SYSTEM_PROMPT_CORE + ("\n" + extra_system if extra_system else "")
         # compact history
         msgs = state.get("messages", [])[-12:]
@@ -93,7 +173,7 @@ class TtbRideEngine:
             total += len(s)
             if total >= 12000:
                 break
-        resp = self.llm.invoke(lc_msgs)
+        resp = self._call(MODEL_TEXT, self.llm, lc_msgs, INTERACTIVE, EST_OUT_CHAT)
         return resp.content or ""
 
 
@@ -0,0 +1,150 @@
+"""
+One tuned httpx client pair (sync + async) shared by every OpenAI wrapper in the process.
+
+By default each ChatOpenAI builds its own HTTP client, so the text model, the VLM and their
+structured-output variants each pay their own TCP/TLS handshakes and keep separate idle pools.
+Here they all go over one keep-alive pool, with HTTP/2 when `h2` is installed (`httpx[http2]`):
+concurrent calls are multiplexed on a few long-lived connections.
+
+Pool stats (requests, connections opened / TLS handshakes, time-to-headers p50/p95, open
+connections) are collected with httpx event hooks + httpcore trace events; pool_summary() is
+shown under the debug panel.
+
+Env: OPENAI_HTTP2 (1), OPENAI_POOL_MAX (64), OPENAI_POOL_KEEPALIVE (32), OPENAI_KEEPALIVE_S (90),
+OPENAI_CONNECT_TIMEOUT_S (5), OPENAI_TIMEOUT_S (60).
+"""
+import os, threading, time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "1") == "1"
+OPENAI_POOL_MAX = int(os.getenv("OPENAI_POOL_MAX", "64"))
+OPENAI_POOL_KEEPALIVE = int(os.getenv("OPENAI_POOL_KEEPALIVE", "32"))
+OPENAI_KEEPALIVE_S = float(os.getenv("OPENAI_KEEPALIVE_S", "90"))
+OPENAI_CONNECT_TIMEOUT_S = float(os.getenv("OPENAI_CONNECT_TIMEOUT_S", "5"))
+OPENAI_TIMEOUT_S = float(os.getenv("OPENAI_TIMEOUT_S", "60"))
+
+_T0 = "ttb_t0"  # request extension carrying the send time
+
+
+class PoolStats:
+    def __init__(self, window: int = 512):
+        self._lock = threading.Lock()
+        self.requests = self.connects = self.tls = 0
+        self.versions: Dict[str, int] = {}
+        self.ttfb_ms = deque(maxlen=window)
+
+    def on_trace(self, event: str) -> None:
+        if event == "connection.connect_tcp.complete":
+            with self._lock:
+                self.connects += 1
+        elif event == "connection.start_tls.complete":
+            with self._lock:
+                self.tls += 1
+
+    def on_request(self, request) -> None:
+        request.extensions[_T0] = time.perf_counter()
+
+    def on_response(self, response) -> None:
+        t0 = response.request.extensions.get(_T0)
+        with self._lock:
+            self.requests += 1
+            self.versions[response.http_version] = self.versions.get(response.http_version, 0) + 1
+            if t0 is not None:
+                self.ttfb_ms.append((time.perf_counter() - t0) * 1000.0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lat = sorted(self.ttfb_ms)
+            pick = lambda q: round(lat[int(q * (len(lat) - 1))]) if lat else None
+            return {"requests": self.requests, "connects": self.connects, "tls_handshakes": self.tls,
+                    "reuse": round(max(0.0, 1 - self.connects / self.requests), 3) if self.requests else None,
+                    "ttfb_p50_ms": pick(0.5), "ttfb_p95_ms": pick(0.95), "versions": dict(self.versions)}
+
+
+STATS = PoolStats()
+_CLIENTS: Optional[Tuple[Any, Any]] = None
+_LOCK = threading.Lock()
+
+
+def _http2_available() -> bool:
+    if not OPENAI_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        print("[http_pool] h2 not installed (pip install 'httpx[http2]'); using HTTP/1.1 keep-alive", flush=True)
+        return False
+
+
+def _build() -> Tuple[Any, Any]:
+    import httpx
+
+    http2 = _http2_available()
+    limits = httpx.Limits(max_connections=OPENAI_POOL_MAX, max_keepalive_connections=OPENAI_POOL_KEEPALIVE,
+                          keepalive_expiry=OPENAI_KEEPALIVE_S)
+    timeout = httpx.Timeout(OPENAI_TIMEOUT_S, connect=OPENAI_CONNECT_TIMEOUT_S)
+
+    def trace(event: str, info: dict) -> None:
+        STATS.on_trace(event)
+
+    async def atrace(event: str, info: dict) -> None:
+        STATS.on_trace(event)
+
+    def on_request(request):
+        STATS.on_request(request)
+        request.extensions["trace"] = trace
+
+    async def aon_request(request):
+        STATS.on_request(request)
+        request.extensions["trace"] = atrace
+
+    async def aon_response(response):
+        STATS.on_response(response)
+
+    sync_client = httpx.Client(http2=http2, limits=limits, timeout=timeout,
+                               event_hooks={"request": [on_request], "response": [STATS.on_response]})
+    async_client = httpx.AsyncClient(http2=http2, limits=limits, timeout=timeout,
+                                     event_hooks={"request": [aon_request], "response": [aon_response]})
+    return sync_client, async_client
+
+
+def get_http_clients() -> Tuple[Any, Any]:
+    """(httpx.Client, httpx.AsyncClient) shared by all OpenAI wrappers; built on first use."""
+    global _CLIENTS
+    if _CLIENTS is None:
+        with _LOCK:
+            if _CLIENTS is None:
+                _CLIENTS = _build()
+    return _CLIENTS
+
+
+def _pool_connections(client) -> Tuple[int, int]:
+    # httpcore pool internals; (open, idle) or (0, 0) if the layout differs
+    try:
+        conns = list(client._transport._pool.connections)
+        return len(conns), sum(1 for c in conns if c.is_idle())
+    except AttributeError:
+        return 0, 0
+
+
+def pool_stats() -> Dict[str, Any]:
+    s = STATS.snapshot()
+    if _CLIENTS is not None:
+        s["open"], s["idle"] = _pool_connections(_CLIENTS[0])
+    return s
+
+
+def pool_summary() -> str:
+    """One line for the debug panel ("" until the first LLM call)."""
+    if _CLIENTS is None:
+        return ""
+    s = pool_stats()
+    if not s["requests"]:
+        return ""
+    reuse = f"{s['reuse']:.0%}" if s["reuse"] is not None else "-"
+    versions = ", ".join(f"{v} x{n}" for v, n in sorted(s["versions"].items()))
+    return (f"[http_pool] requests={s['requests']} | connects={s['connects']} (tls={s['tls_handshakes']}) | "
+            f"reuse={reuse} | ttfb p50={s['ttfb_p50_ms']}ms p95={s['ttfb_p95_ms']}ms | "
+            f"open={s.get('open', 0)} idle={s.get('idle', 0)} | {versions}")
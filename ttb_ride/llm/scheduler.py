@@ -0,0 +1,199 @@
+"""
+Process-wide scheduler for OpenAI calls, shared by every session.
+
+Each model gets a request bucket and a token bucket sized to the org's RPM/TPM limits, so a
+burst queues here instead of turning into 429s and SDK backoff. A call is admitted with an
+estimated cost (prompt text + image tokens + expected output) and settled with the actual usage
+once the response arrives. Waiters are served by priority (INTERACTIVE: anything an applicant is
+waiting on, chat and document checks alike; BACKGROUND: back-office work), then arrival. A waiter
+moves up one class per LLM_PRIORITY_AGING_S queued, so no class waits forever at the ceiling.
+Only the head waiter draws from the buckets, so a large request is not starved by a stream of
+small ones.
+
+A 429 that still gets through (another process sharing the quota) empties the model's token
+bucket for the retry-after period, and the call is re-queued at the head of its class, up to
+LLM_RATE_RETRIES times. Connection errors, timeouts and 5xx get the same retries with a short
+backoff (the SDK's own retries are off, see TtbRideEngine.setup).
+
+Limits: LLM_RPM_TEXT / LLM_TPM_TEXT for MODEL_TEXT, LLM_RPM_VLM / LLM_TPM_VLM for MODEL_VLM (one
+model used for both shares one set of buckets with the text limits), scaled by
+LLM_RATE_HEADROOM (0.9) to stay just under the ceiling.
+"""
+import itertools, math, os, threading, time
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+from ttb_ride.config import MODEL_TEXT, MODEL_VLM
+
+INTERACTIVE, BACKGROUND = 0, 1
+
+LLM_RPM_TEXT = int(os.getenv("LLM_RPM_TEXT", "500"))
+LLM_TPM_TEXT = int(os.getenv("LLM_TPM_TEXT", "200000"))
+LLM_RPM_VLM = int(os.getenv("LLM_RPM_VLM", "500"))
+LLM_TPM_VLM = int(os.getenv("LLM_TPM_VLM", "200000"))
+LLM_RATE_HEADROOM = float(os.getenv("LLM_RATE_HEADROOM", "0.9"))
+LLM_RATE_RETRIES = int(os.getenv("LLM_RATE_RETRIES", "5"))
+LLM_PRIORITY_AGING_S = float(os.getenv("LLM_PRIORITY_AGING_S", "10"))  # <= 0: strict priorities
+DEFAULT_RETRY_AFTER_S = 2.0
+TRANSIENT_ERRORS = ("APIConnectionError", "APITimeoutError", "InternalServerError")
+
+T = TypeVar("T")
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Conservative token estimate (~3 UTF-8 bytes per token; Thai runs ~1 token per char)."""
+    return math.ceil(len((text or "").encode("utf-8")) / 3) + 4
+
+
+def _retry_delay(e: Exception, attempt: int) -> Optional[Tuple[float, bool]]:
+    """(seconds, is_rate_limit) if the call is worth retrying, else None."""
+    name = type(e).__name__
+    if name == "RateLimitError" or getattr(e, "status_code", None) == 429:
+        if getattr(e, "code", None) == "insufficient_quota":
+            return None  # billing, not rate: retrying cannot help
+        headers = getattr(getattr(e, "response", None), "headers", None) or {}
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000.0, True
+            if headers.get("retry-after"):
+                return float(headers["retry-after"]), True
+        except ValueError:
+            pass
+        return DEFAULT_RETRY_AFTER_S * (attempt + 1), True
+    if name in TRANSIENT_ERRORS:
+        return min(8.0, 0.5 * 2 ** attempt), False
+    return None
+
+
+class _Bucket:
+    """Continuously refilled bucket; the level may go negative (usage above the estimate is owed)."""
+    __slots__ = ("capacity", "rate", "level", "stamp")
+
+    def __init__(self, per_minute: float):
+        self.capacity = max(1.0, per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.stamp = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_for(self, amount: float) -> float:
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+class ModelLimiter:
+    def __init__(self, model: str, rpm: int, tpm: int):
+        self.model = model
+        self.requests = _Bucket(rpm * LLM_RATE_HEADROOM)
+        self.tokens = _Bucket(tpm * LLM_RATE_HEADROOM)
+        self.paused_until = 0.0
+        self._cv = threading.Condition()
+        self._waiting: List[tuple] = []  # (priority, front, seq, enqueued)
+        self._seq = itertools.count()
+        self.stats = {"calls": 0, "queued_s": 0.0, "rate_limited": 0, "est_tokens": 0, "used_tokens": 0}
+
+    @staticmethod
+    def _rank(key: tuple, now: float) -> tuple:
+        priority, front, seq, enqueued = key
+        if LLM_PRIORITY_AGING_S > 0:
+            priority = max(INTERACTIVE, priority - int((now - enqueued) / LLM_PRIORITY_AGING_S))
+        return priority, front, seq
+
+    def acquire(self, est_tokens: int, priority: int = INTERACTIVE, front: bool = False) -> int:
+        """Block until the call may go out; returns the tokens reserved for it."""
+        est = min(max(1, int(est_tokens)), int(self.tokens.capacity))  # a huge call still fits eventually
+        t0 = time.monotonic()
+        key = (priority, 0 if front else 1, next(self._seq), t0)
+        with self._cv:
+            self._waiting.append(key)
+            was_head = False
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    head = min(self._waiting, key=lambda k: self._rank(k, now))
+                    if head == key:
+                        was_head = True
+                        self.requests.refill(now)
+                        self.tokens.refill(now)
+                        wait = max(self.paused_until - now, self.requests.wait_for(1), self.tokens.wait_for(est))
+                        if wait <= 0:
+                            self._waiting.remove(key)
+                            self.requests.level -= 1
+                            self.tokens.level -= est
+                            self.stats["calls"] += 1
+                            self.stats["est_tokens"] += est
+                            self.stats["queued_s"] += now - t0
+                            self._cv.notify_all()  # the next head re-evaluates
+                            return est
+                    elif was_head:  # an older waiter aged past us: it is the head now
+                        was_head = False
+                        self._cv.notify_all()
+                    self._cv.wait(wait)
+            except BaseException:
+                if key in self._waiting:
+                    self._waiting.remove(key)
+                    self._cv.notify_all()
+                raise
+
+    def settle(self, reserved: int, used: Optional[int]) -> None:
+        """Correct the token bucket by the actual usage (refund or debt)."""
+        if used is None:
+            return
+        with self._cv:
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + reserved - used)
+            self.stats["used_tokens"] += used
+            self._cv.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """A 429 got through: nothing goes out for `seconds`, and the token bucket restarts empty."""
+        with self._cv:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens.level = min(self.tokens.level, 0.0)
+            self.stats["rate_limited"] += 1
+            self._cv.notify_all()
+
+
+class LLMScheduler:
+    def __init__(self, limits: Dict[str, Tuple[int, int]], default: Tuple[int, int] = (LLM_RPM_TEXT, LLM_TPM_TEXT)):
+        self.limits, self.default = dict(limits), default
+        self._limiters: Dict[str, ModelLimiter] = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, model: str) -> ModelLimiter:
+        with self._lock:
+            lim = self._limiters.get(model)
+            if lim is None:
+                lim = self._limiters[model] = ModelLimiter(model, *self.limits.get(model, self.default))
+            return lim
+
+    def run(self, model: str, est_tokens: int, call: Callable[[], Tuple[T, Optional[int]]],
+            priority: int = INTERACTIVE) -> T:
+        """Run `call` (-> (result, tokens used or None)) once `model`'s buckets allow it; queue, never fail fast."""
+        lim, front, attempt = self.limiter(model), False, 0
+        while True:
+            reserved = lim.acquire(est_tokens, priority, front)
+            try:
+                result, used = call()
+            except Exception as e:
+                retry = _retry_delay(e, attempt) if attempt < LLM_RATE_RETRIES else None
+                if retry is None:
+                    raise
+                delay, rate_limited = retry
+                if rate_limited:
+                    lim.pause(delay)
+                else:
+                    time.sleep(delay)
+                front, attempt = True, attempt + 1  # retries go ahead of new calls of the same priority
+                continue
+            lim.settle(reserved, used)
+            return result
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            return {m: dict(lim.stats) for m, lim in self._limiters.items()}
+
+
+# text limits win when MODEL_TEXT == MODEL_VLM
+SCHEDULER = LLMScheduler({MODEL_VLM: (LLM_RPM_VLM, LLM_TPM_VLM), MODEL_TEXT: (LLM_RPM_TEXT, LLM_TPM_TEXT)})
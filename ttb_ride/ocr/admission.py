@@ -0,0 +1,174 @@
+"""
+Admission control for GPU OCR calls made by this app process.
+
+At most OCR_MAX_CONCURRENCY OCR requests are in flight per process. Waiters queue by priority
+(number of docs the session will still be missing afterwards, so a session's last missing doc
+goes first), then arrival order. A full queue sheds its worst waiter (or the newcomer, if that is
+worse), and a waiter older than OCR_MAX_WAIT_S is shed too, so overload turns into a prompt
+"retry later" instead of requests timing out in random order.
+
+Only the GPU call itself holds a slot: ttb_ride.ocr.client wraps each call (each PDF page, too) in
+`with ADMISSION.slot(on_wait=...)`, after the local CPU pass has missed, and reports the queue
+position while it waits. The docops node sets the session's priority for the checks it runs with
+`with ADMISSION.prioritized(p)`; it reaches every OCR call made in that context.
+"""
+import contextvars, heapq, itertools, os, threading, time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+OCR_MAX_CONCURRENCY = int(os.getenv("OCR_MAX_CONCURRENCY", "4"))
+OCR_MAX_QUEUE = int(os.getenv("OCR_MAX_QUEUE", "32"))
+OCR_MAX_WAIT_S = float(os.getenv("OCR_MAX_WAIT_S", "90"))
+
+RETRY_LATER_MSG = "ขณะนี้มีผู้ใช้งานระบบตรวจเอกสารจำนวนมาก โปรดอัปโหลดเอกสารอีกครั้งในอีกสักครู่ครับ/ค่ะ"
+
+
+class OCROverloaded(RuntimeError):
+    """The OCR queue is full (or the wait got too long); the caller should retry later."""
+
+
+class Ticket:
+    __slots__ = ("key", "sid", "enqueued", "state", "_ctl")
+
+    def __init__(self, ctl: "OCRAdmission", sid: str, priority: int, seq: int):
+        self._ctl, self.sid = ctl, sid
+        self.key = (priority, seq)
+        self.enqueued = time.monotonic()
+        self.state = "waiting"  # waiting -> granted -> released | shed
+
+    def __lt__(self, other: "Ticket") -> bool:
+        return self.key < other.key
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """True once granted, False on timeout; raises OCROverloaded if shed."""
+        return self._ctl._wait(self, timeout)
+
+    def position(self) -> int:
+        return self._ctl._position(self)
+
+
+_PRIORITY: contextvars.ContextVar[int] = contextvars.ContextVar("ocr_admission_priority", default=0)
+
+
+class OCRAdmission:
+    def __init__(self, max_concurrency: int = OCR_MAX_CONCURRENCY, max_queue: int = OCR_MAX_QUEUE,
+                 max_wait_s: float = OCR_MAX_WAIT_S):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.max_wait_s = max_wait_s
+        self._cv = threading.Condition()
+        self._heap: List[Ticket] = []
+        self._waiting = 0
+        self._active = 0
+        self._seq = itertools.count()
+        self.stats = {"granted": 0, "shed": 0}
+
+    # ---- queue ----
+    def enqueue(self, sid: str = "", priority: int = 0) -> Ticket:
+        with self._cv:
+            t = Ticket(self, sid, priority, next(self._seq))
+            self._expire()
+            if self._active < self.max_concurrency and not self._waiting:
+                self._grant(t)
+                return t
+            if self._waiting >= self.max_queue:
+                worst = max((w for w in self._heap if w.state == "waiting"), default=None)
+                if worst is None or not (t < worst):
+                    self.stats["shed"] += 1
+                    raise OCROverloaded("ocr queue full")
+                self._shed(worst)
+            heapq.heappush(self._heap, t)
+            self._waiting += 1
+            return t
+
+    def _grant(self, t: Ticket) -> None:
+        t.state = "granted"
+        self._active += 1
+        self.stats["granted"] += 1
+
+    def _shed(self, t: Ticket) -> None:
+        t.state = "shed"
+        self._waiting -= 1
+        self.stats["shed"] += 1
+        self._cv.notify_all()
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.max_wait_s
+        for w in self._heap:
+            if w.state == "waiting" and w.enqueued < cutoff:
+                self._shed(w)
+
+    def _dispatch(self) -> None:
+        while self._active < self.max_concurrency and self._heap:
+            t = heapq.heappop(self._heap)
+            if t.state != "waiting":
+                continue  # shed entries are dropped lazily
+            self._waiting -= 1
+            self._grant(t)
+            self._cv.notify_all()
+
+    def _wait(self, t: Ticket, timeout: Optional[float]) -> bool:
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._cv:
+            while True:
+                if t.state == "granted":
+                    return True
+                if t.state == "shed":
+                    raise OCROverloaded("ocr queue overloaded")
+                self._expire()
+                if t.state == "shed":
+                    raise OCROverloaded("ocr queue wait too long")
+                left = t.enqueued + self.max_wait_s - time.monotonic()
+                if end is not None:
+                    left = min(left, end - time.monotonic())
+                    if left <= 0:
+                        return False
+                self._cv.wait(max(0.0, left))
+
+    def _position(self, t: Ticket) -> int:
+        with self._cv:
+            if t.state != "waiting":
+                return 0
+            return 1 + sum(1 for w in self._heap if w.state == "waiting" and w < t)
+
+    def release(self, t: Optional[Ticket]) -> None:
+        if t is None:
+            return
+        with self._cv:
+            if t.state == "granted":
+                t.state = "released"
+                self._active -= 1
+            elif t.state == "waiting":
+                self._shed(t)
+                self.stats["shed"] -= 1  # abandoned, not shed by us
+            self._dispatch()
+
+    # ---- scopes ----
+    @contextmanager
+    def prioritized(self, priority: int) -> Iterator[None]:
+        """OCR calls made in this context queue at `priority` (lower goes first)."""
+        token = _PRIORITY.set(priority)
+        try:
+            yield
+        finally:
+            _PRIORITY.reset(token)
+
+    @contextmanager
+    def slot(self, sid: str = "", priority: Optional[int] = None,
+             on_wait: Optional[Callable[[int], None]] = None) -> Iterator[None]:
+        """One OCR call: wait for a slot (calling on_wait(position) about once a second), hold it for the block."""
+        t = self.enqueue(sid, _PRIORITY.get() if priority is None else priority)
+        try:
+            while not t.wait(timeout=None if on_wait is None else 1.0):
+                on_wait(t.position())
+            yield
+        finally:
+            self.release(t)
+
+
+ADMISSION = OCRAdmission()
+
+
+def missing_after(docs: dict, *kinds: str) -> int:
+    """Docs a session would still be missing once `kinds` pass (0 = its last missing docs)."""
+    return sum(1 for k in ("bike", "income", "id") if k not in kinds and not (docs.get(k) or {}).get("ok"))
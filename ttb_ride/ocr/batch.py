@@ -0,0 +1,46 @@
+"""
+Back-office bulk OCR (re-extract archived ID cards / payslips).
+
+Usage (from repo root):
+  python -m ttb_ride.ocr.batch paths.txt --doc-type income --out income.jsonl --max-in-flight 16
+  find archive/ids -name '*.jpg' | python -m ttb_ride.ocr.batch - --doc-type id_card --out ids.jsonl
+
+Re-running the same command resumes: paths already in --out with a result are skipped.
+"""
+import argparse, sys
+
+from .ocr_agent import OlmOCRClient
+
+
+def _iter_paths(src: str):
+    f = sys.stdin if src == "-" else open(src, "r", encoding="utf-8")
+    try:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("paths", help="file with one image path per line, or - for stdin")
+    ap.add_argument("--doc-type", default="id_card", choices=["id_card", "income"])
+    ap.add_argument("--out", required=True, help="JSONL output (also the resume checkpoint)")
+    ap.add_argument("--max-in-flight", type=int, default=8)
+    args = ap.parse_args()
+
+    client = OlmOCRClient()
+    ok = failed = 0
+    for rec in client.ocr_many(_iter_paths(args.paths), doc_type=args.doc_type,
+                               out_path=args.out, max_in_flight=args.max_in_flight):
+        if "error" in rec:
+            failed += 1
+            print(f"[error] {rec['path']}: {rec['error']}", file=sys.stderr, flush=True)
+        else:
+            ok += 1
+        if (ok + failed) % 50 == 0:
+            print(f"[progress] ok={ok} failed={failed}", file=sys.stderr, flush=True)
+    print(f"[done] ok={ok} failed={failed} -> {args.out}", file=sys.stderr)
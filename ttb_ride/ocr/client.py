@@ -1,15 +1,171 @@
-from typing import Any, Dict
+import contextvars, os, tempfile, threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from ttb_ride.utils.pdf import is_pdf, iter_pages
+from .admission import ADMISSION
+from .local_engine import local_ocr_id, local_ocr_income, parse_income_text
 from .ocr_agent import OlmOCRClient
+from .parsing import normalize_income
+
+# stream GPU OCR field by field (early stop + progress); 0 = one blocking call per doc
+OCR_STREAM = os.getenv("OCR_STREAM", "1") == "1"
+# PDF payslips: pages OCR'd at once (rendered one by one, only as workers free up)
+PDF_OCR_PARALLEL = int(os.getenv("PDF_OCR_PARALLEL", "3"))
+
+_CLIENT: OlmOCRClient | None = None
+ProgressFn = Callable[[str, str, Any], None]  # (doc_type, field, value)
+_PROGRESS: contextvars.ContextVar[Optional[ProgressFn]] = contextvars.ContextVar("ocr_progress", default=None)
+_QUEUED: contextvars.ContextVar[Optional[Callable[[int], None]]] = contextvars.ContextVar("ocr_queued", default=None)
+_STOP: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar("ocr_stop", default=None)
+
+
+class _Abandoned(Exception):
+    """A PDF page no longer needed: another page already had the income."""
 
 def _get_ocr_client() -> OlmOCRClient:
-    return OlmOCRClient()
+    # one client per process so its upload buffers / sent digests are reused across calls
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = OlmOCRClient()
+    return _CLIENT
 
-def ocr_id_extract_path(path: str) -> Dict[str, Any]:
+@contextmanager
+def ocr_progress(fn: ProgressFn, queued: Optional[Callable[[int], None]] = None) -> Iterator[None]:
+    """Report fields of GPU OCR calls made in this context as soon as the model has decoded them,
+    and the queue position (queued(position)) while a call waits for a GPU slot."""
+    token, qtoken = _PROGRESS.set(fn), _QUEUED.set(queued)
+    try:
+        yield
+    finally:
+        _QUEUED.reset(qtoken)
+        _PROGRESS.reset(token)
+
+def _gpu_ocr(path: str, doc_type: str) -> Dict[str, Any]:
     ocr = _get_ocr_client()
-    out = ocr.ocr_id(path)
-    return {"parsed": out.get("parsed") or {}}
+    stop, queued = _STOP.get(), _QUEUED.get()
+
+    def on_wait(position: int) -> None:
+        if stop is not None and stop.is_set():
+            raise _Abandoned()  # leaves the queue
+        if queued is not None:
+            queued(position)
+
+    # bounded GPU concurrency: only the GPU call holds a slot, never the local pass before it
+    with ADMISSION.slot(on_wait=on_wait if stop is not None or queued is not None else None):
+        if stop is not None and stop.is_set():
+            raise _Abandoned()
+        if not OCR_STREAM:
+            return ocr.ocr_id(path) if doc_type == "id_card" else ocr.ocr_income(path)
+        report, out = _PROGRESS.get(), {}
+        events = ocr.ocr_stream(path, doc_type=doc_type)
+        try:
+            for ev in events:
+                if stop is not None and stop.is_set():
+                    raise _Abandoned()
+                if ev.get("type") == "field" and report is not None:
+                    report(doc_type, ev["key"], ev["value"])
+                elif ev.get("type") == "done":
+                    out = ev
+        finally:
+            events.close()  # an abandoned page stops decoding on the service
+        return out
+
+# Local CPU pass first; the GPU service only sees docs that fail its checksum/parse validation.
+def ocr_id_extract_path(path: str) -> Dict[str, Any]:
+    local = local_ocr_id(path)
+    if local is not None:
+        return {"parsed": local["parsed"], "engine": local["engine"]}
+    out = _gpu_ocr(path, "id_card")
+    return {"parsed": out.get("parsed") or {}, "engine": "olmocr"}
+
+def _income_from_image(path: str) -> Dict[str, Any]:
+    local = local_ocr_income(path)
+    if local is not None:
+        return {"parsed": local["parsed"], "normalized": local["normalized"], "raw": local["raw"], "engine": local["engine"]}
+    out = _gpu_ocr(path, "income")
+    return {"parsed": out.get("parsed") or {}, "normalized": out.get("normalized") or {}, "raw": out.get("raw") or "", "engine": "olmocr"}
+
+def _has_income(data: Dict[str, Any]) -> bool:
+    return isinstance((data.get("normalized") or {}).get("monthly_income_thb"), int)
+
+def _page_task(page_path: str, stop: threading.Event) -> Dict[str, Any]:
+    # runs in a copy of the caller's context (session priority, queue notes) without field notes:
+    # fields of several pages would interleave. Its GPU call takes its own admission slot.
+    _PROGRESS.set(None)
+    _STOP.set(stop)
+    try:
+        return _income_from_image(page_path)
+    finally:
+        os.remove(page_path)
+
+def _income_from_pdf(path: str) -> Dict[str, Any]:
+    """
+    Pages in order: a text layer with a keyword-anchored amount and a holder name needs no OCR;
+    otherwise the page is rendered to a temp JPEG and OCR'd, PDF_OCR_PARALLEL pages at a time.
+    Stops at the first page with a valid monthly income: pages not started are cancelled, pages
+    still queued or decoding are stopped (their streams closed), and all are waited for.
+    """
+    found: Optional[Dict[str, Any]] = None
+    first: Optional[Dict[str, Any]] = None
+    inflight: Dict[Any, Tuple[int, str]] = {}  # future -> (page index, temp page image)
+    parallel = max(1, PDF_OCR_PARALLEL)
+    stop = threading.Event()
+    pages = iter_pages(path, text=True)
+    pool = ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="pdf-ocr")
+    try:
+        exhausted = False
+        while found is None:
+            while not exhausted and len(inflight) < parallel:
+                page = next(pages, None)
+                if page is None:
+                    exhausted = True
+                    break
+                i, render, layer = page
+                parsed = parse_income_text(layer) if layer.strip() else None
+                if parsed and isinstance(parsed["monthly_income_thb"], int) and parsed["holder_name"]:
+                    found = {"parsed": parsed, "normalized": dict(parsed), "raw": layer, "engine": "pdf_text", "page": i + 1}
+                    break
+                fd, page_path = tempfile.mkstemp(prefix="payslip-p%d-" % (i + 1), suffix=".jpg")
+                with os.fdopen(fd, "wb") as f:
+                    render().save(f, format="JPEG", quality=92)  # only pages without a usable text layer
+                inflight[pool.submit(contextvars.copy_context().run, _page_task, page_path, stop)] = (i, page_path)
+            if found is not None or not inflight:
+                break
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for fut in sorted(done, key=lambda f: inflight[f][0]):  # lowest page wins a tie
+                i, _ = inflight.pop(fut)
+                try:
+                    data = fut.result()
+                except Exception as e:
+                    print(f"[ocr] {os.path.basename(path)} page {i + 1}: {type(e).__name__}: {e}", flush=True)
+                    continue
+                data = dict(data, page=i + 1)
+                if found is None and _has_income(data):
+                    found = data
+                elif first is None or i + 1 < first["page"]:
+                    first = data
+    except ImportError:
+        print("[ocr] pypdfium2 not installed (pip install pypdfium2); PDF payslips cannot be read", flush=True)
+    except Exception as e:  # unreadable/encrypted PDF: same outcome as an unreadable image
+        print(f"[ocr] {os.path.basename(path)}: {type(e).__name__}: {e}", flush=True)
+    finally:
+        pages.close()
+        stop.set()
+        for fut, (_, page_path) in inflight.items():
+            if fut.cancel():  # never started
+                os.remove(page_path)
+        pool.shutdown(wait=True)  # running pages stop at their next event and release their slots
+    return found or first or {"parsed": {}, "normalized": {}, "raw": "", "engine": "pdf"}
 
 def ocr_income_extract_path(path: str) -> Dict[str, Any]:
-    ocr = _get_ocr_client()
-    out = ocr.ocr_income(path)
-    return {"parsed": out.get("parsed") or {}, "normalized": out.get("normalized") or {}}
+    """Payslip image, or PDF (pages OCR'd in parallel until one yields the monthly income)."""
+    if is_pdf(path):
+        return _income_from_pdf(path)
+    return _income_from_image(path)
+
+def renormalize_income(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Re-derive `normalized` from a stored result's parsed JSON + raw text (e.g. cached uploads); no OCR call."""
+    if not (data.get("parsed") or data.get("raw")):
+        return data
+    return dict(data, normalized=normalize_income(data.get("parsed"), data.get("raw") or ""))
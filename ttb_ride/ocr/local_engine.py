@@ -0,0 +1,151 @@
+"""
+Local CPU text recognition, tried before the GPU OlmOCR service.
+
+docops only needs a checksum-valid NID + name from an ID card and a name + monthly amount from a
+payslip, which a plain text recognizer usually gets. Results are returned only when they pass
+validation (NID checksum; keyword-anchored amount, see ttb_ride.ocr.parsing); anything else returns None and the
+caller escalates to the GPU service.
+
+Engines are pluggable: OCR_LOCAL_ENGINE=tesseract (default; `pip install pytesseract` plus the
+tesseract binary with Thai data, e.g. `apt install tesseract-ocr tesseract-ocr-tha`) or any name
+added with register_local_engine(). OCR_LOCAL_ENGINE=off disables the local pass.
+"""
+import os, re
+from typing import Callable, Dict, Optional, Protocol
+
+from PIL import Image, ImageOps
+
+from ttb_ride.utils.text import thai_id_checksum_ok
+from .parsing import rank_amounts, to_arabic_digits
+from .preprocess import autocrop, deskew
+
+OCR_LOCAL_ENGINE = os.getenv("OCR_LOCAL_ENGINE", "tesseract").strip().lower()
+OCR_LOCAL_LANG = os.getenv("OCR_LOCAL_LANG", "tha+eng")
+OCR_LOCAL_MIN_WIDTH = int(os.getenv("OCR_LOCAL_MIN_WIDTH", "1400"))
+
+
+class LocalEngine(Protocol):
+    name: str
+    def text(self, img: Image.Image) -> str: ...
+
+
+class TesseractEngine:
+    name = "tesseract"
+
+    def __init__(self, lang: str = OCR_LOCAL_LANG):
+        import pytesseract
+        pytesseract.get_tesseract_version()  # raises if the binary is missing
+        self._tess, self.lang = pytesseract, lang
+
+    def text(self, img: Image.Image) -> str:
+        return self._tess.image_to_string(img, lang=self.lang, config="--psm 6")
+
+
+LOCAL_ENGINES: Dict[str, Callable[[], LocalEngine]] = {"tesseract": TesseractEngine}
+_ENGINE: Optional[LocalEngine] = None
+_ENGINE_FAILED = False
+
+def register_local_engine(name: str, factory: Callable[[], LocalEngine]) -> None:
+    LOCAL_ENGINES[name.strip().lower()] = factory
+
+def get_local_engine() -> Optional[LocalEngine]:
+    global _ENGINE, _ENGINE_FAILED
+    if _ENGINE is not None or _ENGINE_FAILED:
+        return _ENGINE
+    factory = LOCAL_ENGINES.get(OCR_LOCAL_ENGINE)
+    if factory is None:
+        _ENGINE_FAILED = True
+        return None
+    try:
+        _ENGINE = factory()
+    except Exception as e:
+        print(f"[local_ocr] engine {OCR_LOCAL_ENGINE!r} unavailable ({type(e).__name__}: {e}); using GPU OCR only", flush=True)
+        _ENGINE_FAILED = True
+    return _ENGINE
+
+
+def _prepare(path: str) -> Image.Image:
+    img = ImageOps.exif_transpose(Image.open(path)).convert("RGB")
+    img = deskew(autocrop(img)).convert("L")
+    if img.width < OCR_LOCAL_MIN_WIDTH:  # recognizers want ~300 dpi text
+        h = round(img.height * OCR_LOCAL_MIN_WIDTH / img.width)
+        img = img.resize((OCR_LOCAL_MIN_WIDTH, h), Image.LANCZOS)
+    return ImageOps.autocontrast(img)
+
+def _read_text(path: str) -> Optional[tuple]:
+    engine = get_local_engine()
+    if engine is None:
+        return None
+    try:
+        return engine.name, engine.text(_prepare(path))
+    except Exception as e:
+        print(f"[local_ocr] {engine.name} failed on {os.path.basename(path)}: {type(e).__name__}: {e}", flush=True)
+        return None
+
+
+# 13 digits in the card's 1-4-5-2-1 grouping (spaces/dashes optional)
+NID_RE = re.compile(r"(?<!\d)(\d)[\s-]?(\d{4})[\s-]?(\d{5})[\s-]?(\d{2})[\s-]?(\d)(?!\d)")
+ID_NAME_TH_RE = re.compile(r"ชื่อตัวและชื่อสกุล\s*[:：]?\s*(.+)")
+ID_NAME_EN_RE = re.compile(r"\bName\s*[:：]?\s*(.+)", re.IGNORECASE)
+ID_LAST_EN_RE = re.compile(r"\bLast\s*name\s*[:：]?\s*(.+)", re.IGNORECASE)
+
+HOLDER_RE = re.compile(r"(?:ชื่อ\s*-?\s*(?:นามสกุล|สกุล)|ชื่อพนักงาน|ชื่อ(?!บริษัท|นายจ้าง|หน่วยงาน)|employee\s*name|(?<!company )name)\s*[:：]?\s*(.+)", re.IGNORECASE)
+AMOUNT_RE = re.compile(r"\d[\d,]*(?:\.\d+)?")
+
+
+def _clean_line(s: str) -> str:
+    return re.sub(r"\s+", " ", s).strip(" :：|")
+
+def parse_id_text(text: str) -> Dict[str, str]:
+    """Fields of the OlmOCR id_card schema that can be read off plain recognizer text."""
+    text = to_arabic_digits(text)
+    nid = ""
+    for m in NID_RE.finditer(text):
+        cand = " ".join(m.groups())
+        if thai_id_checksum_ok(cand):
+            nid = cand
+            break
+    name = ""
+    m = ID_NAME_TH_RE.search(text)
+    if m:
+        name = _clean_line(m.group(1))
+    else:
+        first, last = ID_NAME_EN_RE.search(text), ID_LAST_EN_RE.search(text)
+        if first:
+            name = _clean_line(first.group(1) + (" " + last.group(1) if last else ""))
+    return {"National Identification Number": nid, "First and Last Name": name}
+
+def parse_income_text(text: str) -> Dict[str, object]:
+    """Holder name + the best amount anchored to a salary keyword (None if there is none)."""
+    text = to_arabic_digits(text)
+    holder = ""
+    for line in text.splitlines():
+        m = HOLDER_RE.search(line)
+        if m and not rank_amounts(line):
+            holder = _clean_line(AMOUNT_RE.sub("", m.group(1)))
+            break
+    income = next((c.value for c in rank_amounts(text) if c.keyword), None)
+    return {"holder_name": holder, "monthly_income_thb": income, "employer": "", "period": ""}
+
+
+def local_ocr_id(path: str) -> Optional[Dict[str, object]]:
+    """{"parsed", "raw", "engine"} when the local pass yields a checksum-valid NID and a name, else None."""
+    read = _read_text(path)
+    if read is None:
+        return None
+    engine, raw = read
+    parsed = parse_id_text(raw)
+    if not (parsed["National Identification Number"] and len(parsed["First and Last Name"]) >= 3):
+        return None
+    return {"parsed": parsed, "raw": raw, "engine": engine}
+
+def local_ocr_income(path: str) -> Optional[Dict[str, object]]:
+    """{"parsed", "normalized", "raw", "engine"} when a holder name and a keyword-anchored amount are found, else None."""
+    read = _read_text(path)
+    if read is None:
+        return None
+    engine, raw = read
+    parsed = parse_income_text(raw)
+    if not (isinstance(parsed["monthly_income_thb"], int) and parsed["holder_name"]):
+        return None
+    return {"parsed": parsed, "normalized": dict(parsed), "raw": raw, "engine": engine}
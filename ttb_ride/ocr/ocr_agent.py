@@ -1,16 +1,83 @@
-import modal
-from typing import Optional, Dict, Any
+import hashlib, json, mmap, os, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Optional, Dict, Any, Iterable, Iterator, Tuple
+from .preprocess import shrink_for_upload
+
+# uploads at/above this size are mapped instead of copied into a bytes object
+MMAP_MIN_BYTES = int(os.getenv("OCR_MMAP_MIN_BYTES", str(1 << 20)))
+PAYLOAD_CACHE_SIZE = int(os.getenv("OCR_PAYLOAD_CACHE_SIZE", "32"))
 
 class OlmOCRClient:
     """
     Client for the Modal-deployed OlmOCR service.
     - Supports document-specific routing via `doc_type` ("id_card" | "income") on .ocr()
     - Adds explicit helpers: .ocr_id() and .ocr_income()
+    - Downscales/re-encodes images to the doc-type pixel budget before upload (shrink=True)
+    - Each upload is read/prepared once and reused across calls and retries (small LRU);
+      bytes the service has already seen are referenced by sha256 instead of re-sent
+    - Bulk re-processing via .ocr_many() (bounded fan-out, JSONL output, resumable)
+    - Field-by-field results via .ocr_stream() while the model is still decoding
     """
 
-    def __init__(self):
+    def __init__(self, shrink: bool = True):
+        import modal  # deferred: only processes that actually OCR pay for the modal import
         OCR = modal.Cls.from_name("olmocr-service-ttb-ride", "OlmOCR")
         self.ocr_remote = OCR()
+        self.shrink = shrink
+        self._payloads: "OrderedDict[tuple, Tuple[bytes, str]]" = OrderedDict()
+        self._sent_digests: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _prepare(self, image_path: str, doc_type: Optional[str], max_pixels: Optional[int]) -> bytes:
+        with open(image_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size >= MMAP_MIN_BYTES:
+                # decode straight from the page cache; only the (smaller) payload is materialized
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if self.shrink:
+                        return shrink_for_upload(mm, doc_type=doc_type, max_pixels=max_pixels)
+                    return mm[:]
+            image_bytes = f.read()
+        if self.shrink:
+            image_bytes = shrink_for_upload(image_bytes, doc_type=doc_type, max_pixels=max_pixels)
+        return image_bytes
+
+    def _payload(self, image_path: str, doc_type: Optional[str], max_pixels: Optional[int] = None) -> Tuple[bytes, str]:
+        """(payload bytes, sha256 hex) for an upload; keyed by file identity so edits invalidate."""
+        st = os.stat(image_path)
+        key = (os.path.realpath(image_path), st.st_mtime_ns, st.st_size, doc_type, max_pixels, self.shrink)
+        with self._lock:
+            hit = self._payloads.get(key)
+            if hit is not None:
+                self._payloads.move_to_end(key)
+                return hit
+        data = self._prepare(image_path, doc_type, max_pixels)
+        entry = (data, hashlib.sha256(data).hexdigest())
+        with self._lock:
+            self._payloads[key] = entry
+            while len(self._payloads) > PAYLOAD_CACHE_SIZE:
+                self._payloads.popitem(last=False)
+        return entry
+
+    def _call(self, method, image_path: str, kind: Optional[str], **kwargs: Any) -> Dict[str, Any]:
+        data, digest = self._payload(image_path, kind, kwargs.get("max_pixels"))
+        with self._lock:
+            known = digest in self._sent_digests
+        if known:
+            # digest only; the service answers image_not_cached if it no longer holds the bytes
+            result = method.remote(image_bytes=None, image_digest=digest, **kwargs)
+            if not (isinstance(result, dict) and result.get("error") == "image_not_cached"):
+                return result
+        result = method.remote(image_bytes=data, image_digest=digest, **kwargs)
+        self._remember_sent(digest)
+        return result
+
+    def _remember_sent(self, digest: str) -> None:
+        with self._lock:
+            self._sent_digests[digest] = None
+            while len(self._sent_digests) > 4 * PAYLOAD_CACHE_SIZE:
+                self._sent_digests.popitem(last=False)
 
     def ocr(
         self,
@@ -23,34 +90,114 @@ class OlmOCRClient:
         Generic OCR: choose behavior by doc_type ("id_card" | "income") or custom instruction.
         If both `instruction` and `doc_type` are provided, `instruction` takes precedence (service behavior).
         """
-        with open(image_path, "rb") as f:
-            image_bytes = f.read()
-
         # Call Modal method using keyword args to avoid positional mismatches
-        result = self.ocr_remote.ocr.remote(
-            image_bytes=image_bytes,
+        return self._call(
+            self.ocr_remote.ocr, image_path, doc_type,
             instruction=instruction,
             doc_type=doc_type,
-            **gen_kwargs,  # e.g., max_new_tokens=..., temperature=...
+            **gen_kwargs,  # e.g., max_new_tokens=..., temperature=..., max_pixels=...
         )
-        return result
 
     # Convenience wrappers for the dedicated routes you exposed on the service
     def ocr_id(self, image_path: str, **gen_kwargs: Any) -> Dict[str, Any]:
-        with open(image_path, "rb") as f:
-            image_bytes = f.read()
-        return self.ocr_remote.ocr_id.remote(
-            image_bytes=image_bytes,
-            **gen_kwargs
-        )
+        return self._call(self.ocr_remote.ocr_id, image_path, "id_card", **gen_kwargs)
 
     def ocr_income(self, image_path: str, **gen_kwargs: Any) -> Dict[str, Any]:
-        with open(image_path, "rb") as f:
-            image_bytes = f.read()
-        return self.ocr_remote.ocr_income.remote(
-            image_bytes=image_bytes,
-            **gen_kwargs
-        )
+        return self._call(self.ocr_remote.ocr_income, image_path, "income", **gen_kwargs)
+
+    def ocr_stream(self, image_path: str, doc_type: str = "id_card", **gen_kwargs: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Streaming OCR: {"type": "field", "key", "value"} events as the model decodes, then one
+        {"type": "done", ...} event shaped like ocr_id()/ocr_income(). Pass required=[] to decode
+        the whole document instead of stopping after the fields the app needs.
+        """
+        method = self.ocr_remote.ocr_stream
+        data, digest = self._payload(image_path, doc_type, gen_kwargs.get("max_pixels"))
+        with self._lock:
+            known = digest in self._sent_digests
+        if known:
+            events = method.remote_gen(image_bytes=None, image_digest=digest, doc_type=doc_type, **gen_kwargs)
+            first = next(events, None)
+            if not (isinstance(first, dict) and first.get("error") == "image_not_cached"):
+                if first is not None:
+                    yield first
+                yield from events
+                return
+        for i, ev in enumerate(method.remote_gen(image_bytes=data, image_digest=digest, doc_type=doc_type, **gen_kwargs)):
+            if i == 0:
+                self._remember_sent(digest)  # the service has the bytes once it answers
+            yield ev
+
+    # ---- bulk / back-office ----
+    def ocr_many(
+        self,
+        image_paths: Iterable[str],
+        doc_type: str = "id_card",
+        out_path: Optional[str] = None,
+        max_in_flight: int = 8,
+        **gen_kwargs: Any,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Fan out OCR calls with at most `max_in_flight` remote calls pending; yield records
+        {"path", "doc_type", "result"} or {"path", "doc_type", "error"} as they complete.
+        `image_paths` is consumed lazily, so large archives can be streamed.
+
+        If `out_path` is given, each record is appended to it as JSONL and flushed. On restart
+        the same file acts as the checkpoint: paths with a successful record are skipped.
+        """
+        done = _load_checkpoint(out_path) if out_path else set()
+        call = {"id_card": self.ocr_id, "income": self.ocr_income}.get(doc_type)
+
+        def _one(path: str) -> Dict[str, Any]:
+            try:
+                res = call(path, **gen_kwargs) if call else self.ocr(path, doc_type=doc_type, **gen_kwargs)
+                return {"path": path, "doc_type": doc_type, "result": res}
+            except Exception as e:
+                return {"path": path, "doc_type": doc_type, "error": f"{type(e).__name__}: {e}"}
+
+        out_f = open(out_path, "a", encoding="utf-8") if out_path else None
+        if out_f and out_f.tell() > 0:
+            out_f.write("\n")  # never append onto a torn last line; blank lines are skipped on load
+        paths = (p for p in image_paths if p not in done)
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, max_in_flight)) as pool:
+                pending = set()
+                exhausted = False
+                while pending or not exhausted:
+                    while not exhausted and len(pending) < max_in_flight:
+                        nxt = next(paths, None)
+                        if nxt is None:
+                            exhausted = True
+                        else:
+                            pending.add(pool.submit(_one, nxt))
+                    if not pending:
+                        break
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        rec = fut.result()
+                        if out_f:
+                            out_f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                            out_f.flush()
+                        yield rec
+        finally:
+            if out_f:
+                out_f.close()
+
+
+def _load_checkpoint(out_path: str) -> set:
+    """Paths already processed successfully in a previous (possibly interrupted) run."""
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue  # torn last line from a crash
+            if "result" in rec and rec.get("path"):
+                done.add(rec["path"])
+    return done
 
 
 if __name__ == "__main__":
@@ -2,7 +2,11 @@ import os
 import re
 import io
 import json
+import hashlib
+import threading
+import time
 import modal
+from collections import OrderedDict
 from modal import App, Volume, Image
 
 # =========================
@@ -25,6 +29,9 @@ image = (
         "Pillow",
     )
     .env({"HF_HUB_CACHE": "/cache"})
+    # shared parsing/preprocessing code (ttb_ride.ocr.parsing, .preprocess) shipped with the service;
+    # deploy as a module from the repo root: modal deploy -m ttb_ride.ocr.olmocr_service_ttb_ride
+    .add_local_python_source("ttb_ride")
 )
 
 # Secret for Hugging Face downloads (adjust to your workspace)
@@ -41,9 +48,21 @@ REVISION = os.getenv("OLMOCR_ADAPTER_REVISION", None)  # optional adapter revisi
 CACHE_DIR = "/cache"
 MIN_CONTAINERS = int(os.getenv("OLMOCR_MIN_CONTAINERS", "0"))
 
+# Pre-quantized, adapter-merged weights written by `build_snapshot` (safetensors).
+# Keyed by model/adapter/revision so a config change never loads stale weights.
+SNAPSHOT_ROOT = os.getenv("OLMOCR_SNAPSHOT_ROOT", f"{CACHE_DIR}/olmocr-snapshots")
+SNAPSHOT_DIR = os.path.join(
+    SNAPSHOT_ROOT,
+    re.sub(r"[^0-9A-Za-z._-]+", "--", "__".join(filter(None, [MODEL_ID, ADAPTER_REPO, REVISION]))),
+)
+SNAPSHOT_MARKER = "SNAPSHOT_OK"
+# Modal container memory snapshots (CPU + GPU state restored instead of re-loading weights)
+MEMORY_SNAPSHOT = os.getenv("OLMOCR_MEMORY_SNAPSHOT", "0") == "1"
+
 MAX_MAX_NEW_TOKENS = int(os.getenv("MAX_MAX_NEW_TOKENS", 2048))
 DEFAULT_MAX_NEW_TOKENS = int(os.getenv("DEFAULT_MAX_NEW_TOKENS", 1024))
 MAX_INPUT_TOKEN_LENGTH = int(os.getenv("MAX_INPUT_TOKEN_LENGTH", 4096))
+STREAM_TOKEN_TIMEOUT_S = float(os.getenv("OLMOCR_STREAM_TOKEN_TIMEOUT_S", "120"))
 
 # -------------------------
 # Document-specific prompts
@@ -98,82 +117,162 @@ PROMPTS = {
     "income": (INCOME_SYSTEM_PROMPT, INCOME_USER_INSTRUCTION),
 }
 
-hf_cache_volume = Volume.from_name("hf-hub-cache", create_if_missing=True)
-
-# =========================
-# Helpers
-# =========================
-JSON_FENCE = re.compile(r"\{[\s\S]*\}")
+# ocr_stream stops decoding once these have been read (the app needs nothing else)
+STREAM_REQUIRED = {
+    "id_card": ("National Identification Number", "First and Last Name"),
+    "income": ("holder_name", "monthly_income_thb"),
+}
 
-THAI_DIGITS = str.maketrans("๐๑๒๓๔๕๖๗๘๙", "0123456789")
+hf_cache_volume = Volume.from_name("hf-hub-cache", create_if_missing=True)
 
-def extract_json(text: str):
-    text = (text or "").strip()
-    # Try direct JSON first
+# Recently seen uploads by sha256, so clients can send a digest instead of the bytes.
+# Per-container LRU first, then a shared Dict visible to every container. Shared entries are
+# (expires, bytes), written off the request path; reads drop expired ones, and sweep_image_store
+# deletes them (a digest -> expiry Dict keeps that sweep from downloading the images).
+# A client whose digest has expired gets "image_not_cached" and sends the bytes again.
+IMAGE_CACHE_SIZE = int(os.getenv("OLMOCR_IMAGE_CACHE_SIZE", "64"))
+IMAGE_STORE_TTL_S = int(os.getenv("OLMOCR_IMAGE_STORE_TTL_S", "900"))
+image_store = modal.Dict.from_name("olmocr-image-cache", create_if_missing=True)
+image_expiry = modal.Dict.from_name("olmocr-image-cache-expiry", create_if_missing=True)
+
+def _store_image(digest: str, data: bytes) -> None:
+    expires = time.time() + IMAGE_STORE_TTL_S
     try:
-        return json.loads(text)
-    except Exception:
-        pass
-    # Fenced JSON fallback
-    m = JSON_FENCE.search(text)
-    if not m:
-        return None
-    candidate = m.group(0)
+        image_expiry.put(digest, expires)
+        image_store.put(digest, (expires, data))
+    except Exception as e:
+        print(f"[image_store] put failed: {e}", flush=True)
+
+def _stored_image(digest: str) -> bytes | None:
     try:
-        return json.loads(candidate)
+        entry = image_store.get(digest)
     except Exception:
         return None
+    if isinstance(entry, tuple) and entry[0] >= time.time():
+        return entry[1]
+    return None  # missing, expired, or written before entries carried an expiry
+
+# =========================
+# Helpers
+# =========================
+# extract_json / normalize_income are shared with the app (ttb_ride.ocr.parsing)
+from ttb_ride.ocr.parsing import extract_json, normalize_income, JSONFieldStream
 
-_amount_pat = re.compile(r"([0-9๐-๙][0-9,๐-๙\.]*)\s*(?:THB|บาท|฿)?", re.IGNORECASE)
+# =========================
+# Model loading / snapshot
+# =========================
+def _snapshot_ready() -> bool:
+    return os.path.exists(os.path.join(SNAPSHOT_DIR, SNAPSHOT_MARKER))
 
-def _to_arabic_digits(s: str) -> str:
-    return (s or "").translate(THAI_DIGITS)
+def _load_base_model():
+    """
+    Download + quantize MODEL_ID (NF4, fallback fp16/fp32) and apply the optional adapter.
+    This is the slow path; `build_snapshot` runs it once and saves the result.
+    """
+    import torch
+    from transformers import AutoProcessor, Qwen2_5_VLForConditionalGeneration, BitsAndBytesConfig
+
+    # Processor
+    processor = AutoProcessor.from_pretrained(MODEL_ID, trust_remote_code=True)
+
+    # Quantization
+    quant_config = BitsAndBytesConfig(
+        load_in_4bit=True,
+        bnb_4bit_use_double_quant=True,
+        bnb_4bit_compute_dtype=torch.bfloat16,
+        bnb_4bit_quant_type="nf4",
+    )
 
-def _parse_int_amount(s: str) -> int | None:
-    """Parse an integer amount from a string; tolerant of commas, Thai digits, and decimals."""
-    if not s:
-        return None
-    s = _to_arabic_digits(s)
-    s = s.replace(",", "")
-    # If decimal exists, drop fractional for integer monthly income
+    # Load model (quantized if possible; fallback to fp16/fp32)
     try:
-        return int(float(s))
+        model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
+            MODEL_ID,
+            trust_remote_code=True,
+            quantization_config=quant_config,
+            device_map="auto",
+            low_cpu_mem_usage=True,
+        )
     except Exception:
-        return None
+        torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+        model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
+            MODEL_ID,
+            trust_remote_code=True,
+            torch_dtype=torch_dtype,
+            device_map="auto",
+            low_cpu_mem_usage=True,
+        )
+
+    # Optional adapter (merged so the snapshot is a plain model)
+    if ADAPTER_REPO:
+        from peft import PeftModel
+        model = PeftModel.from_pretrained(model, ADAPTER_REPO, revision=REVISION)
+        model = model.merge_and_unload()
+
+    return processor, model
+
+def _load_snapshot_model():
+    """Load the pre-quantized safetensors snapshot (quantization config is stored alongside)."""
+    from transformers import AutoProcessor, Qwen2_5_VLForConditionalGeneration
+
+    processor = AutoProcessor.from_pretrained(SNAPSHOT_DIR, trust_remote_code=True)
+    model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
+        SNAPSHOT_DIR,
+        trust_remote_code=True,
+        device_map="auto",
+        low_cpu_mem_usage=True,
+        use_safetensors=True,
+    )
+    return processor, model
 
-def normalize_income(parsed: dict | None, raw_text: str) -> dict:
+@app.function(
+    image=image,
+    secrets=secrets,
+    gpu=GPU,
+    timeout=3600,
+    volumes={CACHE_DIR: hf_cache_volume},
+)
+def build_snapshot(force: bool = False) -> str:
     """
-    Ensures a sturdy structure for income results:
-    - monthly_income_thb as integer if possible
-    - basic fallback extraction from raw_text if model returned strings
+    Build step: quantize + merge once, save as safetensors on the cache volume.
+    Run with: modal run -m ttb_ride.ocr.olmocr_service_ttb_ride::build_snapshot
     """
-    parsed = parsed.copy() if isinstance(parsed, dict) else {}
-    # Holder
-    holder = parsed.get("holder_name") or ""
-    employer = parsed.get("employer") or ""
-    period = parsed.get("period") or ""
-
-    # Income normalization
-    income = parsed.get("monthly_income_thb")
-    if isinstance(income, str):
-        income = _parse_int_amount(income)
-
-    if not isinstance(income, int):
-        # try to fish from raw text
-        for m in _amount_pat.finditer(raw_text or ""):
-            cand = _parse_int_amount(m.group(1))
-            if cand and cand > 0:
-                # pick the first reasonable positive number
-                income = cand
-                break
-
-    out = {
-        "holder_name": holder,
-        "monthly_income_thb": income if isinstance(income, int) else None,
-        "employer": employer,
-        "period": period,
-    }
-    return out
+    import shutil
+
+    if _snapshot_ready() and not force:
+        print(f"[build_snapshot] already present: {SNAPSHOT_DIR}", flush=True)
+        return SNAPSHOT_DIR
+
+    shutil.rmtree(SNAPSHOT_DIR, ignore_errors=True)
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+
+    processor, model = _load_base_model()
+    model.save_pretrained(SNAPSHOT_DIR, safe_serialization=True, max_shard_size="2GB")
+    processor.save_pretrained(SNAPSHOT_DIR)
+    # marker last: a half-written snapshot is never picked up by setup()
+    with open(os.path.join(SNAPSHOT_DIR, SNAPSHOT_MARKER), "w") as f:
+        json.dump({"model": MODEL_ID, "adapter": ADAPTER_REPO, "revision": REVISION}, f)
+
+    hf_cache_volume.commit()
+    print(f"[build_snapshot] saved: {SNAPSHOT_DIR}", flush=True)
+    return SNAPSHOT_DIR
+
+def _delete_stored(digest: str) -> None:
+    for d in (image_store, image_expiry):
+        try:
+            d.pop(digest)
+        except KeyError:
+            pass
+
+@app.function(image=image, schedule=modal.Period(seconds=IMAGE_STORE_TTL_S))
+def sweep_image_store() -> int:
+    """Delete shared image copies past their expiry (and any written before expiries existed)."""
+    now = time.time()
+    stale = [d for d, expires in image_expiry.items() if expires < now]
+    if image_store.len() > image_expiry.len() - len(stale):
+        stale += [d for d in image_store.keys() if not image_expiry.contains(d)]
+    for digest in stale:
+        _delete_stored(digest)
+    return len(stale)
 
 # =========================
 # Remote Class
@@ -185,6 +284,8 @@ def normalize_income(parsed: dict | None, raw_text: str) -> dict:
     timeout=1800,
     min_containers=MIN_CONTAINERS,
     volumes={CACHE_DIR: hf_cache_volume},
+    enable_memory_snapshot=MEMORY_SNAPSHOT,
+    experimental_options={"enable_gpu_snapshot": True} if MEMORY_SNAPSHOT else None,
 )
 class OlmOCR:
     """
@@ -193,68 +294,58 @@ class OlmOCR:
       - ocr_id(...) for Thai National ID cards
       - ocr_income(...) for payslips/income docs
       - ocr(..., doc_type="id_card"|"income") for a single generic route
+      - ocr_stream(..., doc_type=...) streaming fields as they are decoded (generator)
     """
 
-    @modal.enter()
+    @modal.enter(snap=MEMORY_SNAPSHOT)
     def setup(self):
-        import torch
-        from transformers import AutoProcessor, Qwen2_5_VLForConditionalGeneration, BitsAndBytesConfig
-        from peft import PeftModel
-
-        # Processor
-        self.processor = AutoProcessor.from_pretrained(MODEL_ID, trust_remote_code=True)
-
-        # Quantization
-        quant_config = BitsAndBytesConfig(
-            load_in_4bit=True,
-            bnb_4bit_use_double_quant=True,
-            bnb_4bit_compute_dtype=torch.bfloat16,
-            bnb_4bit_quant_type="nf4",
-        )
-
-        # Load model (quantized if possible; fallback to fp16/fp32)
-        try:
-            self.model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
-                MODEL_ID,
-                trust_remote_code=True,
-                quantization_config=quant_config,
-                device_map="auto",
-                low_cpu_mem_usage=True,
-            )
-        except Exception:
-            torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
-            self.model = Qwen2_5_VLForConditionalGeneration.from_pretrained(
-                MODEL_ID,
-                trust_remote_code=True,
-                torch_dtype=torch_dtype,
-                device_map="auto",
-                low_cpu_mem_usage=True,
-            )
-
-        # Optional adapter
-        if ADAPTER_REPO:
-            self.model = PeftModel.from_pretrained(self.model, ADAPTER_REPO, revision=REVISION)
+        # Fast path: pre-quantized snapshot from `build_snapshot`; slow path: quantize on start.
+        if _snapshot_ready():
+            try:
+                self.processor, self.model = _load_snapshot_model()
+            except Exception as e:
+                print(f"[setup] snapshot load failed, falling back: {e}", flush=True)
+                self.processor, self.model = _load_base_model()
+        else:
+            self.processor, self.model = _load_base_model()
 
         self.model.eval()
+        self._images = OrderedDict()
+
+    def _resolve_image(self, image_bytes: bytes | None, image_digest: str | None) -> bytes | None:
+        """Bytes for this call: remember uploaded bytes by digest, or look a digest-only call up."""
+        if image_bytes is not None:
+            digest = hashlib.sha256(image_bytes).hexdigest()
+            if digest not in self._images:
+                # shared copy for other containers, written while this call runs
+                threading.Thread(target=_store_image, args=(digest, image_bytes), daemon=True).start()
+            self._remember_image(digest, image_bytes)
+            return image_bytes
+        if not image_digest:
+            return None
+        data = self._images.get(image_digest)
+        if data is None:
+            data = _stored_image(image_digest)
+        if data is not None:
+            self._remember_image(image_digest, data)
+        return data
+
+    def _remember_image(self, digest: str, data: bytes) -> None:
+        self._images[digest] = data
+        self._images.move_to_end(digest)
+        while len(self._images) > IMAGE_CACHE_SIZE:
+            self._images.popitem(last=False)
 
     # ---------------
     # Core run method
     # ---------------
-    def _run_generation(
-        self,
-        image_bytes: bytes,
-        system_prompt: str,
-        user_instruction: str,
-        max_new_tokens: int,
-        temperature: float,
-        top_p: float,
-        top_k: int,
-        repetition_penalty: float,
-    ) -> tuple[str, dict | None]:
-        import torch
+    def _prepare_inputs(self, image_bytes: bytes, system_prompt: str, user_instruction: str,
+                        doc_type: str | None, max_pixels: int | None):
         from PIL import Image
+        from ttb_ride.ocr.preprocess import prepare_for_ocr, estimate_vision_tokens
 
-        img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+        # crop/deskew + per-doc pixel budget: vision tokens (prefill cost) scale with area
+        img = prepare_for_ocr(Image.open(io.BytesIO(image_bytes)), doc_type=doc_type, max_pixels=max_pixels)
 
         messages = [
             {"role": "system", "content": [{"type": "text", "text": system_prompt.strip()}]},
@@ -284,6 +375,29 @@ class OlmOCR:
 
         device = next(self.model.parameters()).device
         inputs = {k: (v.to(device) if hasattr(v, "to") else v) for k, v in inputs.items()}
+        image_meta = {
+            "size": list(img.size),
+            "vision_tokens": estimate_vision_tokens(*img.size),
+            "input_tokens": int(inputs["input_ids"].shape[1]),
+        }
+        return inputs, image_meta
+
+    def _run_generation(
+        self,
+        image_bytes: bytes,
+        system_prompt: str,
+        user_instruction: str,
+        max_new_tokens: int,
+        temperature: float,
+        top_p: float,
+        top_k: int,
+        repetition_penalty: float,
+        doc_type: str | None = None,
+        max_pixels: int | None = None,
+    ) -> tuple[str, dict | None, dict]:
+        import torch
+
+        inputs, image_meta = self._prepare_inputs(image_bytes, system_prompt, user_instruction, doc_type, max_pixels)
 
         with torch.no_grad():
             output_ids = self.model.generate(
@@ -302,7 +416,81 @@ class OlmOCR:
         tokenizer = getattr(self.processor, "tokenizer", None) or self.processor
         raw_text = tokenizer.decode(gen_ids, skip_special_tokens=True)
         parsed = extract_json(raw_text)
-        return raw_text, parsed
+        return raw_text, parsed, image_meta
+
+    def _stream_generation(
+        self,
+        image_bytes: bytes,
+        system_prompt: str,
+        user_instruction: str,
+        max_new_tokens: int,
+        temperature: float,
+        top_p: float,
+        top_k: int,
+        repetition_penalty: float,
+        doc_type: str | None = None,
+        max_pixels: int | None = None,
+        required: tuple = (),
+    ):
+        """
+        Decode in a background thread and yield ("field", key, value) as top-level JSON fields close,
+        then ("done", raw, parsed, image_meta, stopped_early). Decoding stops once every `required`
+        field has been read (or the consumer goes away).
+        """
+        import threading
+        import torch
+        from transformers import TextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
+
+        inputs, image_meta = self._prepare_inputs(image_bytes, system_prompt, user_instruction, doc_type, max_pixels)
+        tokenizer = getattr(self.processor, "tokenizer", None) or self.processor
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=STREAM_TOKEN_TIMEOUT_S)
+        stop = threading.Event()
+
+        class _StopWhenSet(StoppingCriteria):
+            def __call__(self, input_ids, scores, **kwargs) -> bool:
+                return stop.is_set()
+
+        errors = []
+
+        def _generate():
+            try:
+                with torch.no_grad():
+                    self.model.generate(
+                        **inputs,
+                        max_new_tokens=int(max_new_tokens),
+                        do_sample=True,
+                        temperature=float(temperature),
+                        top_p=float(top_p),
+                        top_k=int(top_k),
+                        repetition_penalty=float(repetition_penalty),
+                        streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList([_StopWhenSet()]),
+                    )
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+
+        worker = threading.Thread(target=_generate, daemon=True)
+        worker.start()
+        fields = JSONFieldStream()
+        stopped_early = False
+        try:
+            for chunk in streamer:
+                for key, value in fields.feed(chunk):
+                    yield "field", key, value
+                if required and not stop.is_set() and all(k in fields.fields for k in required):
+                    stop.set()
+                    stopped_early = True
+        finally:
+            stop.set()  # also when the consumer closed the generator: free the GPU promptly
+            worker.join()
+        if errors:
+            raise errors[0]
+        raw_text = fields.text
+        parsed = extract_json(raw_text)
+        if not isinstance(parsed, dict):
+            parsed = dict(fields.fields)  # cut off after the required fields: keep what closed
+        yield "done", raw_text, parsed, image_meta, stopped_early
 
     # ----------------------------
     # Backwards-compatible generic
@@ -310,7 +498,7 @@ class OlmOCR:
     @modal.method()
     def ocr(
         self,
-        image_bytes: bytes,
+        image_bytes: bytes = None,
         instruction: str = "",
         doc_type: str = None,  # "id_card" | "income" | None
         max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS,
@@ -318,23 +506,30 @@ class OlmOCR:
         top_p: float = 0.9,
         top_k: int = 50,
         repetition_penalty: float = 1.1,
+        max_pixels: int = None,
+        image_digest: str = None,
     ) -> dict:
         """
         Generic OCR entrypoint.
         - If instruction is provided, it takes precedence (legacy behavior).
         - Else if doc_type in {"id_card","income"}, use the corresponding prompts.
         - Else fall back to ID card prompts for compatibility with older clients.
-        Returns: {"doc_type", "raw", "parsed", "normalized"?}
+        Returns: {"doc_type", "raw", "parsed", "normalized"?, "image"}
+        Digest-only calls (image_bytes=None) return {"error": "image_not_cached"} on a miss.
         """
+        image_bytes = self._resolve_image(image_bytes, image_digest)
+        if image_bytes is None:
+            return {"doc_type": doc_type or "custom", "error": "image_not_cached", "image_digest": image_digest}
         if instruction:
             # Manual override path
             sys_prompt = "You are an OCR assistant. Return ONLY valid JSON for the user's request."
             user_instruction = instruction
-            raw, parsed = self._run_generation(
+            raw, parsed, image_meta = self._run_generation(
                 image_bytes, sys_prompt, user_instruction,
-                max_new_tokens, temperature, top_p, top_k, repetition_penalty
+                max_new_tokens, temperature, top_p, top_k, repetition_penalty,
+                doc_type=doc_type, max_pixels=max_pixels,
             )
-            return {"doc_type": doc_type or "custom", "raw": raw, "parsed": parsed}
+            return {"doc_type": doc_type or "custom", "raw": raw, "parsed": parsed, "image": image_meta}
 
         # Automatic by doc_type
         kind = (doc_type or "id_card").strip().lower()
@@ -342,12 +537,13 @@ class OlmOCR:
             kind = "id_card"  # safe default
 
         sys_prompt, user_instruction = PROMPTS[kind]
-        raw, parsed = self._run_generation(
+        raw, parsed, image_meta = self._run_generation(
             image_bytes, sys_prompt, user_instruction,
-            max_new_tokens, temperature, top_p, top_k, repetition_penalty
+            max_new_tokens, temperature, top_p, top_k, repetition_penalty,
+            doc_type=kind, max_pixels=max_pixels,
         )
 
-        out = {"doc_type": kind, "raw": raw, "parsed": parsed}
+        out = {"doc_type": kind, "raw": raw, "parsed": parsed, "image": image_meta}
         if kind == "income":
             out["normalized"] = normalize_income(parsed, raw)
         return out
@@ -358,22 +554,28 @@ class OlmOCR:
     @modal.method()
     def ocr_id(
         self,
-        image_bytes: bytes,
+        image_bytes: bytes = None,
         max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS,
         temperature: float = 0.2,
         top_p: float = 0.9,
         top_k: int = 50,
         repetition_penalty: float = 1.1,
+        max_pixels: int = None,
+        image_digest: str = None,
     ) -> dict:
         """
         Thai National ID card OCR → fixed JSON keys.
-        Returns: { "doc_type": "id_card", "raw", "parsed" }
+        Returns: { "doc_type": "id_card", "raw", "parsed", "image" }
         """
-        raw, parsed = self._run_generation(
+        image_bytes = self._resolve_image(image_bytes, image_digest)
+        if image_bytes is None:
+            return {"doc_type": "id_card", "error": "image_not_cached", "image_digest": image_digest}
+        raw, parsed, image_meta = self._run_generation(
             image_bytes, ID_SYSTEM_PROMPT, ID_USER_INSTRUCTION,
-            max_new_tokens, temperature, top_p, top_k, repetition_penalty
+            max_new_tokens, temperature, top_p, top_k, repetition_penalty,
+            doc_type="id_card", max_pixels=max_pixels,
         )
-        return {"doc_type": "id_card", "raw": raw, "parsed": parsed}
+        return {"doc_type": "id_card", "raw": raw, "parsed": parsed, "image": image_meta}
 
     # ----------------------------
     # Dedicated Income route
@@ -381,24 +583,77 @@ class OlmOCR:
     @modal.method()
     def ocr_income(
         self,
-        image_bytes: bytes,
+        image_bytes: bytes = None,
         max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS,
         temperature: float = 0.2,
         top_p: float = 0.9,
         top_k: int = 50,
         repetition_penalty: float = 1.1,
+        max_pixels: int = None,
+        image_digest: str = None,
     ) -> dict:
         """
         Income proof / payslip OCR → numeric-friendly schema.
-        Returns: { "doc_type": "income", "raw", "parsed", "normalized" }
+        Returns: { "doc_type": "income", "raw", "parsed", "normalized", "image" }
         """
-        raw, parsed = self._run_generation(
+        image_bytes = self._resolve_image(image_bytes, image_digest)
+        if image_bytes is None:
+            return {"doc_type": "income", "error": "image_not_cached", "image_digest": image_digest}
+        raw, parsed, image_meta = self._run_generation(
             image_bytes, INCOME_SYSTEM_PROMPT, INCOME_USER_INSTRUCTION,
-            max_new_tokens, temperature, top_p, top_k, repetition_penalty
+            max_new_tokens, temperature, top_p, top_k, repetition_penalty,
+            doc_type="income", max_pixels=max_pixels,
         )
         return {
             "doc_type": "income",
             "raw": raw,
             "parsed": parsed,
             "normalized": normalize_income(parsed, raw),
+            "image": image_meta,
         }
+
+    # ----------------------------
+    # Streaming route
+    # ----------------------------
+    @modal.method()
+    def ocr_stream(
+        self,
+        image_bytes: bytes = None,
+        doc_type: str = "id_card",  # "id_card" | "income"
+        required: list = None,      # None: STREAM_REQUIRED[doc_type]; []: decode to the end
+        max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS,
+        temperature: float = 0.2,
+        top_p: float = 0.9,
+        top_k: int = 50,
+        repetition_penalty: float = 1.1,
+        max_pixels: int = None,
+        image_digest: str = None,
+    ):
+        """
+        Generator (call with .remote_gen): yields {"type": "field", "key", "value"} as each top-level
+        field of the JSON closes, then {"type": "done", ...} with the same keys as ocr_id / ocr_income
+        plus "stopped_early". A digest-only miss yields a single {"type": "error", "error": "image_not_cached"}.
+        """
+        kind = (doc_type or "id_card").strip().lower()
+        if kind not in PROMPTS:
+            kind = "id_card"
+        image_bytes = self._resolve_image(image_bytes, image_digest)
+        if image_bytes is None:
+            yield {"type": "error", "doc_type": kind, "error": "image_not_cached", "image_digest": image_digest}
+            return
+        sys_prompt, user_instruction = PROMPTS[kind]
+        needed = tuple(STREAM_REQUIRED[kind] if required is None else required)
+        for ev in self._stream_generation(
+            image_bytes, sys_prompt, user_instruction,
+            max_new_tokens, temperature, top_p, top_k, repetition_penalty,
+            doc_type=kind, max_pixels=max_pixels, required=needed,
+        ):
+            if ev[0] == "field":
+                yield {"type": "field", "doc_type": kind, "key": ev[1], "value": ev[2]}
+                continue
+            _, raw, parsed, image_meta, stopped_early = ev
+            out = {"type": "done", "doc_type": kind, "raw": raw, "parsed": parsed,
+                   "image": image_meta, "stopped_early": stopped_early}
+            if kind == "income":
+                out["normalized"] = normalize_income(parsed, raw)
+            yield out
@@ -0,0 +1,273 @@
+"""
+OCR output parsing shared by the Modal service and the app (no heavy imports).
+
+- extract_json: direct json.loads, else a linear balanced-brace scan for the first JSON object
+  (string/escape aware), instead of a greedy regex that backtracks on long outputs.
+- JSONFieldStream: the same object read incrementally from streamed output, one top-level field
+  at a time, so callers can act on a field before generation finishes.
+- rank_amounts / best_amount: one pass over the text collecting Thai/Arabic-numeral amounts,
+  ranked by proximity to salary keywords (เงินเดือน, รายได้สุทธิ, ...) on the same or previous line.
+- normalize_income: the income schema the service returns, with best_amount as the raw-text fallback,
+  so cached raw outputs can be re-normalized client-side without a GPU call.
+"""
+import json, re
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+THAI_DIGITS = str.maketrans("๐๑๒๓๔๕๖๗๘๙", "0123456789")
+
+def to_arabic_digits(s: str) -> str:
+    return (s or "").translate(THAI_DIGITS)
+
+
+# ---------- JSON ----------
+_JSON_TOKEN_RE = re.compile(r'\\.|["{}]', re.DOTALL)
+MAX_SCAN_RESTARTS = 4  # unbalanced "{" in prose: retry from the next few "{" only (stays linear)
+
+def iter_json_spans(text: str) -> Iterator[Tuple[int, int]]:
+    """(start, end) of top-level balanced {...} spans, skipping braces inside JSON strings."""
+    pos, restarts = 0, 0
+    while True:
+        start = text.find("{", pos)
+        if start < 0:
+            return
+        depth, in_str = 0, False
+        for m in _JSON_TOKEN_RE.finditer(text, start):
+            tok = m.group()
+            if in_str:
+                in_str = tok != '"'
+            elif tok == '"':
+                in_str = True
+            elif tok == "{":
+                depth += 1
+            elif tok == "}":
+                depth -= 1
+                if depth == 0:
+                    yield start, m.end()
+                    pos = m.end()
+                    break
+        else:
+            # ran off the end inside an object: the "{" at `start` was unbalanced
+            restarts += 1
+            if restarts > MAX_SCAN_RESTARTS:
+                return
+            pos = start + 1
+
+def extract_json(text: str) -> Any:
+    text = (text or "").strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    # common case: one object wrapped in prose/fences -> a single C-speed parse of first "{" .. last "}"
+    s, e = text.find("{"), text.rfind("}")
+    if 0 <= s < e:
+        try:
+            obj = json.loads(text[s:e + 1])
+            if isinstance(obj, dict):
+                return obj
+        except ValueError:
+            pass
+    for s, e in iter_json_spans(text):
+        try:
+            obj = json.loads(text[s:e])
+        except ValueError:
+            continue
+        if isinstance(obj, dict):
+            return obj
+    return None
+
+
+class JSONFieldStream:
+    """
+    Incremental reader for the first JSON object in streamed model output: feed() text chunks,
+    get back the top-level (key, value) pairs whose value closed in them. Each char is scanned once.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.fields: Dict[str, Any] = {}
+        self._i = 0
+        self._state = "seek"   # seek -> key -> in_key -> colon -> value -> in_value -> after_value ... -> done
+        self._start = 0        # start of the key/value being read
+        self._key: Optional[str] = None
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+
+    def _emit(self, end: int, out: List[Tuple[str, Any]]) -> None:
+        try:
+            value = json.loads(self.text[self._start:end])
+        except ValueError:
+            return
+        if self._key is not None:
+            self.fields[self._key] = value
+            out.append((self._key, value))
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self.text += chunk
+        t, out = self.text, []
+        for i in range(self._i, len(t)):
+            c, st = t[i], self._state
+            if st == "in_value":
+                if self._in_str:
+                    if self._esc:
+                        self._esc = False
+                    elif c == "\\":
+                        self._esc = True
+                    elif c == '"':
+                        self._in_str = False
+                        if self._depth == 0:
+                            self._emit(i + 1, out); self._state = "after_value"
+                elif c == '"':
+                    self._in_str = True
+                elif c in "{[":
+                    self._depth += 1
+                elif c in "}]" and self._depth > 0:
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._emit(i + 1, out); self._state = "after_value"
+                elif self._depth == 0 and (c in ",}" or c.isspace()):
+                    # a number/true/false/null ends at the next delimiter
+                    self._emit(i, out)
+                    self._state = {",": "key", "}": "done"}.get(c, "after_value")
+            elif st == "seek":
+                if c == "{":
+                    self._state = "key"
+            elif st == "key" or st == "after_value":
+                if c == '"' and st == "key":
+                    self._state, self._start, self._esc = "in_key", i, False
+                elif c == ",":
+                    self._state = "key"
+                elif c == "}":
+                    self._state = "done"
+            elif st == "in_key":
+                if self._esc:
+                    self._esc = False
+                elif c == "\\":
+                    self._esc = True
+                elif c == '"':
+                    try:
+                        self._key = json.loads(t[self._start:i + 1])
+                    except ValueError:
+                        self._key = None
+                    self._state = "colon"
+            elif st == "colon":
+                if c == ":":
+                    self._state = "value"
+            elif st == "value":
+                if not c.isspace():
+                    self._state, self._start, self._esc = "in_value", i, False
+                    self._in_str, self._depth = c == '"', 1 if c in "{[" else 0
+            else:  # done
+                break
+        self._i = len(t)
+        return out
+
+
+# ---------- amounts ----------
+# keyword -> weight; negative weights mark deduction/identifier lines
+AMOUNT_KEYWORDS: Dict[str, float] = {
+    "รายได้สุทธิ": 3.0, "เงินได้สุทธิ": 3.0, "รับสุทธิ": 3.0, "เงินเดือนสุทธิ": 3.0,
+    "net pay": 3.0, "net income": 3.0, "net salary": 3.0,
+    "เงินเดือน": 2.5, "salary": 2.5, "monthly income": 2.5, "รายได้ต่อเดือน": 2.5,
+    "รายได้รวม": 2.0, "รวมรายได้": 2.0, "total income": 2.0, "gross": 1.5, "รายได้": 1.0, "income": 1.0,
+    "หัก": -2.0, "ภาษี": -2.0, "ประกันสังคม": -2.0, "กองทุน": -1.5, "deduction": -2.0, "tax": -2.0,
+    "social security": -2.0, "โทร": -3.0, "tel": -3.0, "เลขที่": -3.0, "บัญชี": -3.0, "account": -3.0,
+}
+AMOUNT_RANGE = (1_000, 5_000_000)  # plausible monthly THB
+_NUM = r"[0-9๐-๙](?:[0-9๐-๙,]*[0-9๐-๙])?(?:\.[0-9๐-๙]+)?"
+def _kw_pattern(k: str) -> str:
+    # English keywords need word boundaries ("tel" in "hotel"); Thai has no spaces to anchor on
+    return rf"(?<![A-Za-z]){re.escape(k)}(?![A-Za-z])" if k.isascii() else re.escape(k)
+
+_AMOUNT_TOKEN_RE = re.compile(
+    r"(?P<kw>" + "|".join(_kw_pattern(k) for k in sorted(AMOUNT_KEYWORDS, key=len, reverse=True)) + r")"
+    r"|(?P<num>" + _NUM + r")|(?P<nl>\n)",
+    re.IGNORECASE,
+)
+_CURRENCY_RE = re.compile(r"\s*(?:บาท|THB|฿)", re.IGNORECASE)
+_KW_WEIGHT = {k.lower(): w for k, w in AMOUNT_KEYWORDS.items()}
+
+
+class AmountCandidate(NamedTuple):
+    value: int
+    score: float
+    pos: int
+    keyword: str   # salary keyword it is anchored to ("" if none)
+
+
+def parse_int_amount(s: str) -> Optional[int]:
+    """Integer amount from a string; tolerant of commas, Thai digits, and decimals."""
+    if not s:
+        return None
+    s = to_arabic_digits(s).replace(",", "")
+    try:
+        return int(float(s))
+    except ValueError:
+        return None
+
+def _looks_like_year(tok: str, value: int) -> bool:
+    return "," not in tok and "." not in tok and (1900 <= value <= 2100 or 2400 <= value <= 2700)
+
+def rank_amounts(text: str) -> List[AmountCandidate]:
+    """All plausible amounts in `text`, best first (single pass over the text)."""
+    text = text or ""
+    out: List[AmountCandidate] = []
+    line_kw, line_w, line_end = "", 0.0, 0      # strongest keyword on the current line
+    prev_kw, prev_w = "", 0.0                   # ... and on the previous line (table layouts)
+    for m in _AMOUNT_TOKEN_RE.finditer(text):
+        kind = m.lastgroup
+        if kind == "nl":
+            prev_kw, prev_w = line_kw, line_w
+            line_kw, line_w = "", 0.0
+            continue
+        if kind == "kw":
+            w = _KW_WEIGHT[m.group().lower()]
+            # a deduction/identifier keyword taints the line; otherwise keep the strongest
+            if w < 0 or (line_w >= 0 and w > line_w) or not line_kw:
+                line_kw, line_w = m.group(), w
+            line_end = m.end()
+            continue
+        tok = m.group()
+        value = parse_int_amount(tok)
+        if value is None or not (AMOUNT_RANGE[0] <= value <= AMOUNT_RANGE[1]) or _looks_like_year(tok, value):
+            continue
+        if line_kw:
+            kw, w = line_kw, line_w / (1.0 + max(0, m.start() - line_end) / 40.0)
+        elif prev_kw:
+            kw, w = prev_kw, prev_w * 0.5
+        else:
+            kw, w = "", 0.0
+        score = w
+        score += 0.3 if "," in tok else 0.0
+        score += 0.3 if _CURRENCY_RE.match(text, m.end()) else 0.0
+        score += 0.1 if "." in tok else 0.0
+        out.append(AmountCandidate(value, score, m.start(), kw if w > 0 else ""))
+    out.sort(key=lambda c: (-c.score, c.pos))
+    return out
+
+def best_amount(text: str) -> Optional[int]:
+    ranked = rank_amounts(text)
+    return ranked[0].value if ranked else None
+
+
+def normalize_income(parsed: Optional[dict], raw_text: str) -> dict:
+    """
+    Ensures a sturdy structure for income results:
+    - monthly_income_thb as integer if possible
+    - ranked keyword-anchored fallback from raw_text if the model returned strings
+    """
+    parsed = parsed.copy() if isinstance(parsed, dict) else {}
+    income = parsed.get("monthly_income_thb")
+    if isinstance(income, float):
+        income = int(income)
+    elif isinstance(income, str):
+        income = parse_int_amount(income)
+    if not isinstance(income, int) or isinstance(income, bool) or income <= 0:
+        income = best_amount(raw_text)
+    return {
+        "holder_name": parsed.get("holder_name") or "",
+        "monthly_income_thb": income if isinstance(income, int) else None,
+        "employer": parsed.get("employer") or "",
+        "period": parsed.get("period") or "",
+    }
@@ -0,0 +1,137 @@
+import io, os
+from typing import BinaryIO, Optional, Tuple, Union
+from PIL import Image, ImageChops, ImageOps
+
+# Qwen2.5-VL: 14px patches merged 2x2 -> one vision token per 28x28 pixels
+VISION_PATCH = 28
+
+def _env_pixels(var_name: str, default: int) -> int:
+    return int(os.getenv(var_name, str(default)))
+
+# (min_pixels, max_pixels) per doc type; ID text is large, payslips need more detail
+PIXEL_BUDGETS = {
+    "id_card": (_env_pixels("OCR_ID_MIN_PIXELS", 256 * 28 * 28), _env_pixels("OCR_ID_MAX_PIXELS", 768 * 28 * 28)),
+    "income":  (_env_pixels("OCR_INCOME_MIN_PIXELS", 256 * 28 * 28), _env_pixels("OCR_INCOME_MAX_PIXELS", 1280 * 28 * 28)),
+}
+DEFAULT_BUDGET = PIXEL_BUDGETS["id_card"]
+
+# client-side re-encode quality (text must stay legible)
+UPLOAD_JPEG_QUALITY = int(os.getenv("OCR_UPLOAD_JPEG_QUALITY", "90"))
+
+
+def pixel_budget(doc_type: Optional[str], max_pixels: Optional[int] = None) -> Tuple[int, int]:
+    lo, hi = PIXEL_BUDGETS.get((doc_type or "").strip().lower(), DEFAULT_BUDGET)
+    if max_pixels:
+        hi = int(max_pixels)
+        lo = min(lo, hi)
+    return lo, hi
+
+def estimate_vision_tokens(width: int, height: int) -> int:
+    return max(1, round(width / VISION_PATCH)) * max(1, round(height / VISION_PATCH))
+
+def autocrop(img: Image.Image, tol: int = 24, min_keep: float = 0.35) -> Image.Image:
+    """
+    Trim a near-uniform background around the card/page (colour sampled from the corners).
+    Keeps the original if the detected box is implausibly small.
+    """
+    w, h = img.size
+    corners = [img.getpixel(p) for p in ((0, 0), (w - 1, 0), (0, h - 1), (w - 1, h - 1))]
+    bg_color = tuple(sorted(c[i] for c in corners)[1] for i in range(3))
+    diff = ImageChops.difference(img, Image.new("RGB", img.size, bg_color)).convert("L")
+    bbox = diff.point(lambda v: 255 if v > tol else 0).getbbox()
+    if not bbox:
+        return img
+    bw, bh = bbox[2] - bbox[0], bbox[3] - bbox[1]
+    if bw * bh < min_keep * w * h:
+        return img
+    pad = max(2, int(0.01 * max(bw, bh)))
+    return img.crop((max(0, bbox[0] - pad), max(0, bbox[1] - pad), min(w, bbox[2] + pad), min(h, bbox[3] + pad)))
+
+def _row_profile_score(gray: Image.Image) -> float:
+    # squash to a single column -> per-row mean ink; text lines aligned => high variance
+    col = gray.resize((1, gray.size[1]), Image.BOX)
+    vals = list(col.getdata())
+    mean = sum(vals) / len(vals)
+    return sum((v - mean) ** 2 for v in vals)
+
+def estimate_skew(img: Image.Image, max_angle: float = 6.0, step: float = 1.0) -> float:
+    """Projection-profile skew estimate on a small grayscale thumbnail (degrees, CCW)."""
+    gray = ImageOps.invert(img.convert("L"))
+    gray.thumbnail((400, 400))
+    best_angle, best_score = 0.0, _row_profile_score(gray)
+    a = -max_angle
+    while a <= max_angle + 1e-9:
+        if abs(a) > 1e-9:
+            score = _row_profile_score(gray.rotate(a, resample=Image.BILINEAR, fillcolor=0))
+            if score > best_score * 1.02:
+                best_angle, best_score = a, score
+        a += step
+    return best_angle
+
+def deskew(img: Image.Image, max_angle: float = 6.0) -> Image.Image:
+    angle = estimate_skew(img, max_angle=max_angle)
+    if not angle:
+        return img
+    return img.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=(255, 255, 255))
+
+def fit_pixels(img: Image.Image, min_pixels: int, max_pixels: int) -> Image.Image:
+    """Scale so w*h lands in [min_pixels, max_pixels], sides snapped to the vision patch grid."""
+    w, h = img.size
+    area = w * h
+    scale = 1.0
+    if area > max_pixels:
+        scale = (max_pixels / area) ** 0.5
+    elif area < min_pixels:
+        scale = (min_pixels / area) ** 0.5
+    nw = max(VISION_PATCH, int(w * scale) // VISION_PATCH * VISION_PATCH)
+    nh = max(VISION_PATCH, int(h * scale) // VISION_PATCH * VISION_PATCH)
+    if (nw, nh) == (w, h):
+        return img
+    return img.resize((nw, nh), Image.LANCZOS)
+
+def prepare_for_ocr(img: Image.Image, doc_type: Optional[str] = None, max_pixels: Optional[int] = None,
+                    crop: bool = True, straighten: bool = True) -> Image.Image:
+    """Service-side stage: orientation -> crop to card/page -> deskew -> pixel budget."""
+    img = ImageOps.exif_transpose(img).convert("RGB")
+    if crop:
+        img = autocrop(img)
+    if straighten:
+        img = deskew(img)
+    lo, hi = pixel_budget(doc_type, max_pixels)
+    return fit_pixels(img, lo, hi)
+
+def shrink_for_upload(src: Union[bytes, BinaryIO], doc_type: Optional[str] = None, max_pixels: Optional[int] = None,
+                      crop: bool = True) -> bytes:
+    """
+    Client-side stage: crop to the card/page, downscale to the doc budget and re-encode as JPEG
+    before upload. Cropping first gives the whole budget to the document: shrinking the full
+    frame would leave the card only its share of it after the service's own autocrop.
+    `src` is raw bytes or a seekable binary buffer (e.g. an mmap of the upload, decoded in place).
+    Returns the original bytes when that is already smaller (or not decodable).
+    """
+    raw = src if isinstance(src, bytes) else None
+    try:
+        img = Image.open(io.BytesIO(raw) if raw is not None else src)
+        img = ImageOps.exif_transpose(img).convert("RGB")
+    except Exception:
+        return raw if raw is not None else _read_all(src)
+    if crop:
+        img = autocrop(img)
+    _, hi = pixel_budget(doc_type, max_pixels)
+    w, h = img.size
+    if w * h > hi:
+        s = (hi / float(w * h)) ** 0.5
+        img = img.resize((max(1, int(w * s)), max(1, int(h * s))), Image.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=UPLOAD_JPEG_QUALITY, optimize=True)
+    out = buf.getvalue()
+    if raw is None:
+        src.seek(0, io.SEEK_END)
+        if len(out) < src.tell():
+            return out
+        return _read_all(src)
+    return out if len(out) < len(raw) else raw
+
+def _read_all(src: BinaryIO) -> bytes:
+    src.seek(0)
+    return src.read()
@@ -0,0 +1,72 @@
+"""
+Accuracy vs. vision-token report for OCR pixel budgets.
+
+Input: a JSONL file of labelled samples, one per line:
+  {"path": "ids/001.jpg", "doc_type": "id_card", "expected": {"National Identification Number": "1 1037 02071 81 1"}}
+
+Usage (from repo root):
+  python -m ttb_ride.ocr.preprocess_report samples.jsonl --max-pixels 401408,602112,1003520
+"""
+import argparse, json, re, time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .ocr_agent import OlmOCRClient
+
+
+def _norm(v: Any) -> str:
+    return re.sub(r"[\s,]+", "", str(v if v is not None else "")).lower()
+
+def _field_hits(expected: Dict[str, Any], out: Dict[str, Any]) -> tuple[int, int]:
+    got = {}
+    got.update(out.get("parsed") or {})
+    got.update({k: v for k, v in (out.get("normalized") or {}).items() if v not in (None, "")})
+    hits = sum(1 for k, v in expected.items() if _norm(got.get(k)) == _norm(v))
+    return hits, len(expected)
+
+def run_report(samples: List[Dict[str, Any]], settings: List[Optional[int]], base_dir: Path) -> List[Dict[str, Any]]:
+    client = OlmOCRClient()
+    rows = []
+    for max_pixels in settings:
+        for doc_type in sorted({s.get("doc_type", "id_card") for s in samples}):
+            subset = [s for s in samples if s.get("doc_type", "id_card") == doc_type]
+            hits = total = tokens = 0
+            secs = 0.0
+            for s in subset:
+                path = Path(s["path"])
+                if not path.is_absolute():
+                    path = base_dir / path
+                kwargs = {"max_pixels": max_pixels} if max_pixels else {}
+                t0 = time.perf_counter()
+                out = client.ocr(str(path), doc_type=doc_type, **kwargs)
+                secs += time.perf_counter() - t0
+                h, n = _field_hits(s.get("expected") or {}, out)
+                hits += h; total += n
+                tokens += int((out.get("image") or {}).get("vision_tokens") or 0)
+            rows.append({
+                "doc_type": doc_type,
+                "max_pixels": max_pixels or "default",
+                "samples": len(subset),
+                "field_accuracy": round(hits / max(1, total), 3),
+                "avg_vision_tokens": round(tokens / max(1, len(subset))),
+                "avg_latency_s": round(secs / max(1, len(subset)), 2),
+            })
+    return rows
+
+def to_markdown(rows: List[Dict[str, Any]]) -> str:
+    cols = ["doc_type", "max_pixels", "samples", "field_accuracy", "avg_vision_tokens", "avg_latency_s"]
+    lines = ["| " + " | ".join(cols) + " |", "|" + "---|" * len(cols)]
+    lines += ["| " + " | ".join(str(r[c]) for c in cols) + " |" for r in rows]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("samples", help="JSONL with path/doc_type/expected")
+    ap.add_argument("--max-pixels", default="", help="comma-separated max_pixels settings (empty = doc default)")
+    args = ap.parse_args()
+
+    samples_path = Path(args.samples)
+    samples = [json.loads(l) for l in samples_path.read_text(encoding="utf-8").splitlines() if l.strip()]
+    settings = [int(x) for x in args.max_pixels.split(",") if x.strip()] or [None]
+    print(to_markdown(run_report(samples, settings, samples_path.parent)))
@@ -0,0 +1,132 @@
+"""
+Semantic cache for general-chat answers (repeated FAQ-style questions skip the LLM call).
+
+The latest user message is embedded with sentence-transformers (multilingual MiniLM by default)
+and compared by cosine similarity against an in-memory matrix of cached questions; a hit at or
+above SEMCACHE_MIN_SIM returns the stored answer. Entries expire after SEMCACHE_TTL_S, and at
+SEMCACHE_MAX_ENTRIES the least recently used entry is replaced.
+
+Only sessions without application context use it (no uploads, decision, approval or loan
+intent), and only a session's first question is looked up (before the intent gate) or stored, so
+a cached answer never depends on someone's documents or earlier turns. Messages with long digit runs (ID/phone
+numbers) are never cached. SEMCACHE=off disables it; without sentence-transformers it stays off.
+"""
+import os, re, threading, time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+SEMCACHE = os.getenv("SEMCACHE", "on").strip().lower() != "off"
+SEMCACHE_MODEL = os.getenv("SEMCACHE_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+SEMCACHE_MIN_SIM = float(os.getenv("SEMCACHE_MIN_SIM", "0.9"))
+SEMCACHE_TTL_S = float(os.getenv("SEMCACHE_TTL_S", "3600"))
+SEMCACHE_MAX_ENTRIES = int(os.getenv("SEMCACHE_MAX_ENTRIES", "512"))
+SEMCACHE_MAX_CHARS = 300  # longer messages are rarely repeats
+
+_PII_RE = re.compile(r"\d[\d\s-]{7,}\d")
+
+
+class SemanticCache:
+    def __init__(self, embed=None, min_sim: float = SEMCACHE_MIN_SIM, ttl_s: float = SEMCACHE_TTL_S,
+                 max_entries: int = SEMCACHE_MAX_ENTRIES):
+        self._embed_fn = embed          # texts -> (n, dim) array; default: sentence-transformers
+        self.min_sim, self.ttl_s, self.cap = min_sim, ttl_s, max(1, max_entries)
+        self._lock = threading.Lock()
+        self._vecs: Optional[np.ndarray] = None   # (cap, dim), unit rows
+        self._expires = np.zeros(self.cap)        # 0 = empty slot
+        self._last_used = np.zeros(self.cap)
+        self._questions: List[str] = [""] * self.cap
+        self._answers: List[str] = [""] * self.cap
+        self._failed = False
+        self.stats = {"hits": 0, "misses": 0, "stores": 0}
+
+    # ---- embedding ----
+    def ready(self) -> bool:
+        """Load the embedding model (once); False if it is unavailable."""
+        if self._embed_fn is not None or self._failed:
+            return not self._failed
+        with self._lock:
+            if self._embed_fn is None and not self._failed:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    model = SentenceTransformer(SEMCACHE_MODEL, device="cpu")
+                    self._embed_fn = lambda texts: model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+                except Exception as e:
+                    print(f"[semantic_cache] disabled ({type(e).__name__}: {e})", flush=True)
+                    self._failed = True
+        return not self._failed
+
+    def _embed(self, text: str) -> np.ndarray:
+        v = np.asarray(self._embed_fn([text]), dtype=np.float32)[0]
+        return v / (np.linalg.norm(v) or 1.0)
+
+    # ---- index ----
+    def _best(self, q: np.ndarray, now: float) -> Tuple[int, float]:
+        if self._vecs is None:
+            return -1, 0.0
+        sims = self._vecs @ q
+        sims[self._expires <= now] = -1.0
+        i = int(np.argmax(sims))
+        return i, float(sims[i])
+
+    def lookup(self, text: str) -> Optional[Tuple[str, float, float]]:
+        """(answer, similarity, age_s) of the closest live entry at/above min_sim, else None."""
+        if not self.ready():
+            return None
+        q = self._embed(text)
+        now = time.time()
+        with self._lock:
+            i, sim = self._best(q, now)
+            if i < 0 or sim < self.min_sim:
+                self.stats["misses"] += 1
+                return None
+            self._last_used[i] = now
+            self.stats["hits"] += 1
+            return self._answers[i], min(sim, 1.0), float(now - (self._expires[i] - self.ttl_s))
+
+    def store(self, text: str, answer: str) -> None:
+        if not answer or not self.ready():
+            return
+        q = self._embed(text)
+        now = time.time()
+        with self._lock:
+            if self._vecs is None:
+                self._vecs = np.zeros((self.cap, q.shape[0]), dtype=np.float32)
+            i, sim = self._best(q, now)
+            if i < 0 or sim < self.min_sim:
+                free = np.flatnonzero(self._expires <= now)
+                i = int(free[0]) if free.size else int(np.argmin(self._last_used))  # else evict LRU
+            self._vecs[i] = q
+            self._expires[i] = now + self.ttl_s
+            self._last_used[i] = now
+            self._questions[i], self._answers[i] = text, answer
+            self.stats["stores"] += 1
+
+    def __len__(self) -> int:
+        return int((self._expires > time.time()).sum())
+
+
+def cacheable_message(text: str) -> bool:
+    text = (text or "").strip()
+    return 0 < len(text) <= SEMCACHE_MAX_CHARS and not _PII_RE.search(text)
+
+def no_application_context(state: dict) -> bool:
+    """True while the session has nothing of its own an answer could depend on."""
+    docs = state.get("docs", {})
+    flags = state.get("flags", {})
+    return (not any((docs.get(k) or {}).get("path") or (docs.get(k) or {}).get("ok") for k in ("bike", "income", "id"))
+            and not state.get("decision")
+            and not flags.get("approved_once")
+            and not state.get("ui", {}).get("show_uploads")
+            and not state.get("intent", {}).get("motorcycle_loan_intent"))
+
+
+_CACHE: Optional[SemanticCache] = None
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    global _CACHE
+    if not SEMCACHE:
+        return None
+    if _CACHE is None:
+        _CACHE = SemanticCache()
+    return _CACHE
@@ -0,0 +1,72 @@
+"""
+Compact (de)serialization for session state and LangGraph checkpoints.
+
+State is plain JSON-able data, so it is packed with msgpack when installed (`pip install msgpack`)
+or compact JSON otherwise. Anything else (e.g. Send objects in a checkpoint) goes through
+LangGraph's JsonPlusSerializer, so this is a drop-in `serde=` for any checkpointer.
+"""
+import json, sys
+from typing import Any, Tuple
+
+try:
+    import msgpack
+except ImportError:  # optional speed-up
+    msgpack = None
+
+ROLES = {r: sys.intern(r) for r in ("user", "assistant", "system")}
+
+
+def intern_roles(state: Any) -> Any:
+    """Share one string object per role across all sessions' messages after a load."""
+    if isinstance(state, dict) and isinstance(state.get("messages"), list):
+        state["messages"] = [(ROLES.get(m[0], m[0]), m[1]) for m in state["messages"]]
+    return state
+
+# type tags distinct from JsonPlusSerializer's own "json"/"msgpack"
+MSGPACK_TAG, JSON_TAG = "ttb-msgpack", "ttb-json"
+
+def _pack(obj: Any) -> Tuple[str, bytes]:
+    if msgpack is not None:
+        return MSGPACK_TAG, msgpack.packb(obj, use_bin_type=True)
+    return JSON_TAG, json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _unpack(kind: str, data: bytes) -> Any:
+    if kind == MSGPACK_TAG:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+    return json.loads(data)
+
+def dumps_state(state: Any) -> bytes:
+    kind, data = _pack(state)
+    return (b"m" if kind == MSGPACK_TAG else b"j") + data  # 1-byte format tag
+
+def loads_state(blob: bytes) -> Any:
+    return intern_roles(_unpack(MSGPACK_TAG if blob[:1] == b"m" else JSON_TAG, blob[1:]))
+
+
+class CompactSerializer:
+    """LangGraph SerializerProtocol: msgpack/JSON fast path, JsonPlusSerializer for the rest."""
+
+    def __init__(self):
+        from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+        self.fallback = JsonPlusSerializer()
+
+    def dumps(self, obj: Any) -> bytes:
+        return self.fallback.dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return self.fallback.loads(data)
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        try:
+            return _pack(obj)
+        except (TypeError, ValueError, OverflowError):
+            return self.fallback.dumps_typed(obj)
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        kind, payload = data
+        if kind in (MSGPACK_TAG, JSON_TAG):
+            obj = _unpack(kind, payload)
+            if isinstance(obj, dict) and isinstance(obj.get("channel_values"), dict):
+                intern_roles(obj["channel_values"])
+            return obj
+        return self.fallback.loads_typed(data)
@@ -0,0 +1,272 @@
+"""
+Session state outside the app process, so any worker can serve any event of a session.
+
+SESSION_STORE=memory (default) keeps the single-process behaviour.
+SESSION_STORE=sqlite shares state (and LangGraph checkpoints, if langgraph-checkpoint-sqlite
+is installed) between workers on one host through a SQLite database in WAL mode.
+
+Every save bumps the session's version. update() is the read-modify-write handlers use: it holds
+the session's lease (a per-session lock; for SQLite a row in `leases`, so it also holds across
+workers) while it loads, runs the step once and saves, so events of one session run one after
+another and a graph run is never repeated. An event that cannot get the lease within
+SESSION_LEASE_WAIT_S raises SessionBusy; a save that still finds a newer version (a lease that
+expired after SESSION_LEASE_S without renewal) raises SessionConflict. Front ends answer both with
+SESSION_BUSY_MSG. Sessions idle for SESSION_TTL_S are
+purged every SESSION_PURGE_EVERY_S from save(); the memory store also keeps at most
+SESSION_MEMORY_MAX sessions. on_purge(fn) callbacks get the ids of purged or evicted sessions
+(e.g. to delete their uploads).
+"""
+import copy, json, os, sqlite3, threading, time, uuid, weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from ttb_ride.config import CACHE_DIR
+from ttb_ride.serde import dumps_state, loads_state, intern_roles, CompactSerializer
+from ttb_ride.state import TState, new_state
+
+SESSION_STORE = os.getenv("SESSION_STORE", "memory").strip().lower()
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", str(CACHE_DIR / "sessions.sqlite3"))
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", str(CACHE_DIR / "checkpoints.sqlite3"))
+SESSION_TTL_S = int(os.getenv("SESSION_TTL_S", str(24 * 3600)))
+SESSION_PURGE_EVERY_S = float(os.getenv("SESSION_PURGE_EVERY_S", "600"))
+SESSION_MEMORY_MAX = int(os.getenv("SESSION_MEMORY_MAX", "10000"))
+SESSION_LEASE_S = float(os.getenv("SESSION_LEASE_S", "60"))  # renewed every third of it while held
+SESSION_LEASE_WAIT_S = float(os.getenv("SESSION_LEASE_WAIT_S", "120"))
+
+SESSION_BUSY_MSG = "ระบบยังประมวลผลคำขอก่อนหน้าของคุณอยู่ โปรดลองอีกครั้งในอีกสักครู่ครับ/ค่ะ"
+
+
+class SessionConflict(RuntimeError):
+    """The session was saved by another event after this one loaded it."""
+
+class SessionBusy(SessionConflict):
+    """Another event held the session's lease for longer than SESSION_LEASE_WAIT_S."""
+
+
+class _SessionStore:
+    """Read-modify-write under a per-session lease, compare-and-swap on the version, purging on a timer."""
+
+    def __init__(self):
+        self._next_purge = 0.0
+        self._purge_listeners: List[Callable[[List[str]], None]] = []
+        self._sid_locks: "weakref.WeakValueDictionary[str, threading.Lock]" = weakref.WeakValueDictionary()
+        self._sid_locks_guard = threading.Lock()
+
+    def on_purge(self, fn: Callable[[List[str]], None]) -> None:
+        self._purge_listeners.append(fn)
+
+    def _purged(self, sids: List[str]) -> None:
+        for fn in self._purge_listeners if sids else ():
+            try:
+                fn(sids)
+            except Exception as e:
+                print(f"[session_store] purge listener failed: {type(e).__name__}: {e}", flush=True)
+
+    def load(self, sid: str) -> TState:
+        return self.load_versioned(sid)[0]
+
+    def _sid_lock(self, sid: str) -> threading.Lock:
+        with self._sid_locks_guard:
+            lock = self._sid_locks.get(sid)
+            if lock is None:
+                lock = self._sid_locks[sid] = threading.Lock()
+            return lock
+
+    @contextmanager
+    def lease(self, sid: str, wait_s: float = SESSION_LEASE_WAIT_S) -> Iterator[None]:
+        """Hold the session against other events of it (this process only; see SQLiteSessionStore)."""
+        lock = self._sid_lock(sid)
+        if not lock.acquire(timeout=max(0.0, wait_s)):
+            raise SessionBusy(sid)
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def update(self, sid: str, step: Callable[[TState], TState]) -> TState:
+        """Under the session's lease: load, st = step(st) (run once), save."""
+        with self.lease(sid):
+            st, version = self.load_versioned(sid)
+            st = step(st)
+            self.save(sid, st, version)
+            return st
+
+    def _maybe_purge(self) -> None:
+        now = time.time()
+        if now >= self._next_purge:
+            self._next_purge = now + SESSION_PURGE_EVERY_S
+            self.purge_expired()
+
+
+class MemorySessionStore(_SessionStore):
+    """States are copied in and out, so concurrent events of a session only share what they save."""
+
+    def __init__(self, max_sessions: int = SESSION_MEMORY_MAX):
+        super().__init__()
+        self._data: "OrderedDict[str, Tuple[TState, int, float]]" = OrderedDict()  # sid -> (state, version, updated)
+        self.max_sessions = max(1, max_sessions)
+        self._lock = threading.Lock()
+
+    def load_versioned(self, sid: str) -> Tuple[TState, int]:
+        with self._lock:
+            row = self._data.get(sid)
+        if row is None:
+            return new_state(), 0
+        return copy.deepcopy(row[0]), row[1]
+
+    def save(self, sid: str, state: TState, version: Optional[int] = None) -> None:
+        """Store `state`; with `version`, only if the session is still at that version."""
+        snapshot, evicted = copy.deepcopy(state), []
+        with self._lock:
+            current = self._data[sid][1] if sid in self._data else 0
+            if version is not None and version != current:
+                raise SessionConflict(sid)
+            self._data[sid] = (snapshot, current + 1, time.time())
+            self._data.move_to_end(sid)
+            while len(self._data) > self.max_sessions:
+                evicted.append(self._data.popitem(last=False)[0])  # least recently saved
+        self._purged(evicted)
+        self._maybe_purge()
+
+    def exists(self, sid: str) -> bool:
+        with self._lock:
+            return sid in self._data
+
+    def purge_expired(self, ttl_s: int = SESSION_TTL_S) -> int:
+        cutoff = time.time() - ttl_s
+        with self._lock:
+            old = [sid for sid, (_, _, updated) in self._data.items() if updated < cutoff]
+            for sid in old:
+                del self._data[sid]
+        self._purged(old)
+        return len(old)
+
+
+class SQLiteSessionStore(_SessionStore):
+    """One row per session (compact msgpack/JSON blob); WAL lets other workers read during writes."""
+
+    def __init__(self, path: str = SESSION_DB_PATH):
+        super().__init__()
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                       "sid TEXT PRIMARY KEY, state BLOB NOT NULL, version INTEGER NOT NULL, updated REAL NOT NULL)")
+            db.execute("CREATE TABLE IF NOT EXISTS leases (sid TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def lease(self, sid: str, wait_s: float = SESSION_LEASE_WAIT_S) -> Iterator[None]:
+        """The in-process lock, then the session's `leases` row (taken over once expired), renewed
+        in the background until released."""
+        deadline = time.monotonic() + max(0.0, wait_s)
+        with super().lease(sid, wait_s):
+            owner, delay = uuid.uuid4().hex, 0.02
+            while not self._take_lease(sid, owner):
+                if time.monotonic() + delay > deadline:
+                    raise SessionBusy(sid)
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+            released = threading.Event()
+            renew = threading.Thread(target=self._renew_lease, args=(sid, owner, released),
+                                     name="session-lease", daemon=True)
+            renew.start()
+            try:
+                yield
+            finally:
+                released.set()
+                renew.join()
+                self._conn().execute("DELETE FROM leases WHERE sid = ? AND owner = ?", (sid, owner))
+
+    def _take_lease(self, sid: str, owner: str) -> bool:
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO leases (sid, owner, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(sid) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+            "WHERE leases.expires < ?", (sid, owner, now + SESSION_LEASE_S, now))
+        return cur.rowcount == 1
+
+    def _renew_lease(self, sid: str, owner: str, released: threading.Event) -> None:
+        while not released.wait(SESSION_LEASE_S / 3):
+            self._conn().execute("UPDATE leases SET expires = ? WHERE sid = ? AND owner = ?",
+                                 (time.time() + SESSION_LEASE_S, sid, owner))
+
+    def load_versioned(self, sid: str) -> Tuple[TState, int]:
+        row = self._conn().execute("SELECT state, version FROM sessions WHERE sid = ?", (sid,)).fetchone()
+        if not row:
+            return new_state(), 0
+        if isinstance(row[0], str):  # rows written before the compact format
+            return intern_roles(json.loads(row[0])), row[1]
+        return loads_state(row[0]), row[1]
+
+    def save(self, sid: str, state: TState, version: Optional[int] = None) -> None:
+        """Store `state`; with `version`, only if the session is still at that version (0 = new)."""
+        payload, now, db = dumps_state(state), time.time(), self._conn()
+        if version is None:
+            db.execute(
+                "INSERT INTO sessions (sid, state, version, updated) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT(sid) DO UPDATE SET state = excluded.state, version = version + 1, updated = excluded.updated",
+                (sid, payload, now),
+            )
+        else:
+            if version == 0:
+                cur = db.execute("INSERT INTO sessions (sid, state, version, updated) VALUES (?, ?, 1, ?) "
+                                 "ON CONFLICT(sid) DO NOTHING", (sid, payload, now))
+            else:
+                cur = db.execute("UPDATE sessions SET state = ?, version = version + 1, updated = ? "
+                                 "WHERE sid = ? AND version = ?", (payload, now, sid, version))
+            if cur.rowcount != 1:
+                raise SessionConflict(sid)
+        self._maybe_purge()
+
+    def exists(self, sid: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM sessions WHERE sid = ?", (sid,)).fetchone() is not None
+
+    def purge_expired(self, ttl_s: int = SESSION_TTL_S) -> int:
+        db, now = self._conn(), time.time()
+        sids = [r[0] for r in db.execute("DELETE FROM sessions WHERE updated < ? RETURNING sid", (now - ttl_s,)).fetchall()]
+        db.execute("DELETE FROM leases WHERE expires < ?", (now,))
+        self._purged(sids)
+        return len(sids)
+
+
+_STORE = None
+
+def get_session_store():
+    global _STORE
+    if _STORE is None:
+        _STORE = SQLiteSessionStore() if SESSION_STORE == "sqlite" else MemorySessionStore()
+    return _STORE
+
+def _base_checkpointer():
+    from langgraph.checkpoint.memory import MemorySaver
+    if SESSION_STORE != "sqlite":
+        return MemorySaver(serde=CompactSerializer())
+    try:
+        from langgraph.checkpoint.sqlite import SqliteSaver  # pip install langgraph-checkpoint-sqlite
+    except ImportError:
+        print("[session_store] langgraph-checkpoint-sqlite not installed; checkpoints stay per-worker", flush=True)
+        return MemorySaver(serde=CompactSerializer())
+    os.makedirs(os.path.dirname(CHECKPOINT_DB_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(CHECKPOINT_DB_PATH, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return SqliteSaver(conn, serde=CompactSerializer())
+
+def make_checkpointer():
+    """
+    LangGraph checkpointer matching SESSION_STORE (falls back to in-process MemorySaver),
+    storing append-only channels as per-step deltas.
+    """
+    from ttb_ride.checkpoint import DeltaCheckpointSaver
+    return DeltaCheckpointSaver(_base_checkpointer())
+
@@ -1,9 +1,37 @@
-from typing_extensions import TypedDict, NotRequired
+from typing_extensions import TypedDict, NotRequired, Annotated
 from typing import Dict, Any, List
 
+DEBUG_LOG_CAP = 400
+
+
+class AppendDelta(list):
+    """Items to append to an append-only channel (a plain list replaces the channel value)."""
+
+def append_only(left: list, right: list) -> list:
+    # nodes send AppendDelta; graph input (the app's full session state) is a plain list
+    if isinstance(right, AppendDelta):
+        return (left or []) + list(right)
+    return right
+
+class LogRing(list):
+    """
+    The last DEBUG_LOG_CAP debug lines. `offset` counts lines dropped from the front so far, so
+    the checkpointer can still store a capped step as a delta (drop + new lines).
+    """
+    offset = 0
+
+def append_debug_logs(left: list, right: list) -> list:
+    merged = append_only(left, right)
+    drop = max(0, len(merged) - DEBUG_LOG_CAP)
+    ring = LogRing(merged[drop:] if drop else merged)
+    # appended: continue the left value's count; replaced (graph input): keep the input's
+    ring.offset = getattr(left if isinstance(right, AppendDelta) else right, "offset", 0) + drop
+    return ring
+
 class DocSlot(TypedDict, total=False):
     path: NotRequired[str]
     ok: bool
+    fingerprint: NotRequired[Dict[str, str]]   # pHash/dHash/sha256 (see ttb_ride.dedupe)
     # Bike
     is_motorcycle: NotRequired[bool]
     vlm_check_conf: NotRequired[float]
@@ -11,7 +39,7 @@ class DocSlot(TypedDict, total=False):
     appraisal_conf: NotRequired[float]
     appraisal_notes: NotRequired[str]
     # Income
-    raw: NotRequired[Dict[str, Any]]
+    raw: NotRequired[str]                    # OCR model output text
     parsed: NotRequired[Dict[str, Any]]
     normalized: NotRequired[Dict[str, Any]]
     monthly_income_thb: NotRequired[int]
@@ -30,22 +58,50 @@ class Decision(TypedDict, total=False):
     name_match_score: float
     approved_amount_thb: int
     reason: str
+    duplicate_docs: List[Dict[str, Any]]
 
 class IntentState(TypedDict, total=False):
     motorcycle_loan_intent: bool
     confidence: float
     rationale: str
 
+class Event(TypedDict, total=False):
+    type: str                    # "user_message" | "upload" | "feedback"
+    kinds: NotRequired[List[str]]  # upload: slots uploaded together ("bike" | "income" | "id")
+    kind: NotRequired[str]       # feedback: "happy" | "unhappy"
+
 class TState(TypedDict, total=False):
-    messages: list
+    event: Event                 # what triggered this graph run (selects the entry node)
+    messages: Annotated[list, append_only]
     ui: UIFlags
     docs: Dict[str, DocSlot]
     decision: Decision
     intent: IntentState
     flags: Dict[str, bool]
-    debug_logs: List[str]
+    debug_logs: Annotated[List[str], append_debug_logs]
     cursors: Dict[str, int]
 
+APPEND_CHANNELS = ("messages", "debug_logs")
+
+def delta_node(fn):
+    """
+    Wrap a node written against the full state so it returns only what changed:
+    new messages/debug lines as AppendDelta, other keys as before.
+    """
+    def run(state: TState) -> dict:
+        base_len = len(state.get("messages") or [])
+        work = dict(state)
+        work["messages"] = list(state.get("messages") or [])
+        work["debug_logs"] = []
+        out = fn(work)
+        update = {k: v for k, v in out.items() if k not in APPEND_CHANNELS}
+        update["messages"] = AppendDelta(out.get("messages", [])[base_len:])
+        update["debug_logs"] = AppendDelta(out.get("debug_logs", []))
+        return update
+    run.__name__ = getattr(fn, "__name__", "node")
+    run.__doc__ = fn.__doc__
+    return run
+
 def new_state() -> TState:
     return {
         "messages": [],
@@ -0,0 +1,130 @@
+"""
+Upload downscaling, in the browser first and on the server as a fallback.
+
+Phone photos arrive at 5-12 MB, while the pipeline never looks at more than ~2.5k px on the long
+side (OCR pixel budgets, VLM image profiles). client_resize_head() is injected into the page
+<head>: it intercepts file picks and drops on the three upload boxes and re-encodes each image
+on a canvas (EXIF-upright JPEG) at that document's target before Gradio uploads it. ID cards and
+payslips get larger targets and higher quality than the bike photo, so text stays legible.
+
+shrink_upload() applies the same targets to whatever still arrives oversized (old browsers, API
+clients) and deletes the original. UPLOAD_KEEP_ORIGINAL=1 turns both off: the browser sends the
+original and the server keeps it.
+
+Env per kind (bike / income / id): UPLOAD_MAX_SIDE_<KIND>, UPLOAD_QUALITY_<KIND> (0-100);
+UPLOAD_REENCODE_BYTES: files at or under the target size are still re-encoded above this size.
+"""
+import json, os
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps
+
+UPLOAD_KEEP_ORIGINAL = os.getenv("UPLOAD_KEEP_ORIGINAL", "0") == "1"
+UPLOAD_REENCODE_BYTES = int(os.getenv("UPLOAD_REENCODE_BYTES", str(3 << 19)))  # 1.5 MB
+
+
+def _target(kind: str, max_side: int, quality: int) -> Dict[str, int]:
+    k = kind.upper()
+    return {"max_side": int(os.getenv(f"UPLOAD_MAX_SIDE_{k}", str(max_side))),
+            "quality": int(os.getenv(f"UPLOAD_QUALITY_{k}", str(quality)))}
+
+# bike: VLM sees at most 1536 px (appraise_high); id/income: headroom over the OCR pixel
+# budgets for the autocrop of a card or page that fills only part of the frame
+UPLOAD_TARGETS = {
+    "bike":   _target("bike", 1536, 82),
+    "income": _target("income", 2400, 90),
+    "id":     _target("id", 2000, 90),
+}
+
+ELEM_IDS = {"bike": "up-bike", "income": "up-income", "id": "up-id"}
+
+_SCRIPT = """
+<script>
+(() => {
+  const TARGETS = %s, MIN_BYTES = %d;
+  const handed = new WeakSet();
+  const targetOf = (el) => {
+    for (const [id, t] of Object.entries(TARGETS)) {
+      const box = document.getElementById(id);
+      if (box && box.contains(el)) return [box, t];
+    }
+    return [null, null];
+  };
+  async function shrink(file, t) {
+    if (!file.type.startsWith("image/") || file.type === "image/gif") return file;
+    let bmp;
+    try { bmp = await createImageBitmap(file, {imageOrientation: "from-image"}); } catch (e) { return file; }
+    const scale = Math.min(1, t.max_side / Math.max(bmp.width, bmp.height));
+    if (scale === 1 && file.size <= MIN_BYTES) { bmp.close(); return file; }
+    const canvas = document.createElement("canvas");
+    canvas.width = Math.max(1, Math.round(bmp.width * scale));
+    canvas.height = Math.max(1, Math.round(bmp.height * scale));
+    const ctx = canvas.getContext("2d");
+    ctx.imageSmoothingQuality = "high";
+    ctx.drawImage(bmp, 0, 0, canvas.width, canvas.height);
+    bmp.close();
+    const blob = await new Promise((done) => canvas.toBlob(done, "image/jpeg", t.quality / 100));
+    if (!blob || blob.size >= file.size) return file;
+    const name = file.name.replace(/\\.[^.]*$/, "") + ".jpg";
+    return new File([blob], name, {type: "image/jpeg", lastModified: file.lastModified});
+  }
+  async function handOver(input, files, t) {
+    const out = await Promise.all(Array.from(files, (f) => shrink(f, t).catch(() => f)));
+    const dt = new DataTransfer();
+    out.forEach((f) => dt.items.add(f));
+    input.files = dt.files;
+    handed.add(input);
+    input.dispatchEvent(new Event("change", {bubbles: true}));
+  }
+  document.addEventListener("change", (e) => {
+    const input = e.target;
+    if (!(input instanceof HTMLInputElement) || input.type !== "file") return;
+    if (handed.delete(input)) return;  // our re-dispatch: let Gradio upload it
+    const [, t] = targetOf(input);
+    if (!t || !input.files || !input.files.length) return;
+    e.stopImmediatePropagation();
+    handOver(input, input.files, t);
+  }, true);
+  document.addEventListener("drop", (e) => {
+    const [box, t] = targetOf(e.target);
+    const files = e.dataTransfer && e.dataTransfer.files;
+    const input = box && box.querySelector('input[type="file"]');
+    if (!t || !input || !files || !files.length) return;
+    e.preventDefault();
+    e.stopImmediatePropagation();
+    handOver(input, files, t);
+  }, true);
+})();
+</script>
+"""
+
+
+def client_resize_head() -> str:
+    """<script> for gr.Blocks(head=...); "" when originals are kept."""
+    if UPLOAD_KEEP_ORIGINAL:
+        return ""
+    targets = {ELEM_IDS[k]: t for k, t in UPLOAD_TARGETS.items()}
+    return _SCRIPT % (json.dumps(targets), UPLOAD_REENCODE_BYTES)
+
+
+def shrink_upload(path: Optional[str], kind: str) -> Optional[str]:
+    """Downscale an oversized upload to its kind's target (JPEG next to it, original deleted)."""
+    t = UPLOAD_TARGETS.get(kind)
+    if UPLOAD_KEEP_ORIGINAL or not path or t is None:
+        return path
+    try:
+        size = os.path.getsize(path)
+        with Image.open(path) as img:  # header only until load
+            if max(img.size) <= t["max_side"] and size <= UPLOAD_REENCODE_BYTES:
+                return path
+            img = ImageOps.exif_transpose(img).convert("RGB")
+            img.thumbnail((t["max_side"], t["max_side"]), Image.LANCZOS)
+            out = os.path.splitext(path)[0] + ".small.jpg"
+            img.save(out, format="JPEG", quality=t["quality"], optimize=True)
+    except (OSError, ValueError):
+        return path  # not an image PIL can read: leave it to the checks
+    if os.path.getsize(out) >= size:
+        os.remove(out)
+        return path
+    os.remove(path)
+    return out
@@ -0,0 +1,148 @@
+"""
+Batch versions of the utils.text validators for nightly dedupe/fraud sweeps.
+Results match the scalar functions element-for-element (name matching: unless
+indel_ratio=True is asked for).
+"""
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, Sequence, Tuple
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from ttb_ride.utils.text import name_variants
+
+_NON_DIGIT_RE = re.compile(r"\D")
+_ID_WEIGHTS = np.arange(13, 1, -1, dtype=np.int64)          # 13..2
+_POW10 = 10 ** np.arange(12, -1, -1, dtype=np.int64)        # digit extraction for int IDs
+
+
+def _ascii_digits(s: str) -> str:
+    # \D keeps every Unicode decimal (e.g. Thai ๐-๙), exactly like thai_id_checksum_ok
+    d = _NON_DIGIT_RE.sub("", s or "")
+    if not d.isascii():
+        d = "".join(str(unicodedata.decimal(c)) for c in d)
+    return d
+
+def _checksum_rows(digits: np.ndarray) -> np.ndarray:
+    """digits: (n, 13) int matrix -> bool validity per row."""
+    s = digits[:, :12] @ _ID_WEIGHTS
+    check = (11 - (s % 11)) % 10
+    return check == digits[:, 12]
+
+def thai_id_checksum_ok_many(nids: Iterable) -> np.ndarray:
+    """
+    Vectorized thai_id_checksum_ok. Accepts strings (any formatting) or an integer array
+    of 13-digit IDs. Returns a bool array of the same length.
+    """
+    arr = np.asarray(nids if isinstance(nids, np.ndarray) else list(nids))
+    if arr.dtype.kind in "iu":
+        vals = arr.astype(np.int64)
+        in_range = (vals >= 10 ** 12) & (vals < 10 ** 13)
+        digits = (vals[:, None] // _POW10) % 10
+        return in_range & _checksum_rows(digits)
+
+    cleaned = [_ascii_digits(x) if isinstance(x, str) else "" for x in arr.tolist()]
+    ok = np.zeros(len(cleaned), dtype=bool)
+    idx = np.fromiter((i for i, d in enumerate(cleaned) if len(d) == 13), dtype=np.int64)
+    if idx.size:
+        buf = "".join(cleaned[i] for i in idx).encode("ascii")
+        digits = (np.frombuffer(buf, dtype=np.uint8).reshape(-1, 13) - 48).astype(np.int64)
+        ok[idx] = _checksum_rows(digits)
+    return ok
+
+def _round3(a: np.ndarray) -> np.ndarray:
+    # Python round() semantics (np.round can differ on ties), so breakdowns match the scalar path
+    return np.fromiter((round(x, 3) for x in a.tolist()), dtype=np.float64, count=a.size)
+
+def _variants_unique(names: Sequence[str]) -> Tuple[list, np.ndarray]:
+    """Tokenize each distinct name once; return (name_variants of uniques, inverse index)."""
+    uniq, inverse = np.unique(np.asarray([n or "" for n in names], dtype=object), return_inverse=True)
+    return [name_variants(u) for u in uniq.tolist()], inverse
+
+def relaxed_name_match_many(
+    names_a: Sequence[str],
+    names_b: Sequence[str],
+    threshold: float = 0.50,
+    workers: int = -1,
+    indel_ratio: bool = False,
+) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Pairwise relaxed_name_match over (names_a[i], names_b[i]).
+    Returns (same, score, {"ratio", "token_overlap", "last_same"}) as arrays; values are
+    rounded like the scalar breakdown. Each distinct name is tokenized once and each distinct
+    pair scored once (every name_variants combination, keeping the best like the scalar path),
+    with difflib's ratio.
+
+    indel_ratio=True scores ratio with rapidfuzz fuzz.ratio on `workers` cores instead: much
+    faster, but it is an LCS similarity and scores some pairs higher than difflib's block
+    matching, so a few verdicts near `threshold` differ from relaxed_name_match.
+    """
+    if len(names_a) != len(names_b):
+        raise ValueError("names_a and names_b must have the same length")
+    n = len(names_a)
+    if n == 0:
+        z = np.zeros(0)
+        return z.astype(bool), z, {"ratio": z, "token_overlap": z, "last_same": z}
+
+    ua, ia = _variants_unique(names_a)
+    ub, ib = _variants_unique(names_b)
+    pair_keys = ia.astype(np.int64) * len(ub) + ib
+    upairs, pinv = np.unique(pair_keys, return_inverse=True)
+    pa, pb = (upairs // len(ub)).tolist(), (upairs % len(ub)).tolist()
+    m = len(upairs)
+
+    # one row per variant combination of each distinct pair, in the scalar path's order
+    own, ca, cb = [], [], []  # owning pair, (unique a, variant), (unique b, variant)
+    for k, (i, j) in enumerate(zip(pa, pb)):
+        for x in range(len(ua[i])):
+            for y in range(len(ub[j])):
+                own.append(k)
+                ca.append((i, x))
+                cb.append((j, y))
+    c = len(own)
+    ja = {key: " ".join(ua[key[0]][key[1]]) for key in set(ca)}
+    jb = {key: " ".join(ub[key[0]][key[1]]) for key in set(cb)}
+    sets_a = {key: set(ua[key[0]][key[1]]) for key in ja}
+    sets_b = {key: set(ub[key[0]][key[1]]) for key in jb}
+    if indel_ratio:
+        ratio = process.cpdist([ja[key] for key in ca], [jb[key] for key in cb],
+                               scorer=fuzz.ratio, workers=workers, dtype=np.float64) / 100.0
+    else:
+        ratio = np.zeros(c)
+        sm, cur = SequenceMatcher(None), None
+        for r in sorted(range(c), key=cb.__getitem__):  # grouped by b: set_seq2 indexes it once
+            if cb[r] != cur:
+                cur = cb[r]
+                sm.set_seq2(jb[cur])
+            sm.set_seq1(ja[ca[r]])
+            ratio[r] = sm.ratio()
+
+    overlap = np.zeros(c)
+    last_same = np.zeros(c)
+    empty = np.zeros(c, dtype=bool)
+    for r, (ka, kb) in enumerate(zip(ca, cb)):
+        ta, tb = ua[ka[0]][ka[1]], ub[kb[0]][kb[1]]
+        if not ta or not tb:
+            empty[r] = True
+            continue
+        sa, sb = sets_a[ka], sets_b[kb]
+        overlap[r] = len(sa & sb) / max(1, len(sa | sb))
+        last_same[r] = 1.0 if ta[-1] == tb[-1] else 0.0
+    ratio[empty] = 0.0
+
+    raw_score = np.maximum(np.maximum(ratio, overlap), last_same)
+    if c > m:  # some names have a glued-title variant: keep each pair's best row like the scalar path
+        best = np.full(m, -1, dtype=np.int64)
+        keys = list(zip(raw_score.tolist(), ratio.tolist(), overlap.tolist()))
+        for r, k in enumerate(own):
+            if best[k] < 0 or keys[r] > keys[best[k]]:
+                best[k] = r
+        ratio, overlap, last_same, empty, raw_score = (v[best] for v in (ratio, overlap, last_same, empty, raw_score))
+    same = (raw_score >= threshold) & ~empty
+    return same[pinv], _round3(raw_score)[pinv], {
+        "ratio": _round3(ratio)[pinv],
+        "token_overlap": _round3(overlap)[pinv],
+        "last_same": last_same[pinv],
+    }
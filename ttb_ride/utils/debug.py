@@ -9,8 +9,9 @@ def dbg(state: dict, tag: str, **fields):
         logs[:] = logs[-400:]
     state["debug_logs"] = logs
 
-def get_debug_text(state: dict) -> str:
-    logs: List[str] = state.get("debug_logs", [])
+def get_debug_text(state: dict, footer: str = "") -> str:
+    # footer: process-wide status lines (e.g. HTTP pool stats), not stored in the session
+    logs: List[str] = state.get("debug_logs", [])[-120:] + ([footer] if footer else [])
     if not logs:
         return "_(no debug logs yet)_"
-    return "```\n" + "\n".join(logs[-120:]) + "\n```"
+    return "```\n" + "\n".join(logs) + "\n```"
@@ -1,6 +1,7 @@
-import io, base64, mimetypes
-from typing import Optional, Union
-from PIL import Image
+import io, base64, math, mimetypes
+from typing import Any, Dict, Optional, Tuple, Union
+from PIL import Image, ImageOps
+from ttb_ride.utils.pdf import is_pdf, first_page
 
 def _resize_max(img: Image.Image, max_side: int = 1024) -> Image.Image:
     w, h = img.size
@@ -20,6 +21,25 @@ def pil_to_jpeg_data_url(img: Image.Image, quality: int = 80, max_side: int = 10
     b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
     return f"data:image/jpeg;base64,{b64}"
 
+def openai_image_tokens(width: int, height: int, detail: str = "high") -> int:
+    """Image input tokens per OpenAI's tiling rule (low: flat 85; high/auto: 85 + 170 per 512px tile)."""
+    if detail == "low":
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    w, h = width * scale, height * scale
+    scale = min(1.0, 768 / min(w, h))
+    w, h = w * scale, h * scale
+    return 85 + 170 * math.ceil(w / 512) * math.ceil(h / 512)
+
+def vlm_image_part(img: Image.Image, max_side: int, detail: str, quality: int = 80) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """(image_url content part with a detail hint, {"size", "detail", "image_tokens"}) for one VLM call."""
+    img = _resize_max(img.convert("RGB"), max_side=max_side)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality, optimize=True)
+    url = "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode("utf-8")
+    meta = {"size": f"{img.width}x{img.height}", "detail": detail, "image_tokens": openai_image_tokens(img.width, img.height, detail)}
+    return {"type": "image_url", "image_url": {"url": url, "detail": detail}}, meta
+
 def image_path_to_data_url(path: str) -> str:
     mime = mimetypes.guess_type(path)[0] or "image/png"
     with open(path, "rb") as f:
@@ -34,3 +54,10 @@ def path_from_gradio_file(f: Union[str, dict, None]) -> Optional[str]:
     if isinstance(f, dict):
         return f.get("name") or f.get("path")
     return getattr(f, "name", None)
+
+def load_prepared(path: str, max_side: int = 1024) -> Image.Image:
+    """Open an upload the way the VLM path sees it: EXIF-upright RGB, longest side ≤ max_side (PDF: first page)."""
+    if is_pdf(path):
+        return _resize_max(first_page(path), max_side=max_side)
+    img = ImageOps.exif_transpose(Image.open(path))
+    return _resize_max(img.convert("RGB"), max_side=max_side)
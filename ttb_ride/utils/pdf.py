@@ -0,0 +1,79 @@
+"""
+PDF pages as images, one page at a time (pypdfium2).
+
+Pages are rendered on demand at a per-page DPI budget: at most PDF_MAX_DPI, lowered so a page stays
+under PDF_PAGE_MAX_PIXELS (an A4 page lands around 160 dpi, enough for payslip text). pdfium must
+not be entered from two threads at once, even for different documents, so every call runs under
+one process-wide lock that opens the document, does one thing (page count, a text layer, a render
+to PIL) and closes it again; no pdfium object outlives the lock.
+"""
+import os, threading
+from typing import Any, Callable, Iterator, Optional, Tuple
+
+from PIL import Image
+
+PDF_MAX_DPI = float(os.getenv("PDF_MAX_DPI", "200"))
+PDF_PAGE_MAX_PIXELS = int(os.getenv("PDF_PAGE_MAX_PIXELS", "2500000"))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "8"))
+
+
+def is_pdf(path: Optional[str]) -> bool:
+    if not path:
+        return False
+    try:
+        with open(path, "rb") as f:
+            return f.read(5) == b"%PDF-"
+    except OSError:
+        return False
+
+def page_scale(width_pt: float, height_pt: float, max_pixels: int = PDF_PAGE_MAX_PIXELS,
+               max_dpi: float = PDF_MAX_DPI) -> float:
+    """Render scale (pixels per point) within both the DPI cap and the pixel budget."""
+    scale = max_dpi / 72.0
+    area = width_pt * height_pt * scale * scale
+    if area > max_pixels > 0:
+        scale *= (max_pixels / area) ** 0.5
+    return scale
+
+_PDFIUM_LOCK = threading.Lock()
+
+def _with_pdfium(path: str, page_index: Optional[int], fn: Callable[[Any], Any]) -> Any:
+    """fn(document) or fn(page) with the document open only for the call, under _PDFIUM_LOCK."""
+    import pypdfium2 as pdfium  # deferred: only PDF uploads need it
+
+    with _PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(path)
+        try:
+            if page_index is None:
+                return fn(pdf)
+            page = pdf[page_index]
+            try:
+                return fn(page)
+            finally:
+                page.close()
+        finally:
+            pdf.close()
+
+def _text_layer(page) -> str:
+    tp = page.get_textpage()
+    try:
+        return tp.get_text_range()
+    finally:
+        tp.close()
+
+def _render(page, max_pixels: int) -> Image.Image:
+    w, h = page.get_size()
+    return page.render(scale=page_scale(w, h, max_pixels)).to_pil().convert("RGB")  # a copy, owned by PIL
+
+def iter_pages(path: str, max_pages: int = PDF_MAX_PAGES, max_pixels: int = PDF_PAGE_MAX_PIXELS,
+               text: bool = False) -> Iterator[Tuple[int, Callable[[], Image.Image], str]]:
+    """(page index, render(), text layer or "") per page. The text layer is read first, so callers
+    render only pages whose text is not enough."""
+    for i in range(min(_with_pdfium(path, None, len), max(1, max_pages))):
+        layer = _with_pdfium(path, i, _text_layer) if text else ""
+        yield i, lambda i=i: _with_pdfium(path, i, lambda page: _render(page, max_pixels)), layer
+
+def first_page(path: str, max_pixels: int = 1024 * 1024) -> Image.Image:
+    for _, render, _ in iter_pages(path, max_pages=1, max_pixels=max_pixels):
+        return render()
+    raise ValueError("PDF has no pages")
@@ -1,20 +1,45 @@
-import re
+import os, re
 from difflib import SequenceMatcher
+from functools import lru_cache
 from typing import Optional, Tuple, Dict
 
 # redact base64 and inline data URLs from LLM context
 DATA_URL_MD_RE = re.compile(r"!\[[^\]]*\]\(data:image\/[^;]+;base64,[^)]+\)")
 BASE64_LONG_RE = re.compile(r"[A-Za-z0-9\/+]{800,}={0,2}")
+# stored in messages instead of an inline data URL; app.main expands it at render time
+CONGRATS_MARKER = "![congrats](ttb-ride:congrats)"
 
 MAX_CONTEXT_MSGS = 12
 MAX_CONTEXT_CHARS = 12000
 
 TITLE_STOPWORDS_EN = {"mr","mr.","mrs","mrs.","ms","ms.","miss","miss.","mister"}
-TITLE_STOPWORDS_TH = {"นาย","นาง","น.ส.","นส.","คุณ","ด.ช.","ด.ญ.","เด็กชาย","เด็กหญิง","คุณนาย"}
+TITLE_STOPWORDS_TH = {"นาย","นาง","นางสาว","น.ส.","นส.","คุณ","ด.ช.","ด.ญ.","เด็กชาย","เด็กหญิง","คุณนาย"}
+
+# name tokenizer: one lower(), one prefix match, one findall; tokens are runs of [0-9a-zก-๙]
+NAME_TOKEN_RE = re.compile(r"[0-9a-zก-๙]+")
+# punctuation-free forms, as they appear after tokenizing
+TITLE_STOPWORDS = frozenset("".join(NAME_TOKEN_RE.findall(t)) for t in TITLE_STOPWORDS_EN | TITLE_STOPWORDS_TH)
+# leading title(s), stripped only when a space or period ends them: Thai is written without
+# spaces, so a glued prefix can be part of the name itself ("นางนวล" is a name, not นาง + นวล);
+# abbreviated titles end in their own period ("น.ส.สมหญิง"). Glued word titles ("นายสมชาย")
+# are left to name_variants() and the scoring.
+_TH_TITLES = sorted(TITLE_STOPWORDS_TH, key=len, reverse=True)
+_TH_DOTTED = [t for t in _TH_TITLES if t.endswith(".")]
+_TH_WORDS = [t for t in _TH_TITLES if not t.endswith(".")]
+_EN_TITLES = sorted({t.rstrip(".") for t in TITLE_STOPWORDS_EN}, key=len, reverse=True)
+TITLE_PREFIX_RE = re.compile(
+    r"^(?:[^0-9a-zก-๙]*(?:(?:" + "|".join(map(re.escape, _TH_DOTTED)) + r")"
+    r"|(?:" + "|".join(map(re.escape, _TH_WORDS)) + r")(?=[^0-9a-zก-๙]|$)"
+    r"|(?:" + "|".join(_EN_TITLES) + r")\b\.?))+"
+)
+# a word title glued to the first token, followed by the start of a syllable (consonant or leading vowel)
+GLUED_TITLE_RE = re.compile(r"^(?:" + "|".join(map(re.escape, _TH_WORDS)) + r")(?=[ก-ฮเแโใไ])")
+NAME_CACHE_SIZE = int(os.getenv("NAME_CACHE_SIZE", "65536"))
 
 def sanitize_for_llm(text: str) -> str:
     if not text: return ""
     text = DATA_URL_MD_RE.sub("[image omitted]", text)
+    text = text.replace(CONGRATS_MARKER, "[image omitted]")
     text = BASE64_LONG_RE.sub("[omitted]", text)
     if len(text) > 2000:
         text = text[:2000] + " …"
@@ -28,27 +53,50 @@ def thai_id_checksum_ok(nid: str) -> bool:
     check = (11 - (s % 11)) % 10
     return check == int(digits[-1])
 
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def name_tokens(s: Optional[str]) -> Tuple[str, ...]:
+    """Lowercased name tokens with titles/punctuation removed (memoized, bounded LRU)."""
+    if not s: return ()
+    s = TITLE_PREFIX_RE.sub(" ", s.lower(), count=1)
+    return tuple(t for t in NAME_TOKEN_RE.findall(s) if t not in TITLE_STOPWORDS)
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def name_variants(s: Optional[str]) -> Tuple[Tuple[str, ...], ...]:
+    """name_tokens(s), then, if a Thai title is glued to the first token, the tokens with it cut
+    off ("นายสมชาย" -> "สมชาย"; "นางนวล" -> "นวล" too, so matching keeps the better variant)."""
+    tokens = name_tokens(s)
+    m = GLUED_TITLE_RE.match(tokens[0]) if tokens else None
+    if m is None:
+        return (tokens,)
+    return tokens, (tokens[0][m.end():],) + tokens[1:]
+
 def strip_titles_and_punct(s: str) -> str:
-    if not s: return ""
-    s = s.lower()
-    s = re.sub(r"[^0-9a-zA-Zก-๙]+", " ", s)
-    tokens = [t for t in s.split() if t not in TITLE_STOPWORDS_EN and t not in TITLE_STOPWORDS_TH]
-    return " ".join(tokens)
+    return " ".join(name_tokens(s))
 
 def normalize_name(s: Optional[str]) -> str:
-    if not s: return ""
-    s = strip_titles_and_punct(s)
-    return re.sub(r"\s+", " ", s).strip()
+    return " ".join(name_tokens(s))
+
+def name_scores(ta: Tuple[str, ...], tb: Tuple[str, ...]) -> Tuple[float, float, float]:
+    """(ratio, token_overlap, last_same) for two token tuples from name_tokens()."""
+    ratio = SequenceMatcher(None, " ".join(ta), " ".join(tb)).ratio()
+    sa, sb = set(ta), set(tb)
+    token_overlap = len(sa & sb) / max(1, len(sa | sb))
+    last_same = 1.0 if ta[-1] == tb[-1] else 0.0
+    return ratio, token_overlap, last_same
 
 def relaxed_name_match(a: str, b: str, threshold: float = 0.50) -> Tuple[bool, float, Dict[str, float]]:
-    na, nb = normalize_name(a), normalize_name(b)
-    if not na or not nb:
+    """Best of the name_variants() pairs by (score, ratio, token_overlap); ties keep the earlier pair."""
+    va, vb = name_variants(a), name_variants(b)
+    if not va[0] or not vb[0]:
         return False, 0.0, {"ratio": 0.0, "token_overlap": 0.0, "last_same": 0.0}
-    ratio = SequenceMatcher(None, na, nb).ratio()
-    ta, tb = set(na.split()), set(nb.split())
-    token_overlap = len(ta & tb) / max(1, len(ta | tb))
-    last_same = 1.0 if (na.split()[-1] == nb.split()[-1]) else 0.0
-    score = max(ratio, token_overlap, last_same)
+    best = None
+    for ta in va:
+        for tb in vb:
+            ratio, token_overlap, last_same = name_scores(ta, tb)
+            key = (max(ratio, token_overlap, last_same), ratio, token_overlap)
+            if best is None or key > best[0]:
+                best = key, (ratio, token_overlap, last_same)
+    (score, _, _), (ratio, token_overlap, last_same) = best
     return (score >= threshold), round(score, 3), {
         "ratio": round(ratio, 3),
         "token_overlap": round(token_overlap, 3),
@@ -1,20 +1,200 @@
-import io
-from PIL import Image
+"""
+Orchestration graph image, rendered offline once per graph structure and cached on disk.
 
-def graph_png(compiled_app) -> Image.Image:
-    """
-    Return a PIL Image of the compiled LangGraph.
-    Tries Mermaid first, then Graphviz PNG.
-    """
+Renderers (first available wins): Graphviz `dot` binary, mermaid-cli `mmdc`, then a built-in
+layered drawing (PIL for PNG, plain SVG markup). Nothing is fetched over the network.
+Files live in CACHE_DIR/graph/<structure-hash>.<png|svg>; GRAPH_IMAGE_FORMAT=png|svg.
+"""
+import hashlib, io, json, os, shutil, subprocess, tempfile
+from typing import Dict, List, Optional, Tuple
+from html import escape
+
+from PIL import Image, ImageDraw, ImageFont
+
+from ttb_ride.config import CACHE_DIR
+
+GRAPH_IMAGE_FORMAT = os.getenv("GRAPH_IMAGE_FORMAT", "png").strip().lower()
+GRAPH_CACHE_DIR = CACHE_DIR / "graph"
+RENDER_TIMEOUT_S = 20
+
+Edge = Tuple[str, str, bool, str]  # source, target, conditional, label
+_PATHS: Dict[Tuple[int, str], str] = {}
+
+
+def graph_structure(compiled_app) -> Tuple[List[str], List[Edge]]:
     g = compiled_app.get_graph()
-    # Prefer Mermaid (usually works out-of-the-box)
-    try:
-        data = g.draw_mermaid_png()      # bytes
-        return Image.open(io.BytesIO(data)).convert("RGBA")
-    except Exception as e1:
-        # Fallback to Graphviz (requires graphviz installed)
+    nodes = list(g.nodes)
+    edges = [(e.source, e.target, bool(e.conditional), str(e.data or "")) for e in g.edges]
+    return nodes, edges
+
+def graph_key(nodes: List[str], edges: List[Edge]) -> str:
+    blob = json.dumps([sorted(nodes), sorted(edges)], ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+
+# ---- external offline renderers ----
+def _to_dot(nodes: List[str], edges: List[Edge]) -> str:
+    lines = ["digraph G {", '  rankdir=TB; node [shape=box, style="rounded,filled", fillcolor="#f2f0ff", fontname="Helvetica"];']
+    for n in nodes:
+        extra = ', shape=oval, fillcolor="#bfb6fc"' if n == "__end__" else (", shape=oval" if n == "__start__" else "")
+        lines.append(f'  "{n}" [label="{n}"{extra}];')
+    for s, t, cond, label in edges:
+        attrs = ["style=dashed"] if cond else []
+        if label:
+            attrs.append(f'label="{label}"')
+        lines.append(f'  "{s}" -> "{t}"' + (f" [{', '.join(attrs)}]" if attrs else "") + ";")
+    lines.append("}")
+    return "\n".join(lines)
+
+def _render_dot(nodes: List[str], edges: List[Edge], fmt: str) -> Optional[bytes]:
+    exe = shutil.which("dot")
+    if not exe:
+        return None
+    out = subprocess.run([exe, f"-T{fmt}"], input=_to_dot(nodes, edges).encode("utf-8"),
+                         capture_output=True, timeout=RENDER_TIMEOUT_S, check=True)
+    return out.stdout
+
+def _render_mmdc(mermaid: str, fmt: str) -> Optional[bytes]:
+    exe = shutil.which("mmdc")
+    if not exe:
+        return None
+    with tempfile.TemporaryDirectory() as d:
+        src, dst = os.path.join(d, "graph.mmd"), os.path.join(d, f"graph.{fmt}")
+        with open(src, "w", encoding="utf-8") as f:
+            f.write(mermaid)
+        subprocess.run([exe, "-i", src, "-o", dst], capture_output=True, timeout=RENDER_TIMEOUT_S, check=True)
+        with open(dst, "rb") as f:
+            return f.read()
+
+
+# ---- built-in renderer (always available) ----
+BOX_H, LAYER_GAP, COL_GAP, PAD, CHAR_W = 34, 84, 36, 28, 8
+
+def _layout(nodes: List[str], edges: List[Edge]) -> Dict[str, Tuple[int, int, int]]:
+    """node -> (x, y, width); layers by longest path from the entry, END pinned to the last layer."""
+    depth = {n: 0 for n in nodes}
+    for _ in range(len(nodes)):  # bounded relaxation (cycles just stop deepening)
+        changed = False
+        for s, t, _, _ in edges:
+            if t != "__end__" and depth[t] < depth[s] + 1 and depth[s] + 1 < len(nodes):
+                depth[t], changed = depth[s] + 1, True
+        if not changed:
+            break
+    if "__end__" in depth:
+        depth["__end__"] = max([d for n, d in depth.items() if n != "__end__"] or [0]) + 1
+    layers: Dict[int, List[str]] = {}
+    for n in nodes:
+        layers.setdefault(depth[n], []).append(n)
+    widths = {n: max(90, CHAR_W * len(n) + 24) for n in nodes}
+    parents: Dict[str, List[str]] = {}
+    for src, t, _, _ in edges:
+        if depth[src] < depth[t]:
+            parents.setdefault(t, []).append(src)
+    # each layer: nodes in parent-barycenter order, pushed right only as far as needed to not overlap
+    centers: Dict[str, float] = {}
+    for d in sorted(layers):
+        want = {n: (sum(centers[p] for p in parents[n]) / len(parents[n]) if parents.get(n) else 0.0)
+                for n in layers[d]}
+        if not any(parents.get(n) for n in layers[d]):
+            want = {n: i * (widths[n] + COL_GAP) for i, n in enumerate(layers[d])}
+        left = None
+        for n in sorted(layers[d], key=lambda n: want[n]):
+            c = want[n] if left is None else max(want[n], left + COL_GAP + widths[n] / 2)
+            centers[n], left = c, c + widths[n] / 2
+        # keep the layer centred on its parents' span
+        ns = layers[d]
+        shift = (sum(want.values()) - sum(centers[n] for n in ns)) / len(ns)
+        for n in ns:
+            centers[n] += shift
+    min_x = min(centers[n] - widths[n] / 2 for n in nodes)
+    return {n: (int(centers[n] - widths[n] / 2 - min_x + PAD), PAD + depth[n] * LAYER_GAP, widths[n]) for n in nodes}
+
+def _canvas(pos) -> Tuple[int, int]:
+    return (max(x + w for x, _, w in pos.values()) + PAD, max(y for _, y, _ in pos.values()) + BOX_H + PAD)
+
+def _anchors(pos, s: str, t: str) -> Tuple[float, float, float, float]:
+    (sx, sy, sw), (tx, ty, tw) = pos[s], pos[t]
+    if ty > sy:
+        return sx + sw / 2, sy + BOX_H, tx + tw / 2, ty
+    return sx + sw / 2, sy, tx + tw / 2, ty + BOX_H
+
+def _render_builtin_png(nodes: List[str], edges: List[Edge]) -> bytes:
+    pos = _layout(nodes, edges)
+    img = Image.new("RGB", _canvas(pos), (255, 255, 255))
+    d, font = ImageDraw.Draw(img), ImageFont.load_default()
+    for s, t, cond, label in edges:
+        x1, y1, x2, y2 = _anchors(pos, s, t)
+        steps = 16 if cond else 1
+        for i in range(0, steps, 2 if cond else 1):  # dashed = every other segment
+            a, b = i / steps, (i + 1) / steps
+            d.line([(x1 + (x2 - x1) * a, y1 + (y2 - y1) * a), (x1 + (x2 - x1) * b, y1 + (y2 - y1) * b)], fill=(90, 90, 90), width=2)
+        up = 1 if y2 > y1 else -1
+        d.polygon([(x2, y2), (x2 - 5, y2 - 9 * up), (x2 + 5, y2 - 9 * up)], fill=(90, 90, 90))
+        if label:
+            d.text(((x1 + x2) / 2 + 4, (y1 + y2) / 2 - 6), label, fill=(60, 60, 60), font=font)
+    for n, (x, y, w) in pos.items():
+        fill = (191, 182, 252) if n == "__end__" else ((255, 255, 255) if n == "__start__" else (242, 240, 255))
+        d.rounded_rectangle([x, y, x + w, y + BOX_H], radius=BOX_H // 2 if n.startswith("__") else 8,
+                            fill=fill, outline=(80, 70, 160), width=2)
+        d.text((x + w / 2, y + BOX_H / 2), n, fill=(0, 0, 0), font=font, anchor="mm")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+def _render_builtin_svg(nodes: List[str], edges: List[Edge]) -> bytes:
+    pos = _layout(nodes, edges)
+    W, H = _canvas(pos)
+    out = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{W}" height="{H}" viewBox="0 0 {W} {H}" font-family="Helvetica,Arial,sans-serif" font-size="13">',
+           '<defs><marker id="arrow" viewBox="0 0 10 10" refX="10" refY="5" markerWidth="7" markerHeight="7" orient="auto">'
+           '<path d="M0,0 L10,5 L0,10 z" fill="#5a5a5a"/></marker></defs>',
+           f'<rect width="{W}" height="{H}" fill="#ffffff"/>']
+    for s, t, cond, label in edges:
+        x1, y1, x2, y2 = _anchors(pos, s, t)
+        dash = ' stroke-dasharray="6,5"' if cond else ""
+        out.append(f'<line x1="{x1:.0f}" y1="{y1:.0f}" x2="{x2:.0f}" y2="{y2:.0f}" stroke="#5a5a5a" stroke-width="1.6"{dash} marker-end="url(#arrow)"/>')
+        if label:
+            out.append(f'<text x="{(x1 + x2) / 2 + 4:.0f}" y="{(y1 + y2) / 2:.0f}" fill="#3c3c3c">{escape(label)}</text>')
+    for n, (x, y, w) in pos.items():
+        fill = "#bfb6fc" if n == "__end__" else ("#ffffff" if n == "__start__" else "#f2f0ff")
+        r = BOX_H // 2 if n.startswith("__") else 8
+        out.append(f'<rect x="{x}" y="{y}" width="{w}" height="{BOX_H}" rx="{r}" fill="{fill}" stroke="#5046a0" stroke-width="1.6"/>')
+        out.append(f'<text x="{x + w / 2:.0f}" y="{y + BOX_H / 2 + 4:.0f}" text-anchor="middle">{escape(n)}</text>')
+    out.append("</svg>")
+    return "\n".join(out).encode("utf-8")
+
+
+def render_graph(compiled_app, fmt: str = GRAPH_IMAGE_FORMAT) -> bytes:
+    """Render offline: dot -> mmdc -> built-in."""
+    nodes, edges = graph_structure(compiled_app)
+    for render in (lambda: _render_dot(nodes, edges, fmt),
+                   lambda: _render_mmdc(compiled_app.get_graph().draw_mermaid(), fmt)):
         try:
-            data = g.draw_png()          # bytes
-            return Image.open(io.BytesIO(data)).convert("RGBA")
-        except Exception as e2:
-            raise RuntimeError(f"Graph rendering not available. Mermaid error: {e1}; Graphviz error: {e2}")
+            data = render()
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"[visualize] renderer failed, trying next: {e}", flush=True)
+            continue
+        if data:
+            return data
+    return _render_builtin_svg(nodes, edges) if fmt == "svg" else _render_builtin_png(nodes, edges)
+
+def graph_image_path(compiled_app, fmt: str = GRAPH_IMAGE_FORMAT) -> str:
+    """Path of the cached PNG/SVG for this graph's structure, rendering it on first use."""
+    fmt = "svg" if fmt == "svg" else "png"
+    memo = _PATHS.get((id(compiled_app), fmt))
+    if memo and os.path.exists(memo):
+        return memo
+    key = graph_key(*graph_structure(compiled_app))
+    path = str(GRAPH_CACHE_DIR / f"{key}.{fmt}")
+    if not os.path.exists(path):
+        data = render_graph(compiled_app, fmt)
+        os.makedirs(GRAPH_CACHE_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)  # atomic: concurrent workers never see a partial file
+    _PATHS[(id(compiled_app), fmt)] = path
+    return path
+
+def graph_png(compiled_app) -> Image.Image:
+    """PIL Image of the compiled LangGraph (from the on-disk cache)."""
+    return Image.open(graph_image_path(compiled_app, "png")).convert("RGBA")